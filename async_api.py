@@ -0,0 +1,182 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+
+
+class _AsyncStore:
+    """
+    runs every call of a wrapped HabitTracker or HabitAnalyser on one dedicated thread
+    """
+    store_class = None
+
+    def __init__(self, name='main.db', manager=None):
+        """
+        :param name: name of the database file
+        :param manager: ConnectionManager to share, instead of a private connection owned by the worker thread
+        : the wrapped object is created lazily on the worker thread, so its connection never crosses threads
+        """
+        self.name = name
+        self.manager = manager
+        self._store = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.store_class.__name__)
+
+    def _invoke(self, method, args, kwargs):
+        if self._store is None:
+            self._store = self.store_class(self.name, manager=self.manager)
+        return getattr(self._store, method)(*args, **kwargs)
+
+    async def _call(self, method, *args, **kwargs):
+        """
+        await a method of the wrapped object
+        :param method: name of the method
+        :return: whatever the method returns
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._invoke, method, args, kwargs)
+
+    async def close(self):
+        """
+        close the wrapped object and stop the worker thread
+        """
+        if self._store is not None:
+            await self._call('close')
+        self._executor.shutdown(wait=False)
+
+
+class AsyncHabitTracker(_AsyncStore):
+    store_class = HabitTracker
+
+    def __init__(self, name='main.db', manager=None, commit_window=0.005, max_batch=1000):
+        """
+        initialize an asyncio front-end for a habit tracker
+        :param name: name of the database file
+        :param manager: ConnectionManager to share, instead of a private connection
+        :param commit_window: seconds concurrent check-ins are collected for before they are committed together
+        :param max_batch: number of collected check-ins that triggers a commit before the window ends
+        """
+        super().__init__(name, manager)
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self._pending = []
+        self._flush_handle = None
+        # task of the last write or commit handed to the worker thread, every new one waits for it to finish
+        self._tail = None
+
+    async def create_habit(self, name, description, start_date, end_date, frequency):
+        await self._write('create_habit', name, description, start_date, end_date, frequency)
+
+    async def get_habit(self, habit_name):
+        return await self._call('get_habit', habit_name)
+
+    async def get_tracker(self, habit_name):
+        return await self._call('get_tracker', habit_name)
+
+    async def update_habit(self, name, description, start_date, end_date, frequency):
+        await self._write('update_habit', name, description, start_date, end_date, frequency)
+
+    async def delete_habit(self, name):
+        await self._write('delete_habit', name)
+
+    async def check_habits_bulk(self, events, chunk_size=1000):
+        return await self._write('check_habits_bulk', list(events), chunk_size=chunk_size)
+
+    async def check_habit(self, habit_name, event_date, completed):
+        """
+        check a habit, committed together with the other check-ins of the same window
+        :param habit_name: name of the habit
+        :param event_date: date of the event
+        :param completed: boolean value
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((habit_name, event_date, completed), future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.commit_window, self._flush)
+        await future
+
+    async def _write(self, method, *args, **kwargs):
+        # check-ins still waiting for their window go first, so writes reach the database in call order
+        self._flush()
+        return await self._enqueue(self._call(method, *args, **kwargs))
+
+    def _enqueue(self, coroutine):
+        """
+        run a write after the writes and commits enqueued before it
+        :param coroutine: coroutine making the write
+        :return: task running the coroutine, kept as the tail of the queue
+        """
+        previous = self._tail
+
+        async def after_previous():
+            if previous is not None:
+                await asyncio.wait([previous])
+            return await coroutine
+
+        self._tail = asyncio.ensure_future(after_previous())
+        return self._tail
+
+    def _flush(self):
+        """
+        hand the collected check-ins to the worker thread as one transaction
+        :return: task committing them, None if no check-in was collected
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return None
+        batch, self._pending = self._pending, []
+        return self._enqueue(self._commit(batch))
+
+    async def _commit(self, batch):
+        try:
+            await self._call('check_habits_bulk', [event for event, _ in batch], chunk_size=self.max_batch)
+        except Exception:
+            # one bad check-in must not fail the others, so retry them one by one
+            for event, future in batch:
+                try:
+                    await self._call('check_habit', *event)
+                except Exception as error:
+                    # a caller that was cancelled meanwhile has no one left to tell
+                    if not future.done():
+                        future.set_exception(error)
+                else:
+                    if not future.done():
+                        future.set_result(None)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        """
+        commit the collected check-ins, then close the tracker
+        """
+        self._flush()
+        if self._tail is not None:
+            await asyncio.wait([self._tail])
+        await super().close()
+
+
+class AsyncHabitAnalyser(_AsyncStore):
+    store_class = HabitAnalyser
+
+    async def get_all_habits(self, limit=None, offset=0):
+        return await self._call('get_all_habits', limit=limit, offset=offset)
+
+    async def get_habits_with_periodicity(self, frequency, limit=None, offset=0):
+        return await self._call('get_habits_with_periodicity', frequency, limit=limit, offset=offset)
+
+    async def streak_stats(self, names=None, as_of=None):
+        return await self._call('streak_stats', names=names, as_of=as_of)
+
+    async def get_longest_streak(self):
+        return await self._call('get_longest_streak')
+
+    async def get_longest_streak_for_habit(self, name):
+        return await self._call('get_longest_streak_for_habit', name)
+
+    async def get_completion_rate(self, name, as_of=None):
+        return await self._call('get_completion_rate', name, as_of=as_of)
@@ -0,0 +1,57 @@
+"""
+Compare concurrent check-in throughput of AsyncHabitTracker against the sync API.
+
+Usage:
+    python benchmarks/bench_async.py --events 5000 --window 0.005
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_api import AsyncHabitTracker  # noqa: E402
+from bench_check_in import make_events, open_tracker  # noqa: E402
+
+
+def run_sync(path, events):
+    tracker = open_tracker(path)
+    started = time.perf_counter()
+    for habit_name, event_date, completed in events:
+        tracker.check_habit(habit_name, event_date, completed)
+    elapsed = time.perf_counter() - started
+    tracker.close()
+    return elapsed
+
+
+async def run_async(path, events, window):
+    open_tracker(path).close()
+    tracker = AsyncHabitTracker(path, commit_window=window)
+    started = time.perf_counter()
+    await asyncio.gather(*(tracker.check_habit(*event) for event in events))
+    elapsed = time.perf_counter() - started
+    await tracker.close()
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--window', type=float, default=0.005)
+    args = parser.parse_args(argv)
+
+    events = make_events(args.events)
+    with tempfile.TemporaryDirectory() as tmp:
+        sync = run_sync(os.path.join(tmp, 'sync.db'), events)
+        concurrent = asyncio.run(run_async(os.path.join(tmp, 'async.db'), events, args.window))
+
+    print(f"sync:  {args.events / sync:12.0f} check-ins/sec ({sync:.3f}s)")
+    print(f"async: {args.events / concurrent:12.0f} check-ins/sec ({concurrent:.3f}s)")
+    print(f"speedup: {sync / concurrent:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
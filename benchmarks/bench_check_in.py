@@ -0,0 +1,73 @@
+"""
+Compare check-in throughput of the per-row path against check_habits_bulk.
+
+Usage:
+    python benchmarks/bench_check_in.py --events 20000 --chunk-size 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import HabitTracker  # noqa: E402
+
+
+def make_events(count, habits=5):
+    """
+    build a deterministic list of check-in events
+    :param count: number of events
+    :param habits: number of distinct habit names to spread the events over
+    :return: list of (habit_name, event_date, completed) tuples
+    """
+    start = date(2020, 1, 1)
+    return [(f"Habit {i % habits}", start + timedelta(days=i // habits), i % 3 != 0) for i in range(count)]
+
+
+def open_tracker(path, habits=5):
+    tracker = HabitTracker(name=path)
+    for i in range(habits):
+        tracker.create_habit(f"Habit {i}", "benchmark habit", date(2020, 1, 1), date(2030, 1, 1), "daily")
+    return tracker
+
+
+def run_per_row(path, events):
+    tracker = open_tracker(path)
+    started = time.perf_counter()
+    for habit_name, event_date, completed in events:
+        tracker.check_habit(habit_name, event_date, completed)
+    elapsed = time.perf_counter() - started
+    tracker.close()
+    return elapsed
+
+
+def run_bulk(path, events, chunk_size):
+    tracker = open_tracker(path)
+    started = time.perf_counter()
+    tracker.check_habits_bulk(events, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - started
+    tracker.close()
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    events = make_events(args.events)
+    with tempfile.TemporaryDirectory() as tmp:
+        per_row = run_per_row(os.path.join(tmp, 'per_row.db'), events)
+        bulk = run_bulk(os.path.join(tmp, 'bulk.db'), events, args.chunk_size)
+
+    print(f"per-row: {args.events / per_row:12.0f} events/sec ({per_row:.3f}s)")
+    print(f"bulk:    {args.events / bulk:12.0f} events/sec ({bulk:.3f}s)")
+    print(f"speedup: {per_row / bulk:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Time the start of the CLI: the modules main imports, and how long a fresh process takes to answer its first query.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --top 20 --repeat 10 --output startup.json
+    python benchmarks/startup.py --budget 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that only some commands need and that main must not import when it starts
+DEFERRED = ('numpy', 'pyarrow', 'questionary', 'urllib.request', 'concurrent.futures.process')
+
+# run in a fresh interpreter: import main, run one command and report both times on stderr
+FIRST_QUERY = '''
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+status = main.main(sys.argv[1:])
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'command': done - imported, 'status': status}), file=sys.stderr)
+'''
+
+
+def _python(*args, **kwargs):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True, **kwargs)
+
+
+def import_times(module='main'):
+    """
+    import a module in a fresh interpreter with -X importtime
+    :param module: name of the module to import
+    :return: list of (name, self seconds, cumulative seconds) in import order
+    """
+    stderr = _python('-X', 'importtime', '-c', f'import {module}').stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    return times
+
+
+def import_summary(times, top=10):
+    """
+    :param times: result of import_times
+    :param top: number of modules listed
+    :return: dict with the total import time, the slowest modules by their own time, and the deferred modules loaded
+    """
+    names = {name for name, _, _ in times}
+    return {
+        'total': sum(own for _, own, _ in times),
+        'modules': len(times),
+        'slowest': [{'module': name, 'self': own, 'cumulative': cumulative}
+                    for name, own, cumulative in sorted(times, key=lambda row: row[1], reverse=True)[:top]],
+        'eager': [name for name in DEFERRED if name in names],
+    }
+
+
+def time_to_first_query(database, repeat=5, command=('list',)):
+    """
+    run a command of main.py in fresh interpreters
+    :param database: database file the command runs against
+    :param repeat: number of processes started
+    :param command: command line arguments after --database
+    :return: dict of 'wall', 'import' and 'command' timing summaries in seconds
+    : the first run creates and migrates the database when it does not exist yet, the others find it current
+    """
+    runs = {'wall': [], 'import': [], 'command': []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = _python('-c', FIRST_QUERY, '--database', database, *command)
+        runs['wall'].append(time.perf_counter() - started)
+        child = json.loads(result.stderr.strip().splitlines()[-1])
+        if child['status']:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+        runs['import'].append(child['import'])
+        runs['command'].append(child['command'])
+    return {name: _summary(samples) for name, samples in runs.items()}
+
+
+def _summary(samples):
+    return {
+        'runs': len(samples),
+        'first': samples[0],
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='existing database to query, a new one is created if omitted')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports listed')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--budget', type=float,
+                        help='seconds the median time to first query may take, more is reported as a regression')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = args.database or os.path.join(tmp, 'startup.db')
+        report = {
+            'python': sys.version.split()[0],
+            'imports': import_summary(import_times(), args.top),
+            'first_query': time_to_first_query(database, args.repeat),
+        }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    status = 0
+    for name in report['imports']['eager']:
+        print(f"regression: main imports {name} at startup", file=sys.stderr)
+        status = 1
+    median = report['first_query']['wall']['median']
+    if args.budget is not None and median > args.budget:
+        print(f"regression: first query took {median:.3f}s, the budget is {args.budget:.3f}s", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
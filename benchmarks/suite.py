@@ -0,0 +1,202 @@
+"""
+Time the tracker and analyser hot paths against a synthetic database and write the results as JSON.
+
+Usage:
+    python benchmarks/suite.py --users 100 --years 3 --output results.json
+    python benchmarks/suite.py --output new.json --baseline results.json
+    python benchmarks/suite.py --profile profile.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import HabitTracker  # noqa: E402
+from habit_analyse import HabitAnalyser  # noqa: E402
+from instrumentation import Instrumentation  # noqa: E402
+from synthetic import START, generate  # noqa: E402
+
+
+def _create(tracker, analyser, names, run):
+    for index in range(len(names)):
+        tracker.create_habit(f"Benchmark {run}-{index}", "", START, START + timedelta(days=365), "daily")
+
+
+def _check_in(tracker, analyser, names, run):
+    event_date = date(2035, 1, 1) + timedelta(days=run)
+    for name in names:
+        tracker.check_habit(name, event_date, True)
+
+
+def _get_habit(tracker, analyser, names, run):
+    for name in names:
+        tracker.get_habit(name)
+
+
+def _get_tracker(tracker, analyser, names, run):
+    for name in names:
+        tracker.get_tracker(name)
+
+
+def _periodicity(tracker, analyser, names, run):
+    for frequency in ('daily', 'weekly', 'monthly'):
+        analyser.get_habits_with_periodicity(frequency)
+
+
+def _all_habits(tracker, analyser, names, run):
+    analyser.get_all_habits()
+
+
+def _streak_stats(tracker, analyser, names, run):
+    analyser.streak_stats()
+
+
+def _longest_streak(tracker, analyser, names, run):
+    analyser.get_longest_streak()
+
+
+def _longest_streak_for_habit(tracker, analyser, names, run):
+    for name in names:
+        analyser.get_longest_streak_for_habit(name)
+
+
+def _completion_rate(tracker, analyser, names, run):
+    for name in names:
+        analyser.get_completion_rate(name)
+
+
+def _completion_rates(tracker, analyser, names, run):
+    for name in names:
+        analyser.get_completion_rates(name, as_of=START + timedelta(days=364))
+
+
+def _trend(tracker, analyser, names, run):
+    for name in names:
+        analyser.get_trend(name, as_of=START + timedelta(days=364))
+
+
+SCENARIOS = {
+    'create': _create,
+    'check_in': _check_in,
+    'get_habit': _get_habit,
+    'get_tracker': _get_tracker,
+    'periodicity': _periodicity,
+    'get_all_habits': _all_habits,
+    'streak_stats': _streak_stats,
+    'get_longest_streak': _longest_streak,
+    'get_longest_streak_for_habit': _longest_streak_for_habit,
+    'get_completion_rate': _completion_rate,
+    'get_completion_rates': _completion_rates,
+    'get_trend': _trend,
+}
+
+
+def run_suite(path, repeat=5, sample=50, scenarios=None, instrumentation=None):
+    """
+    time every scenario against an existing database
+    :param path: name of the database file
+    :param repeat: number of timed runs per scenario
+    :param sample: number of habits the per-habit scenarios touch in each run
+    :param scenarios: names of the scenarios to run, all if None
+    :param instrumentation: Instrumentation recording per-method and per-statement figures while the suite runs
+    :return: dict of scenario name to timing summary in seconds
+    """
+    tracker = HabitTracker(name=path, instrumentation=instrumentation)
+    analyser = HabitAnalyser(name=path, instrumentation=instrumentation)
+    names = analyser.get_all_habits(limit=sample)
+    results = {}
+    for name in scenarios or SCENARIOS:
+        timings = []
+        for run in range(repeat):
+            started = time.perf_counter()
+            SCENARIOS[name](tracker, analyser, names, run)
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            'runs': repeat,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.fmean(timings),
+        }
+    tracker.close()
+    analyser.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: list of (scenario, ratio) whose median got slower than threshold times the baseline median
+    """
+    slower = []
+    for name, summary in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous['median'] > 0:
+            ratio = summary['median'] / previous['median']
+            if ratio > threshold:
+                slower.append((name, ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='existing database to time, a synthetic one is generated if omitted')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=8)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--completion', type=float, default=0.7)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sample', type=int, default=50)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    parser.add_argument('--profile', help='record method calls and slow queries to this JSON-lines file')
+    parser.add_argument('--slow-query', type=float, default=0.01, help='seconds after which a query plan is captured')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database
+        dataset = {'database': path}
+        if path is None:
+            path = os.path.join(tmp, 'bench.db')
+            habits, events = generate(path, args.users, args.habits, args.years, args.completion)
+            dataset = {'users': args.users, 'habits': habits, 'years': args.years,
+                       'completion': args.completion, 'check_ins': events}
+        instrumentation = None
+        if args.profile:
+            instrumentation = Instrumentation(slow_query=args.slow_query, sink=args.profile)
+        results = run_suite(path, args.repeat, args.sample, args.scenario, instrumentation)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': dataset,
+        'results': results,
+    }
+    if instrumentation is not None:
+        report['profile'] = instrumentation.stats()
+        instrumentation.close()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            slower = compare(results, json.load(file), args.threshold)
+        for name, ratio in slower:
+            print(f"regression: {name} is {ratio:.2f}x slower than the baseline", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Fill a habit database with a synthetic multi-year history.
+
+Usage:
+    python benchmarks/synthetic.py bench.db --users 100 --habits 8 --years 3 --completion 0.7
+"""
+import argparse
+import calendar
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import HabitTracker, predefined_catalogue  # noqa: E402
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+START = date(2020, 1, 1)
+
+
+def habit_specs(users, habits, years, start=START):
+    """
+    extend the predefined habits to users x habits habits
+    :param users: number of users
+    :param habits: number of habits per user, beyond the catalogue they cycle through all frequencies
+    :param years: length of every habit in years
+    :param start: start date of every habit
+    :return: generator of (name, description, start_date, end_date, frequency) tuples
+    """
+    catalogue = predefined_catalogue()
+    end = start + timedelta(days=365 * years - 1)
+    for user in range(users):
+        for index in range(habits):
+            base = catalogue[index % len(catalogue)]
+            frequency = base.frequency if index < len(catalogue) else FREQUENCIES[index % len(FREQUENCIES)]
+            yield f"{base.name} {user}-{index}", base.description, start, end, frequency
+
+
+def check_in_events(specs, completion, seed=0):
+    """
+    one check-in per period of every habit, completed with the given probability
+    :param specs: tuples from habit_specs
+    :param completion: probability that a period was completed
+    :param seed: random seed, the same seed gives the same history
+    :return: generator of (habit_name, event_date, completed) tuples
+    """
+    rng = random.Random(seed)
+    for name, _, start_date, end_date, frequency in specs:
+        day = start_date
+        while day <= end_date:
+            if frequency == 'daily':
+                length = 1
+            elif frequency == 'weekly':
+                length = 7
+            else:
+                length = calendar.monthrange(day.year, day.month)[1] - day.day + 1
+            event_date = day + timedelta(days=rng.randrange(length))
+            if event_date <= end_date:
+                yield name, event_date, rng.random() < completion
+            day += timedelta(days=length)
+
+
+def generate(path, users=10, habits=8, years=1, completion=0.7, seed=0, chunk_size=5000):
+    """
+    create the habits and their check-ins in a database file
+    :param path: name of the database file
+    :return: (number of habits, number of check-ins)
+    """
+    specs = list(habit_specs(users, habits, years))
+    tracker = HabitTracker(name=path)
+    for spec in specs:
+        tracker.create_habit(*spec)
+    counts = tracker.check_habits_bulk(check_in_events(specs, completion, seed), chunk_size=chunk_size)
+    tracker.close()
+    return len(specs), sum(counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=8)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--completion', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    habits, events = generate(args.path, args.users, args.habits, args.years, args.completion, args.seed)
+    print(f"{habits} habits, {events} check-ins written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        """
+        initialize a size-bounded least recently used cache
+        :param maxsize: maximum number of entries
+        :param ttl: seconds an entry stays valid, None to keep entries until they are evicted or invalidated
+        :param clock: function returning the current time in seconds
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # invalidation count per key since the last invalidation of every key, which bumps the epoch
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """
+        get a cached value
+        :param key: cache key
+        :return: (True, value) on a hit, (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or entry[1] > self.clock()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self, key):
+        """
+        :param key: cache key
+        :return: token that changes whenever the key is invalidated, see store
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def store(self, key, value, generation=None):
+        """
+        cache a value, evicting the least recently used entry when the cache is full
+        :param key: cache key
+        :param value: value to cache, None is a valid value
+        :param generation: token returned by generation before the value was loaded, None to store unconditionally
+        : a value loaded while a write invalidated the key may be stale, it is not stored when the token changed
+        """
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """
+        drop entries
+        :param keys: keys to drop, every entry if none are given
+        """
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                self._generations.clear()
+                self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self):
+        """
+        :return: dict with the hit, miss and eviction counters and the current size
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries)}
@@ -0,0 +1,335 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from migrations import migrate
+
+
+class ConnectionManager:
+    def __init__(self, name='main.db', readers=4, timeout=30.0, synchronous='NORMAL', cache_size=-65536,
+                 mmap_size=268435456, instrumentation=None):
+        """
+        initialize a connection manager shared by HabitTracker and HabitAnalyser objects
+        :param name: name of the database file
+        :param readers: maximum number of reader connections open at the same time
+        :param timeout: seconds to wait for a database lock before giving up
+        :param synchronous: value of PRAGMA synchronous, NORMAL is durable enough in WAL mode
+        :param cache_size: value of PRAGMA cache_size, negative values are KiB
+        :param mmap_size: value of PRAGMA mmap_size in bytes
+        :param instrumentation: Instrumentation recording the statements run on every connection, None to disable
+        : open the single writer connection in WAL mode
+        : migrate the tables to the current schema version
+        """
+        if readers < 1:
+            raise ValueError("readers must be at least 1")
+        self.name = name
+        self.timeout = timeout
+        self.pragmas = {'synchronous': synchronous, 'cache_size': cache_size, 'mmap_size': mmap_size}
+        self.instrumentation = instrumentation
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode = WAL')
+        self._writer_lock = threading.RLock()
+        self._writer_owner = None
+        self._idle = deque()
+        self._reader_slots = threading.BoundedSemaphore(readers)
+        self._closed = False
+        migrate(self._writer)
+
+    def _connect(self):
+        """
+        open a connection that may be handed from one thread to another
+        :return: sqlite3 connection in autocommit mode with the tuned pragmas applied
+        """
+        connect = sqlite3.connect if self.instrumentation is None else self.instrumentation.connect
+        conn = connect(self.name, isolation_level=None, check_same_thread=False, timeout=self.timeout,
+                       detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """
+        borrow the writer connection, one thread at a time
+        :return: sqlite3 connection
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed connection manager.")
+        with self._writer_lock:
+            owner, self._writer_owner = self._writer_owner, threading.get_ident()
+            try:
+                yield self._writer
+            finally:
+                self._writer_owner = owner
+
+    @contextmanager
+    def reader(self):
+        """
+        borrow a reader connection, opening a new one while fewer than readers are in use
+        :return: read-only sqlite3 connection
+        : a thread that holds the writer reads from it, so it sees its own uncommitted writes
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed connection manager.")
+        if self._writer_owner == threading.get_ident():
+            yield self._writer
+            return
+        with self._reader_slots:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                conn = self._connect()
+                conn.execute('PRAGMA query_only = ON')
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.append(conn)
+
+    def close(self):
+        """
+        close the writer and all idle reader connections
+        """
+        self._closed = True
+        with self._writer_lock:
+            self._writer.close()
+        while self._idle:
+            self._idle.pop().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def uses_connection(write=False):
+    """
+    run a method of an object with a ``manager`` attribute on a borrowed connection
+    :param write: borrow the writer connection instead of a reader
+    : while the method runs, self.conn and self.cursor refer to the borrowed connection in the calling thread;
+    : objects without a manager, and calls nested in another decorated method, use the current connection
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.manager is None or getattr(self._local, 'conn', None) is not None:
+                return method(self, *args, **kwargs)
+            with self.manager.writer() if write else self.manager.reader() as conn:
+                self._local.conn, self._local.cursor = conn, conn.cursor()
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    self._local.cursor.close()
+                    self._local.conn = self._local.cursor = None
+        return wrapper
+    return decorator
+
+
+class ConnectionUser:
+    """
+    connection handling shared by HabitTracker and HabitAnalyser
+    """
+
+    def _open(self, name, isolation_level, manager, instrumentation=None):
+        """
+        :param name: name of the database file, used when no manager is given
+        :param isolation_level: isolation level of the private connection
+        :param manager: ConnectionManager to borrow connections from, or None for one private connection
+        :param instrumentation: Instrumentation timing the methods and the statements of the private connection
+        """
+        self.name = name if manager is None else manager.name
+        self.manager = manager
+        self.instrumentation = instrumentation
+        self._local = threading.local()
+        if manager is None:
+            connect = sqlite3.connect if instrumentation is None else instrumentation.connect
+            self._conn = connect(name, isolation_level=isolation_level, detect_types=sqlite3.PARSE_DECLTYPES)
+            self._cursor = self._conn.cursor()
+            migrate(self._conn)
+        else:
+            self._conn = self._cursor = None
+
+    @property
+    def conn(self):
+        """
+        connection used by the current call
+        """
+        return getattr(self._local, 'conn', None) or self._conn
+
+    @property
+    def cursor(self):
+        """
+        cursor used by the current call
+        """
+        return getattr(self._local, 'cursor', None) or self._cursor
+
+    @uses_connection()
+    def _habit_details(self, habit_ids):
+        """
+        :return: (id, description, progress) rows of the habits, see HabitBatch
+        """
+        self.cursor.execute(f'''
+            SELECT id, description, progress FROM habits
+            WHERE id IN ({', '.join('?' * len(habit_ids))})''', habit_ids)
+        return self.cursor.fetchall()
+
+    def close(self):
+        """
+        close the private connection, a shared manager is left open for its other users
+        """
+        if self._conn is not None:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SnapshotManager:
+    def __init__(self, name='main.db', path=':memory:', refresh_interval=None, mmap_size=268435456,
+                 instrumentation=None, clock=time.monotonic):
+        """
+        initialize read-only access to consistent copies of a database, for analysers that must not slow writers
+        :param name: name of the database file that is copied
+        :param path: ':memory:' to copy into memory, or the file the copy is written to, e.g. on a tmpfs
+        :param refresh_interval: seconds after which the next borrow takes a new copy, None to refresh explicitly
+        :param mmap_size: value of PRAGMA mmap_size for file copies, which are opened immutable
+        :param instrumentation: Instrumentation recording the statements run on the copies, None to disable
+        :param clock: function returning the current time in seconds
+        : the copy is taken with the backup API, which reads one consistent state of the database;
+        : in WAL mode this never blocks writers, and queries on the copy hold no lock on the original
+        """
+        if name == ':memory:' or name.startswith('file:'):
+            raise ValueError("snapshots need a database file")
+        self.name = name
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.mmap_size = mmap_size
+        self.instrumentation = instrumentation
+        self.clock = clock
+        self._lock = threading.Lock()
+        # held while a copy is taken, so threads finding the copy expired together take only one
+        self._refreshing = threading.Lock()
+        # the current copy, its creation time and the number of calls still reading an older copy per connection
+        self._conn = None
+        self._taken_at = None
+        self._borrowed = {}
+        self._closed = False
+        self.refreshes = 0
+        self.refresh()
+
+    def _connect(self, *args, **kwargs):
+        connect = sqlite3.connect if self.instrumentation is None else self.instrumentation.connect
+        return connect(*args, isolation_level=None, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES,
+                       **kwargs)
+
+    def _copy(self):
+        """
+        :return: read-only sqlite3 connection to a new copy of the database
+        """
+        from urllib.request import pathname2url
+
+        source = sqlite3.connect(self.name, isolation_level=None)
+        try:
+            migrate(source)
+            if self.path == ':memory:':
+                conn = self._connect(':memory:')
+                source.backup(conn)
+                conn.execute('PRAGMA query_only = ON')
+                return conn
+            # the copy is built next to its final place and swapped in, calls on the old copy keep its inode
+            directory, base = os.path.split(os.path.abspath(self.path))
+            descriptor, temporary = tempfile.mkstemp(suffix='.tmp', prefix=base + '.', dir=directory)
+            os.close(descriptor)
+            try:
+                target = sqlite3.connect(temporary)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                os.replace(temporary, self.path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+        finally:
+            source.close()
+        conn = self._connect(f'file:{pathname2url(os.path.abspath(self.path))}?mode=ro&immutable=1', uri=True)
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        return conn
+
+    def refresh(self, max_age=None):
+        """
+        replace the copy with a new one, calls still reading the old copy finish on it
+        :param max_age: only replace a copy at least this many seconds old, None to replace it in any case
+        :return: True if a new copy was taken
+        : one refresh runs at a time; the age is checked once it may run, so a refresh that waited
+        : for another one does not copy again
+        """
+        with self._refreshing:
+            if max_age is not None and self._taken_at is not None and self.age() < max_age:
+                return False
+            conn = self._copy()
+            with self._lock:
+                old, self._conn, self._taken_at = self._conn, conn, self.clock()
+                self.refreshes += 1
+                if old is not None and not self._borrowed.get(old):
+                    self._borrowed.pop(old, None)
+                    old.close()
+            return True
+
+    def age(self):
+        """
+        :return: seconds since the current copy was taken
+        """
+        return self.clock() - self._taken_at
+
+    @contextmanager
+    def reader(self):
+        """
+        borrow the connection to the current copy, taking a new copy first when it is older than refresh_interval
+        :return: read-only sqlite3 connection
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed snapshot manager.")
+        if self.refresh_interval is not None and self.age() >= self.refresh_interval:
+            self.refresh(max_age=self.refresh_interval)
+        with self._lock:
+            conn = self._conn
+            self._borrowed[conn] = self._borrowed.get(conn, 0) + 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._borrowed[conn] -= 1
+                if conn is not self._conn and not self._borrowed[conn]:
+                    del self._borrowed[conn]
+                    conn.close()
+
+    def writer(self):
+        """
+        snapshots cannot be written to
+        """
+        raise sqlite3.OperationalError("snapshots are read-only")
+
+    def close(self):
+        """
+        close the connection to the copy, a file copy is left in place
+        """
+        self._closed = True
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,42 +1,80 @@
-import sqlite3
+from collections import namedtuple
 from datetime import date
-from habit_tracker import Habit
+from itertools import islice
+from habit_tracker import Habit, HabitBatch, as_date, period_offset, period_start, progress_bits, \
+    encode_progress, progress_summary
+from periods import period_offsets
+from rollups import rebuild_rollups, record_check_in
+from scheduler import SCHEDULE_SQL
+from cache import LRUCache
+from connection import ConnectionUser, uses_connection
+from instrumentation import instrumented
+from migrations import transaction
+from transfer import CHUNK_SIZE, export_tables, import_tables
 
+# one row per habit and day; a repeated check-in for the same day overwrites the earlier one
+CHECK_IN_SQL = '''
+    INSERT INTO tracker(habit_id, habit_name, event_date, completed)
+    VALUES ((SELECT id FROM habits WHERE user_id = ? AND name = ?), ?, ?, ?)
+    ON CONFLICT(habit_id, event_date) DO UPDATE SET completed = excluded.completed
+'''
 
-class HabitTracker:
-    def __init__(self, name='main.db', isolation_level=None):
+# id of the habit and the completed value of the check-in a new one for the same day replaces
+PREVIOUS_CHECK_IN_SQL = '''
+    SELECT habits.id, tracker.completed
+    FROM habits LEFT JOIN tracker ON tracker.habit_id = habits.id AND tracker.event_date = ?
+    WHERE habits.user_id = ? AND habits.name = ?
+'''
+
+STATS_SQL = '''
+    INSERT OR REPLACE INTO habit_stats(habit_id, current_streak, longest_streak, last_period, total_completions)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+HabitStats = namedtuple('HabitStats', 'current_streak longest_streak last_period total_completions')
+
+
+def predefined_catalogue():
+    """
+    the predefined habits offered by the app
+    :return: list of ‘Habit’ objects
+    """
+    habit_1 = Habit("Exercise", "Workout for 30 minutes", date(2020, 1, 1), date(2020, 1, 28), "daily")
+    habit_2 = Habit("Meditate", "Meditate for 10 minutes", date(2020, 1, 1), date(2020, 1, 28), "weekly")
+    habit_3 = Habit("Journal", "Write in journal for 5 minutes", date(2020, 1, 1), date(2020, 1, 28), "daily")
+    habit_4 = Habit("Read", "Read for 15 minutes", date(2020, 1, 1), date(2020, 1, 28), "weekly")
+    habit_5 = Habit("Drink Water", "Drink 8 glasses of water", date(2020, 1, 1), date(2020, 1, 28), "daily")
+    return [habit_1, habit_2, habit_3, habit_4, habit_5]
+
+
+class HabitTracker(ConnectionUser):
+    def __init__(self, name='main.db', isolation_level=None, manager=None, cache_size=0, cache_ttl=None,
+                 instrumentation=None, user_id='', scheduler=None):
         """
         initialize a habit tracker object
         :param name: name of the database file
+        :param manager: ConnectionManager shared with other trackers and analysers, instead of a private connection
+        :param cache_size: number of habits and stats kept in memory by get_habit and get_stats, 0 disables the cache
+        :param cache_ttl: seconds a cached entry stays valid, None to keep it until a write invalidates it
+        :param instrumentation: Instrumentation timing the public methods, None to disable
+        :param user_id: user whose habits this tracker reads and writes
+        :param scheduler: Scheduler loaded with the habits of the user and kept in sync with every write, None for none
         : create a connection to the database
         : create a cursor object to execute SQL commands
-        : create tables if they don't exist
+        : create or migrate the tables to the current schema version
         """
-        self.conn = sqlite3.connect(name, isolation_level=isolation_level)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS habits (
-                name TEXT NOT NULL PRIMARY KEY,
-                description TEXT,
-                start_date DATE NOT NULL,
-                end_date DATE NOT NULL,
-                frequency TEXT NOT NULL,
-                progress TEXT)''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tracker (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                habit_name TEXT NOT NULL,
-                event_date DATE NOT NULL,
-                completed BOOLEAN NOT NULL,
-                FOREIGN KEY (habit_name) REFERENCES habits(name)
-            )''')
+        self._open(name, isolation_level, manager, instrumentation)
+        self.user_id = user_id
+        self.cache = LRUCache(cache_size, cache_ttl) if cache_size else None
+        self.scheduler = scheduler
+        if scheduler is not None:
+            self._reschedule(None)
 
         # self.cursor.execute("DELETE FROM habits")
         # self.cursor.execute("DELETE FROM tracker")
 
-        self.conn.commit()
-
+    @instrumented
+    @uses_connection(write=True)
     def create_habit(self, name, description, start_date, end_date, frequency):
         """
         create a habit object and insert it into the database
@@ -46,40 +84,137 @@ class HabitTracker:
         :param end_date: end date of the habit
         :param frequency: frequency of the habit
         """
-        habit = Habit(name, description, start_date, end_date, frequency)
-        self.cursor.execute('''
-            INSERT INTO habits(name, description, start_date, end_date, frequency, progress)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (habit.name, habit.description, habit.start_date, habit.end_date, habit.frequency, str(habit.progress)))
-        self.conn.commit()
+        habit = Habit(name, description, as_date(start_date), as_date(end_date), frequency)
+        with transaction(self.conn):
+            self.cursor.execute('''
+                INSERT INTO habits(user_id, name, description, start_date, end_date, frequency, progress)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (self.user_id, habit.name, habit.description, habit.start_date, habit.end_date, habit.frequency,
+                  encode_progress([])))
+        self._invalidate(habit.name)
+        self._reschedule([habit.name])
 
     def predefined_habits(self):
         """
         create a few predefined habits
         :return: habit_names
         """
-        habit_1 = Habit("Exercise", "Workout for 30 minutes", date(2020, 1, 1), date(2020, 1, 28), "daily")
-        habit_2 = Habit("Meditate", "Meditate for 10 minutes", date(2020, 1, 1), date(2020, 1, 28), "weekly")
-        habit_3 = Habit("Journal", "Write in journal for 5 minutes", date(2020, 1, 1), date(2020, 1, 28), "daily")
-        habit_4 = Habit("Read", "Read for 15 minutes", date(2020, 1, 1), date(2020, 1, 28), "weekly")
-        habit_5 = Habit("Drink Water", "Drink 8 glasses of water", date(2020, 1, 1), date(2020, 1, 28), "daily")
-
-        habit_names = [h.name for h in [habit_1, habit_2, habit_3, habit_4, habit_5]]
+        habit_names = [h.name for h in predefined_catalogue()]
         return habit_names
 
-    def get_habit(self, habit_name):
+    @instrumented
+    def get_habit(self, habit_name, lazy=False):
         """
         get a habit object from the database
         :param habit_name: name of the habit
-        :return: ‘Habit’ object
+        :param lazy: read description and progress only when they are first accessed
+        :return: ‘Habit’ object, a new one on every call
+        : the cache holds the row, so changing the returned habit does not change what later calls return;
+        : lazy habits bypass the cache and need the tracker to be open until their details are read
         """
-        self.cursor.execute('SELECT * FROM habits WHERE name = ?', (str(habit_name),))
+        if lazy:
+            return self._load_deferred_habit(str(habit_name))
+        row = self._cached('habit', str(habit_name), self._load_habit)
+        return None if row is None else Habit.from_row(row)
+
+    @instrumented
+    def get_stats(self, habit_name):
+        """
+        get the streak figures of a habit
+        :param habit_name: name of the habit
+        :return: ‘HabitStats’ tuple, or None for unknown habits
+        """
+        return self._cached('stats', str(habit_name), self._load_stats)
+
+    def cache_info(self):
+        """
+        :return: dict with the hit, miss and eviction counters and size of the cache, None when it is disabled
+        """
+        return None if self.cache is None else self.cache.stats()
+
+    def _cached(self, kind, habit_name, load):
+        """
+        look up a value in the cache, loading and storing it on a miss
+        :param kind: kind of value, part of the cache key
+        :param habit_name: name of the habit
+        :param load: function loading the value from the database
+        """
+        if self.cache is None:
+            return load(habit_name)
+        key = (kind, habit_name)
+        generation = self.cache.generation(key)
+        hit, value = self.cache.lookup(key)
+        if not hit:
+            value = load(habit_name)
+            # skipped when a write invalidated the key while it was loaded
+            self.cache.store(key, value, generation)
+        return value
+
+    @uses_connection()
+    def _reschedule(self, habit_names):
+        """
+        bring the scheduler in line with the habits after a write
+        :param habit_names: names of the habits, None for all habits of the user
+        """
+        if self.scheduler is None:
+            return
+        if habit_names is None:
+            self.cursor.execute(SCHEDULE_SQL + ' WHERE habits.user_id = ?', (self.user_id,))
+            self.scheduler.load(self.cursor.fetchall())
+            return
+        habit_names = list(dict.fromkeys(habit_names))
+        for start in range(0, len(habit_names), 500):
+            names = habit_names[start:start + 500]
+            self.cursor.execute(SCHEDULE_SQL + f'''
+                WHERE habits.user_id = ? AND habits.name IN ({', '.join('?' * len(names))})''', (self.user_id, *names))
+            rows = self.cursor.fetchall()
+            for row in rows:
+                self.scheduler.update(*row)
+            for name in set(names) - {row[1] for row in rows}:
+                self.scheduler.remove(self.user_id, name)
+
+    def _invalidate(self, *habit_names):
+        """
+        drop cached values of habits after a write
+        :param habit_names: names of the habits
+        """
+        if self.cache is not None and habit_names:
+            self.cache.invalidate(*[(kind, str(name)) for name in habit_names for kind in ('habit', 'stats')])
+
+    @uses_connection()
+    def _load_habit(self, habit_name):
+        """
+        :return: (name, description, start_date, end_date, frequency, progress) row of the habit, see Habit.from_row
+        """
+        self.cursor.execute('''
+            SELECT name, description, start_date, end_date, frequency, progress
+            FROM habits WHERE user_id = ? AND name = ?''', (self.user_id, str(habit_name)))
+        return self.cursor.fetchone()
+
+    @uses_connection()
+    def _load_deferred_habit(self, habit_name):
+        """
+        :return: ‘Habit’ whose description and progress are read on first access, None for unknown habits
+        """
+        self.cursor.execute('''
+            SELECT id, name, start_date, end_date, frequency
+            FROM habits WHERE user_id = ? AND name = ?''', (self.user_id, habit_name))
         row = self.cursor.fetchone()
         if row is None:
             return None
-        name, description, start_date, end_date, frequency, progress, *extra_values = row
-        return Habit(name, description, start_date, end_date, frequency, progress=progress)
+        return Habit.deferred(*row, HabitBatch(self._habit_details))
+
+    @uses_connection()
+    def _load_stats(self, habit_name):
+        self.cursor.execute('''
+            SELECT current_streak, longest_streak, last_period, total_completions
+            FROM habit_stats WHERE habit_id = (SELECT id FROM habits WHERE user_id = ? AND name = ?)''',
+                            (self.user_id, habit_name))
+        row = self.cursor.fetchone()
+        return None if row is None else HabitStats(*row)
 
+    @instrumented
+    @uses_connection()
     def get_tracker(self, habit_name):
         """
         get a habit tracker object from the database
@@ -87,11 +222,63 @@ class HabitTracker:
         :return: ‘HabitTracker’ object
         """
         self.cursor.execute(
-            'SELECT habit_name, event_date, completed FROM tracker WHERE habit_name = ?',
-            (habit_name,))
+            'SELECT habit_name, event_date, completed FROM tracker '
+            'WHERE habit_id = (SELECT id FROM habits WHERE user_id = ? AND name = ?) ORDER BY event_date',
+            (self.user_id, habit_name))
         rows = self.cursor.fetchone()
         return rows
 
+    @instrumented
+    @uses_connection()
+    def history_page(self, habit_name, after=None, start=None, end=None, limit=500):
+        """
+        get one page of the check-in history of a habit
+        :param habit_name: name of the habit
+        :param after: event date of the last row of the previous page, None for the first page
+        :param start: first event date to include
+        :param end: last event date to include
+        :param limit: maximum number of rows
+        :return: list of (event_date, completed) tuples in date order
+        """
+        sql = '''
+            SELECT event_date, completed FROM tracker
+            WHERE habit_id = (SELECT id FROM habits WHERE user_id = ? AND name = ?)'''
+        params = [self.user_id, habit_name]
+        if after is not None:
+            sql += ' AND event_date > ?'
+            params.append(as_date(after))
+        if start is not None:
+            sql += ' AND event_date >= ?'
+            params.append(as_date(start))
+        if end is not None:
+            sql += ' AND event_date <= ?'
+            params.append(as_date(end))
+        sql += ' ORDER BY event_date LIMIT ?'
+        params.append(limit)
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
+    def iter_history(self, habit_name, start=None, end=None, batch_size=500):
+        """
+        stream the check-in history of a habit without loading it all into memory
+        :param habit_name: name of the habit
+        :param start: first event date to include
+        :param end: last event date to include
+        :param batch_size: number of rows fetched per query
+        :return: generator of (event_date, completed) tuples in date order
+        : every batch is a separate indexed query that resumes after the last date seen,
+        : so no cursor or connection is held between batches
+        """
+        after = None
+        while True:
+            rows = self.history_page(habit_name, after=after, start=start, end=end, limit=batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    @instrumented
+    @uses_connection(write=True)
     def check_habit(self, habit_name, event_date, completed):
         """
         check if a habit was completed on a given date
@@ -100,27 +287,258 @@ class HabitTracker:
         :param completed: boolean value
         :return: ‘Habit’ object
         """
+        event_date = as_date(event_date)
         habit_completed = Habit(habit_name, end_date=event_date)
-        self.cursor.execute('''
-                    INSERT INTO tracker(habit_name, event_date, completed)
-                    VALUES (?, ?, ?)
-                ''', (habit_name, event_date, completed))
-        self.conn.commit()
+        with transaction(self.conn):
+            self.cursor.execute(PREVIOUS_CHECK_IN_SQL, (event_date, self.user_id, habit_name))
+            previous = self.cursor.fetchone()
+            self.cursor.execute(CHECK_IN_SQL, (self.user_id, habit_name, habit_name, event_date, completed))
+            if previous is not None:
+                record_check_in(self.cursor, previous[0], event_date, completed, previous[1])
+            state = self._progress_state(habit_name)
+            if state is not None:
+                before = state[3]
+                self._mark_progress(state, event_date, completed)
+                if state[3] != before:
+                    self._store_progress([state])
+                    self._update_stats(state[0], before, state[3])
+        self._invalidate(habit_name)
+        self._reschedule([habit_name])
         rows = self.cursor.fetchone()
         if rows is None:
             return None
         habit_completed.mark_complete(event_date)
         return habit_completed
 
+    @instrumented
+    @uses_connection(write=True)
+    def check_habits_bulk(self, events, chunk_size=1000):
+        """
+        check many habits at once inside a single transaction
+        :param events: iterable of (habit_name, event_date, completed) tuples
+        :param chunk_size: number of rows handed to each executemany call
+        :return: list with the number of rows written per chunk
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        events = iter(events)
+        counts = []
+        states = {}
+        touched = {}
+        with transaction(self.conn):
+            while True:
+                chunk = [(name, as_date(event_date), completed)
+                         for name, event_date, completed in islice(events, chunk_size)]
+                if not chunk:
+                    break
+                self.cursor.executemany(CHECK_IN_SQL, [(self.user_id, name, name, event_date, completed)
+                                                       for name, event_date, completed in chunk])
+                counts.append(self.cursor.rowcount)
+                for name, event_date, completed in chunk:
+                    if name not in states:
+                        states[name] = self._progress_state(name)
+                    if states[name] is not None:
+                        self._mark_progress(states[name], event_date, completed)
+                        first, last = touched.get(name, (event_date, event_date))
+                        touched[name] = min(first, event_date), max(last, event_date)
+            changed = [state for state in states.values() if state is not None and state[3] != state[4]]
+            self._store_progress(changed)
+            self.cursor.executemany(STATS_SQL, [(state[0], *progress_summary(state[3])) for state in changed])
+            # replaced check-ins are not known here, so the touched weeks and months are recounted
+            for name, (first, last) in touched.items():
+                habit_id = states[name][0]
+                rebuild_rollups(self.cursor, habit_id - 1, habit_id, first, last)
+        self._invalidate(*states)
+        self._reschedule(states)
+        return counts
+
+    def _progress_state(self, habit_name):
+        """
+        load what is needed to update the progress bitmap of a habit
+        :param habit_name: name of the habit
+        :return: [habit_id, start_date, frequency, bits, bits as loaded], or None for unknown habits
+        """
+        self.cursor.execute('SELECT id, start_date, frequency, progress FROM habits WHERE user_id = ? AND name = ?',
+                            (self.user_id, habit_name))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        habit_id, start_date, frequency, progress = row
+        try:
+            start_date = as_date(start_date)
+        except ValueError:
+            return None
+        bits = progress_bits(progress)
+        return [habit_id, start_date, frequency, bits, bits]
+
+    def _mark_progress(self, state, event_date, completed):
+        """
+        set or clear the bit of the period a check-in falls in
+        :param state: list returned by _progress_state, updated in place
+        :param event_date: date of the event
+        :param completed: boolean value
+        """
+        habit_id, start_date, frequency, bits, _ = state
+        offset = period_offset(start_date, event_date, frequency)
+        if offset < 0:
+            return
+        if completed:
+            state[3] = bits | 1 << offset
+            return
+        # a missed day only clears a weekly or monthly period if no other day in it was completed
+        self.cursor.execute('''
+            SELECT 1 FROM tracker
+            WHERE habit_id = ? AND event_date >= ? AND event_date < ? AND completed
+            LIMIT 1''', (habit_id, period_start(start_date, offset, frequency),
+                         period_start(start_date, offset + 1, frequency)))
+        if self.cursor.fetchone() is None:
+            state[3] = bits & ~(1 << offset)
+
+    def _store_progress(self, states):
+        """
+        write progress bitmaps back to the habits table
+        :param states: lists returned by _progress_state
+        """
+        self.cursor.executemany('UPDATE habits SET progress = ? WHERE id = ?',
+                                [(encode_progress(state[3]), state[0]) for state in states])
+
+    def _update_stats(self, habit_id, before, after):
+        """
+        bring the streak figures of a habit up to date after one period changed
+        :param habit_id: id of the habit
+        :param before: progress bitmap before the check-in
+        :param after: progress bitmap after the check-in
+        """
+        offset = (before ^ after).bit_length() - 1
+        self.cursor.execute('''
+            SELECT current_streak, longest_streak, last_period, total_completions
+            FROM habit_stats WHERE habit_id = ?''', (habit_id,))
+        row = self.cursor.fetchone()
+        if row is not None and after > before and (row[2] is None or offset > row[2]):
+            current, longest, last_period, total = row
+            current = current + 1 if last_period is not None and offset == last_period + 1 else 1
+            stats = (current, max(longest, current), offset, total + 1)
+        else:
+            # unchecked or back-dated periods can split earlier runs, so start over from the bitmap
+            stats = progress_summary(after)
+        self.cursor.execute(STATS_SQL, (habit_id, *stats))
+
+    @instrumented
+    @uses_connection(write=True)
+    def rebuild_stats(self):
+        """
+        recompute the progress bitmaps and streak figures of all habits from the tracker table
+        :return: names of the habits whose stored figures did not match the tracker
+        """
+        mismatched = []
+        with transaction(self.conn):
+            habits = self.conn.execute('''
+                SELECT habits.id, habits.name, habits.start_date, habits.frequency, habits.progress,
+                       COALESCE(habit_stats.current_streak, 0), COALESCE(habit_stats.longest_streak, 0),
+                       habit_stats.last_period, COALESCE(habit_stats.total_completions, 0)
+                FROM habits LEFT JOIN habit_stats ON habit_stats.habit_id = habits.id
+                ORDER BY habits.id''').fetchall()
+            events = self.conn.execute('''
+                SELECT habit_id, event_date FROM tracker
+                WHERE habit_id IS NOT NULL AND completed ORDER BY habit_id''')
+            event = next(events, None)
+            progress_rows, stats_rows = [], []
+            for habit_id, name, start_date, frequency, progress, *stored in habits:
+                event_dates = []
+                while event is not None and event[0] <= habit_id:
+                    if event[0] == habit_id:
+                        event_dates.append(event[1])
+                    event = next(events, None)
+                try:
+                    bits = progress_bits(encode_progress(period_offsets(start_date, event_dates, frequency)))
+                except ValueError:
+                    continue
+                stats = progress_summary(bits)
+                if bits != progress_bits(progress) or tuple(stored) != stats:
+                    mismatched.append(name)
+                    progress_rows.append((encode_progress(bits), habit_id))
+                    stats_rows.append((habit_id, *stats))
+            self.cursor.executemany('UPDATE habits SET progress = ? WHERE id = ?', progress_rows)
+            self.cursor.executemany(STATS_SQL, stats_rows)
+        self._invalidate(*mismatched)
+        self._reschedule(mismatched)
+        return mismatched
+
+    @instrumented
+    @uses_connection(write=True)
+    def rebuild_rollups(self):
+        """
+        recompute the weekly and monthly completion rollups of all habits from the tracker table
+        """
+        with transaction(self.conn):
+            rebuild_rollups(self.cursor)
+
+    def _tracked_progress(self, habit_name, start_date, frequency):
+        """
+        build a progress bitmap from the tracker history of a habit
+        :param habit_name: name of the habit
+        :param start_date: start date of the habit
+        :param frequency: frequency of the habit
+        :return: bitmap BLOB
+        """
+        self.cursor.execute('''
+            SELECT event_date FROM tracker
+            WHERE habit_id = (SELECT id FROM habits WHERE user_id = ? AND name = ?) AND completed''',
+                            (self.user_id, habit_name))
+        try:
+            return encode_progress(period_offsets(start_date, [row[0] for row in self.cursor.fetchall()], frequency))
+        except ValueError:
+            return encode_progress([])
+
+    @instrumented
+    @uses_connection()
+    def export_data(self, directory, file_format=None, chunk_size=CHUNK_SIZE):
+        """
+        export the habits and their check-ins as columnar files
+        :param directory: directory for the files
+        :param file_format: parquet, npz or csv, the best installed one if None
+        :param chunk_size: number of rows held in memory at a time
+        :return: (number of habits, number of check-ins)
+        """
+        return export_tables(self.conn, directory, file_format, chunk_size)
+
+    @instrumented
+    @uses_connection(write=True)
+    def import_data(self, directory, chunk_size=CHUNK_SIZE, defer_indexes=True):
+        """
+        load habits and check-ins exported by export_data in one transaction
+        :param directory: directory written by export_data
+        :param chunk_size: number of rows held in memory at a time
+        :param defer_indexes: build the indexes once after loading instead of row by row
+        :return: (number of habits, number of check-ins)
+        """
+        counts = import_tables(self.conn, directory, chunk_size, defer_indexes)
+        if self.cache is not None:
+            self.cache.invalidate()
+        self._reschedule(None)
+        return counts
+
+    @instrumented
+    @uses_connection(write=True)
     def delete_habit(self, name):
         """
         delete a habit from the database
         :param name: name of the habit
         """
         habit = Habit(name)
-        self.cursor.execute('DELETE FROM habits WHERE name = ?', (habit.name,))
-        self.conn.commit()
+        with transaction(self.conn):
+            self.cursor.execute('SELECT id FROM habits WHERE user_id = ? AND name = ?', (self.user_id, habit.name))
+            row = self.cursor.fetchone()
+            if row is not None:
+                self.cursor.execute('DELETE FROM habit_stats WHERE habit_id = ?', row)
+                self.cursor.execute('DELETE FROM habit_rollups WHERE habit_id = ?', row)
+                self.cursor.execute('DELETE FROM tracker WHERE habit_id = ?', row)
+                self.cursor.execute('DELETE FROM habits WHERE id = ?', row)
+        self._invalidate(habit.name)
+        self._reschedule([habit.name])
 
+    @instrumented
+    @uses_connection(write=True)
     def update_habit(self, name, description, start_date, end_date, frequency):
         """
         update a habit in the database
@@ -130,15 +548,19 @@ class HabitTracker:
         :param end_date: end date of the habit
         :param frequency: frequency of the habit
         """
-        habit = Habit(name, description, start_date, end_date, frequency)
-        self.cursor.execute('''
-            UPDATE habits
-            SET description = ?, start_date = ?, end_date = ?, frequency = ?, progress = ?
-            WHERE name = ?
-        ''', (habit.description, habit.start_date, habit.end_date, habit.frequency, str(habit.progress), habit.name))
-        self.conn.commit()
-
-    def close(self):
-        self.conn.close()
-
-        
+        habit = Habit(name, description, as_date(start_date), as_date(end_date), frequency)
+        # period indexes depend on start date and frequency, so the bitmap is rebuilt from the tracker
+        with transaction(self.conn):
+            progress = self._tracked_progress(habit.name, habit.start_date, habit.frequency)
+            self.cursor.execute('''
+                UPDATE habits
+                SET description = ?, start_date = ?, end_date = ?, frequency = ?, progress = ?
+                WHERE user_id = ? AND name = ?
+            ''', (habit.description, habit.start_date, habit.end_date, habit.frequency, progress, self.user_id,
+                  habit.name))
+            self.cursor.execute('SELECT id FROM habits WHERE user_id = ? AND name = ?', (self.user_id, habit.name))
+            row = self.cursor.fetchone()
+            if row is not None:
+                self.cursor.execute(STATS_SQL, (row[0], *progress_summary(progress_bits(progress))))
+        self._invalidate(habit.name)
+        self._reschedule([habit.name])
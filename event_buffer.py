@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from db import HabitTracker
+from instrumentation import Histogram
+from periods import as_date
+
+
+class BufferedHabitTracker:
+    def __init__(self, name='main.db', journal=None, manager=None, user_id='', flush_interval=0.05, max_batch=1000,
+                 fsync=True, compact_bytes=1 << 20):
+        """
+        initialize a habit tracker whose check-ins return before they are committed
+        :param name: name of the database file
+        :param journal: path of the append-only journal, defaults to the database name with .journal appended
+        :param manager: ConnectionManager to share, instead of a private connection owned by the flusher thread
+        :param user_id: user whose habits are checked
+        :param flush_interval: seconds the flusher waits for more check-ins before it commits what it has
+        :param max_batch: maximum number of check-ins committed in one transaction
+        :param fsync: sync the journal to disk on every check-in, False only survives a crash of the process
+        :param compact_bytes: size of the already committed start of the journal that triggers rewriting it
+        : check-ins left in the journal by a crash are queued again before any new one
+        """
+        if journal is None:
+            if name == ':memory:' or name.startswith('file:'):
+                raise ValueError("a journal path is needed for this database")
+            journal = name + '.journal'
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.name = name
+        self.journal = journal
+        self.manager = manager
+        self.user_id = user_id
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.compact_bytes = compact_bytes
+        self.flush_latency = Histogram()
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        # (event, end offset of its journal line) in append order
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._appended = self._committed = self._wanted = 0
+        self._committed_offset = 0
+        self._closed = self._stopped = False
+        self._file = open(journal, 'a+b')
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name='BufferedHabitTracker', daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        """
+        queue the check-ins of the journal, which were not known to be committed when it was last closed
+        : an incomplete last line is the write a crash interrupted, it was never acknowledged and is cut off
+        """
+        self._file.seek(0)
+        offset = 0
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            self._queue.append((tuple(json.loads(line)), offset))
+        self._file.truncate(offset)
+        self._appended = len(self._queue)
+
+    def check_habit(self, habit_name, event_date, completed):
+        """
+        record a check-in in the journal and queue it for the flusher
+        :param habit_name: name of the habit
+        :param event_date: date of the event
+        :param completed: boolean value
+        : returns once the journal holds the check-in, call flush to wait until the database does
+        """
+        event = (habit_name, as_date(event_date).isoformat(), bool(completed))
+        line = json.dumps(event).encode() + b'\n'
+        with self._lock:
+            if self._closed:
+                raise ValueError("check-in on a closed buffer")
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._queue.append((event, self._file.tell()))
+            self._appended += 1
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        wait until every check-in queued so far is committed
+        :param timeout: seconds to wait at most, None to wait as long as it takes
+        :return: True if they were committed, False if the timeout passed first
+        """
+        with self._lock:
+            target = self._wanted = self._appended
+            self._changed.notify_all()
+            self._changed.wait_for(lambda: self._committed >= target or self._stopped, timeout)
+            return self._committed >= target
+
+    def stats(self):
+        """
+        :return: dict with the queue depth, committed check-ins and batches, failed flushes and the flush latency
+        """
+        with self._lock:
+            return {
+                'queue_depth': len(self._queue),
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'flush_latency': self.flush_latency.summary(),
+            }
+
+    def _run(self):
+        """
+        commit queued check-ins in batches until the buffer is closed and empty
+        """
+        tracker = HabitTracker(self.name, manager=self.manager, user_id=self.user_id)
+        try:
+            while True:
+                with self._lock:
+                    self._changed.wait_for(lambda: self._queue or self._closed)
+                    if not self._queue:
+                        return
+                    if len(self._queue) < self.max_batch and not self._closed:
+                        # give a burst the rest of the interval to collect into one transaction, unless flush waits
+                        self._changed.wait_for(lambda: len(self._queue) >= self.max_batch or self._closed
+                                               or self._wanted > self._committed, self.flush_interval)
+                    batch = [self._queue[index] for index in range(min(len(self._queue), self.max_batch))]
+                started = time.perf_counter()
+                try:
+                    tracker.check_habits_bulk([event for event, _ in batch], chunk_size=self.max_batch)
+                except Exception as error:
+                    # the check-ins stay queued and in the journal, a locked database is retried after a pause
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = repr(error)
+                        if self._closed:
+                            return
+                    time.sleep(self.flush_interval)
+                    continue
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    for _ in batch:
+                        self._queue.popleft()
+                    self._committed += len(batch)
+                    self._committed_offset = batch[-1][1]
+                    self.flushed += len(batch)
+                    self.batches += 1
+                    self.flush_latency.record(elapsed)
+                    self._compact()
+                    self._changed.notify_all()
+        finally:
+            tracker.close()
+            with self._lock:
+                self._stopped = True
+                self._changed.notify_all()
+
+    def _compact(self):
+        """
+        drop committed check-ins from the journal, called with the lock held
+        : an empty queue truncates the journal, a long committed start is cut off by rewriting the rest
+        """
+        if not self._queue:
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._committed_offset = 0
+            return
+        if self._committed_offset < self.compact_bytes:
+            return
+        self._file.seek(self._committed_offset)
+        rest = self._file.read()
+        replacement = self.journal + '.tmp'
+        with open(replacement, 'wb') as file:
+            file.write(rest)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(replacement, self.journal)
+        self._file.close()
+        self._file = open(self.journal, 'a+b')
+        shift = self._committed_offset
+        self._queue = deque((event, offset - shift) for event, offset in self._queue)
+        self._committed_offset = 0
+
+    def close(self):
+        """
+        commit the queued check-ins, stop the flusher and close the journal
+        : check-ins that could not be committed stay in the journal for the next start
+        """
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
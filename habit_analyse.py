@@ -1,133 +1,455 @@
-from habit_tracker import Habit
+import heapq
+import os
 import sqlite3
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+from habit_tracker import Habit, HabitBatch, as_date, period_offset, progress_bits, longest_run, current_run, \
+    completion_count
+from connection import ConnectionUser, SnapshotManager, uses_connection
+from instrumentation import instrumented
+from rollups import completion_rate, period_counts
+from optional import LAZY, resolve
 
+np = LAZY
 
-class HabitAnalyser:
-    def __init__(self, name='main.db', isolation_level=None):
+HABIT_COLUMNS = ('id', 'user_id', 'name', 'description', 'start_date', 'end_date', 'frequency', 'progress')
+
+# one list per column, one entry per habit
+StreakStats = namedtuple('StreakStats', ['name', 'longest', 'current', 'average'])
+
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['user_id', 'name', 'longest'])
+
+
+@lru_cache(maxsize=None)
+def _row_type(columns):
+    """
+    :param columns: tuple of habit column names
+    :return: namedtuple class for rows with these columns
+    """
+    return namedtuple('HabitRow', columns)
+
+
+def _last_offset(start_date, end_date, frequency, as_of):
+    """
+    period index streaks are measured up to
+    :return: index of the period containing as_of (or end_date if earlier), None if the dates cannot be read
+    """
+    try:
+        last_day = as_of if end_date is None else min(as_date(end_date), as_of)
+        return period_offset(start_date, last_day, frequency)
+    except (ValueError, TypeError):
+        return None
+
+
+def _streak_stats_python(bitmaps, offsets):
+    """
+    streak statistics one habit at a time with int bit operations
+    :param bitmaps: progress bitmap BLOBs
+    :param offsets: current period index per habit, see _last_offset
+    :return: (longest, current, average) lists
+    """
+    longest, current, average = [], [], []
+    for progress, offset in zip(bitmaps, offsets):
+        bits = progress_bits(progress)
+        runs = completion_count(bits & ~(bits << 1))
+        longest.append(longest_run(bits))
+        # the current period is still open, so a run ending in the previous one is still current
+        if offset is None or offset < 0:
+            current.append(0)
+        else:
+            current.append(current_run(bits, offset) or current_run(bits, offset - 1))
+        average.append(completion_count(bits) / runs if runs else 0.0)
+    return longest, current, average
+
+
+def _streak_stats_numpy(bitmaps, offsets):
+    """
+    streak statistics for all habits at once by run-length encoding one flat bit array
+    :param bitmaps: progress bitmap BLOBs
+    :param offsets: current period index per habit, see _last_offset
+    :return: (longest, current, average) lists
+    """
+    np = resolve(__name__, 'np', 'numpy')
+    count = len(bitmaps)
+    positions = np.array([-1 if offset is None or offset < 0 else offset for offset in offsets], dtype=np.int64)
+    # every habit gets at least one zero byte of padding so runs never cross into the next habit
+    sizes = np.array([len(progress or b'') for progress in bitmaps], dtype=np.int64)
+    sizes = np.maximum(sizes, (positions + 8) // 8) + 1
+    buffer = b''.join((progress or b'').ljust(size, b'\0') for progress, size in zip(bitmaps, sizes.tolist()))
+    bits = np.unpackbits(np.frombuffer(buffer, dtype=np.uint8), bitorder='little').astype(np.int8)
+    base = np.concatenate(([0], np.cumsum(sizes)[:-1])) * 8
+
+    edges = np.diff(bits, prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    owner = np.searchsorted(base, starts, side='right') - 1
+
+    longest = np.zeros(count, dtype=np.int64)
+    np.maximum.at(longest, owner, lengths)
+    runs = np.bincount(owner, minlength=count)
+    total = np.bincount(owner, weights=lengths, minlength=count)
+    average = np.divide(total, runs, out=np.zeros(count), where=runs > 0)
+
+    # the run covering the current period, or the previous one while the current period is still open
+    current = np.zeros(count, dtype=np.int64)
+    if starts.size:
+        for step in (0, 1):
+            position = base + positions - step
+            run = np.maximum(np.searchsorted(starts, position, side='right') - 1, 0)
+            found = (current == 0) & (positions - step >= 0) & (starts[run] <= position) & (ends[run] > position)
+            current[found] = position[found] - starts[run[found]] + 1
+    return longest.tolist(), current.tolist(), average.tolist()
+
+
+def _streak_stats(rows, as_of):
+    """
+    :param rows: (name, start_date, end_date, frequency, progress) rows ordered by name
+    :param as_of: day the current streak is measured at
+    :return: StreakStats with one list per column
+    """
+    bitmaps = [row[4] for row in rows]
+    offsets = [_last_offset(start_date, end_date, frequency, as_of)
+               for _, start_date, end_date, frequency, _ in rows]
+    engine = _streak_stats_numpy if rows and resolve(__name__, 'np', 'numpy') is not None else _streak_stats_python
+    longest, current, average = engine(bitmaps, offsets)
+    return StreakStats([row[0] for row in rows], longest, current, average)
+
+
+def _user_condition(user_id, column='user_id'):
+    """
+    :param user_id: a user, or None for all users
+    :return: (SQL condition, parameters) limiting a query to the user
+    """
+    if user_id is None:
+        return '1', []
+    return f'{column} = ?', [user_id]
+
+
+def _shard_streak_stats(path, low, high, as_of, user_id):
+    """
+    streak statistics of the habits with low <= id < high, run in a worker process
+    :param path: absolute path of the database file, opened read-only
+    :param user_id: a user, or None for all users
+    :return: (list of user ids, StreakStats of the shard) ordered by user and name
+    """
+    from urllib.request import pathname2url
+
+    condition, params = _user_condition(user_id)
+    conn = sqlite3.connect(f'file:{pathname2url(path)}?mode=ro', uri=True, detect_types=sqlite3.PARSE_DECLTYPES)
+    try:
+        rows = conn.execute(f'''
+            SELECT name, start_date, end_date, frequency, progress, user_id FROM habits
+            WHERE id >= ? AND id < ? AND {condition} ORDER BY user_id, name''', (low, high, *params)).fetchall()
+    finally:
+        conn.close()
+    return [row[5] for row in rows], _streak_stats([row[:5] for row in rows], as_of)
+
+
+class HabitAnalyser(ConnectionUser):
+    def __init__(self, name='main.db', isolation_level=None, manager=None, instrumentation=None, user_id='',
+                 snapshot=None, refresh_interval=None):
         """
         initialize a habit analyser object
         :param name: name of the database file
+        :param manager: ConnectionManager shared with other trackers and analysers, instead of a private connection
+        :param instrumentation: Instrumentation timing the public methods, None to disable
+        :param user_id: user whose habits are analysed, None to list and aggregate the habits of all users
+        :param snapshot: ':memory:' or a file path, e.g. on a tmpfs, to analyse a copy of the database instead
+        :param refresh_interval: seconds a snapshot is used before the next call takes a new one, None for never
         : create a connection to the database
         : create a cursor object to execute SQL commands
+        : create or migrate the tables to the current schema version
+        : with a snapshot, queries read a SnapshotManager copy and never hold locks writers wait for
+        """
+        self._snapshot = None
+        if snapshot is not None:
+            if manager is not None:
+                raise ValueError("an analyser reads either a snapshot or a shared manager")
+            manager = self._snapshot = SnapshotManager(name, snapshot, refresh_interval,
+                                                       instrumentation=instrumentation)
+        self._open(name, isolation_level, manager, instrumentation)
+        self.user_id = user_id
+
+    def refresh(self):
+        """
+        take a new snapshot now, see SnapshotManager.refresh
+        """
+        if self._snapshot is None:
+            raise ValueError("the analyser does not read a snapshot")
+        self._snapshot.refresh()
+
+    def close(self):
+        """
+        close the connection, and the snapshot the analyser owns
+        """
+        super().close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+    def _habit_user(self):
+        """
+        :return: user_id for looking up one habit by name
         """
-        self.conn = sqlite3.connect(name, isolation_level=isolation_level)
-        self.cursor = self.conn.cursor()
+        if self.user_id is None:
+            raise ValueError("looking up a habit by name needs an analyser with a user_id")
+        return self.user_id
 
-    def retrieve_habit(self):
+    @instrumented
+    @uses_connection()
+    def retrieve_habit(self, lazy=False, batch_size=500):
         """
         Get all habits from the database
+        :param lazy: read descriptions and progress only when they are first accessed
+        :param batch_size: number of lazy habits whose details are read together
         :return: List of Habit objects
+        : lazy habits need the analyser to be open until their details are read
+        """
+        condition, params = _user_condition(self.user_id)
+        if not lazy:
+            self.cursor.execute(f'SELECT name, description, start_date, end_date, frequency, progress FROM habits '
+                                f'WHERE {condition}', params)
+            return [Habit.from_row(row) for row in self.cursor]
+        batch = HabitBatch(self._habit_details, batch_size)
+        self.cursor.execute(f'SELECT id, name, start_date, end_date, frequency FROM habits WHERE {condition}', params)
+        return [Habit.deferred(*row, batch) for row in self.cursor.fetchall()]
+
+    @instrumented
+    @uses_connection()
+    def query_habits(self, columns=('name',), frequency=None, limit=None, offset=0):
         """
-        habits = []
-        self.cursor.execute('SELECT * FROM habits')
-        rows = self.cursor.fetchall()
-        for row in rows:
-            name = row[1]
-            description = row[2]
-            start_date = row[3]
-            end_date = row[4]
-            frequency = row[5]
-            progress = row[6]
-            habit = Habit(name, description, start_date, end_date, frequency, progress)
-            habits.append(habit)
-        return habits
-
-    def get_all_habits(self):
+        get selected columns of habits without building Habit objects
+        :param columns: names of the habit columns to return
+        :param frequency: only return habits with this periodicity
+        :param limit: maximum number of rows, all rows if None
+        :param offset: number of rows to skip, for paging through large result sets
+        :return: list of namedtuples with one field per column, ordered by user and name
+        """
+        columns = tuple(columns)
+        unknown = set(columns) - set(HABIT_COLUMNS)
+        if unknown:
+            raise ValueError(f"unknown habit columns: {', '.join(sorted(unknown))}")
+        condition, params = _user_condition(self.user_id)
+        sql = f'SELECT {", ".join(columns)} FROM habits WHERE {condition}'
+        if frequency is not None:
+            sql += ' AND frequency = ?'
+            params.append(frequency)
+        sql += ' ORDER BY user_id, name LIMIT ? OFFSET ?'
+        params += [-1 if limit is None else limit, offset]
+        self.cursor.execute(sql, params)
+        row_type = _row_type(columns)
+        return [row_type._make(row) for row in self.cursor.fetchall()]
+
+    @instrumented
+    @uses_connection()
+    def get_all_habits(self, limit=None, offset=0):
         """
         get all habits from the database
+        :param limit: maximum number of names, all names if None
+        :param offset: number of names to skip
         :return: habit_names
         """
-        habits = self.retrieve_habit()
-        # Get a list of just the habit names
-        habit_names = [h.name for h in habits]
-        return habit_names
+        return [row.name for row in self.query_habits(limit=limit, offset=offset)]
 
-    def get_habits_with_periodicity(self, frequency):
+    @instrumented
+    @uses_connection()
+    def get_habits_with_periodicity(self, frequency, limit=None, offset=0):
         """
         get habits with a specific periodicity from the database
         :param frequency: periodicity of the habit
-        :return: habits
+        :param limit: maximum number of habits, all habits if None
+        :param offset: number of habits to skip
+        :return: habits as (name, frequency) namedtuples
         """
-        self.cursor.execute('SELECT * FROM habits WHERE frequency = ?', (frequency,))
-        habits = self.retrieve_habit()
-        return habits
+        return self.query_habits(('name', 'frequency'), frequency=frequency, limit=limit, offset=offset)
 
     def get_streak(self, row, longest_streak):
         """
         Calculate the streak for a habit and update longest streak
-        :param row: Habit row from database
+        :param row: Habit row from database (name, description, start_date, end_date, frequency, progress)
         :param longest_streak: Longest streak across all habits
         :return: Updated the longest streak
         """
-        streak = 0
-        for date in eval(row[5]):
-            if date == row[3]:
-                streak += 1
-        else:
-            if streak > longest_streak:
-                longest_streak = streak
-        streak = 0
-        if streak > longest_streak:
-            longest_streak = streak
-        return longest_streak
+        return max(longest_streak, longest_run(progress_bits(row[5])))
+
+    @instrumented
+    @uses_connection()
+    def streak_stats(self, names=None, as_of=None):
+        """
+        longest, current and average streak of every habit
+        :param names: only include these habits, all habits if None
+        :param as_of: day the current streak is measured at, defaults to today
+        :return: StreakStats with one list per column, ordered by user and name
+        : uses NumPy when it is installed and plain int bit operations otherwise
+        """
+        condition, params = _user_condition(self.user_id)
+        if names is not None:
+            names = list(names)
+            condition += f" AND name IN ({', '.join('?' * len(names))})"
+            params += names
+        self.cursor.execute(f'''
+            SELECT name, start_date, end_date, frequency, progress FROM habits
+            WHERE {condition} ORDER BY user_id, name''', params)
+        return _streak_stats(self.cursor.fetchall(), as_of or date.today())
+
+    @instrumented
+    def parallel_streak_stats(self, workers=None, as_of=None):
+        """
+        streak_stats of all habits, computed by a pool of worker processes over ranges of habit ids
+        :param workers: number of worker processes, the number of CPUs if None
+        :param as_of: day the current streak is measured at, defaults to today
+        :return: StreakStats with one list per column, the same as streak_stats()
+        : every worker opens its own read-only connection, so only committed data is seen;
+        : an analyser of a snapshot file hands the workers that file
+        """
+        path = self.name if self._snapshot is None else self._snapshot.path
+        if path is None or path == ':memory:' or path.startswith('file:'):
+            raise ValueError("parallel analysis needs the path of a database file")
+        workers = workers or os.cpu_count() or 1
+        as_of = as_of or date.today()
+        # a few shards per worker keeps every process busy when some ranges hold longer histories
+        bounds = self._id_bounds(workers * 4)
+        if workers == 1 or len(bounds) <= 2:
+            return self.streak_stats(as_of=as_of)
+        from concurrent.futures import ProcessPoolExecutor
+
+        path = os.path.abspath(path)
+        count = len(bounds) - 1
+        with ProcessPoolExecutor(max_workers=min(workers, count)) as pool:
+            shards = list(pool.map(_shard_streak_stats, [path] * count, bounds[:-1], bounds[1:], [as_of] * count,
+                                   [self.user_id] * count))
+        merged = heapq.merge(*(zip(users, *stats) for users, stats in shards), key=lambda row: row[:2])
+        columns = [list(column) for column in zip(*merged)] or [[], [], [], [], []]
+        return StreakStats(*columns[1:])
+
+    @uses_connection()
+    def _id_bounds(self, shards):
+        """
+        split the habit ids into ranges holding about the same number of habits
+        :param shards: number of ranges
+        :return: sorted list of ids, range i covers bounds[i] <= id < bounds[i + 1]
+        """
+        self.cursor.execute('SELECT COUNT(*), MAX(id) FROM habits')
+        count, last = self.cursor.fetchone()
+        if not count:
+            return []
+        bounds = []
+        for shard in range(min(shards, count)):
+            self.cursor.execute('SELECT id FROM habits ORDER BY id LIMIT 1 OFFSET ?', (shard * count // shards,))
+            bound = self.cursor.fetchone()[0]
+            if not bounds or bound > bounds[-1]:
+                bounds.append(bound)
+        bounds.append(last + 1)
+        return bounds
 
+    @instrumented
+    @uses_connection()
     def get_longest_streak(self):
         """
         get the longest streak of all habits
         :return: max_streak
         """
-        habits = self.get_all_habits()
-        max_streak = 0
-        for habit in habits:
-            if isinstance(habit, Habit):
-                progress = eval(habit.progress)
-                current_streak = 0
-                for mark in progress:
-                    if mark == 1:
-                        current_streak += 1
-                    else:
-                        current_streak = 0
-                    max_streak = max(max_streak, current_streak)
-            else:
-                name = habit[0]
-                progress_index = 0
-                for i, field in enumerate(habit.split(',')):
-                    if field == 'progress':
-                        progress_index = i + 1
-                        break
-                habit = habit.split(',')
-                progress = habit[progress_index]
-                habit = Habit(name, progress=progress)
-                current_streak = 0
-                for mark in progress:
-                    if mark == 1:
-                        current_streak += 1
-                    else:
-                        current_streak = 0
-                    max_streak = max(max_streak, current_streak)
-        return max_streak
+        if self.user_id is None:
+            self.cursor.execute('SELECT MAX(longest_streak) FROM habit_stats')
+        else:
+            self.cursor.execute('''
+                SELECT MAX(habit_stats.longest_streak)
+                FROM habits JOIN habit_stats ON habit_stats.habit_id = habits.id
+                WHERE habits.user_id = ?''', (self.user_id,))
+        return self.cursor.fetchone()[0] or 0
+
+    @instrumented
+    @uses_connection()
+    def get_leaderboard(self, limit=10):
+        """
+        get the habits with the longest streaks
+        :param limit: maximum number of habits
+        :return: list of LeaderboardEntry(user_id, name, longest), longest first, ties ordered by user and name
+        """
+        condition, params = _user_condition(self.user_id, 'habits.user_id')
+        self.cursor.execute(f'''
+            SELECT habits.user_id, habits.name, habit_stats.longest_streak
+            FROM habit_stats JOIN habits ON habits.id = habit_stats.habit_id
+            WHERE {condition}
+            ORDER BY habit_stats.longest_streak DESC, habits.user_id, habits.name LIMIT ?''', (*params, limit))
+        return [LeaderboardEntry._make(row) for row in self.cursor.fetchall()]
 
+    @instrumented
+    @uses_connection()
     def get_longest_streak_for_habit(self, name):
         """
         get the longest streak for a specific habit
         :param name: name of the habit
         :return: max_streak
         """
-        habits = self.get_all_habits()
-        habits = [h for h in habits if not isinstance(h, str)]
-        if not habits:
-            return 0
-        habit = habits[0]
-        progress = eval(habit.progress)
+        self.cursor.execute('''
+            SELECT longest_streak FROM habit_stats
+            WHERE habit_id = (SELECT id FROM habits WHERE user_id = ? AND name = ?)''', (self._habit_user(), name))
+        row = self.cursor.fetchone()
+        return 0 if row is None else row[0]
 
-        max_streak = 0
-        current_streak = 0
-        for mark in progress:
-            if mark == 1:
-                current_streak += 1
-            else:
-                current_streak = 0
-            max_streak = max(max_streak, current_streak)
+    @instrumented
+    @uses_connection()
+    def get_completion_rate(self, name, as_of=None):
+        """
+        get the share of periods a habit was completed in
+        :param name: name of the habit
+        :param as_of: last day to count, defaults to today or the end date of the habit if that is earlier
+        :return: completion rate between 0 and 1, None if the habit is not tracked
+        """
+        self.cursor.execute('''
+            SELECT start_date, end_date, frequency, progress FROM habits
+            WHERE user_id = ? AND name = ?''', (self._habit_user(), name))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        start_date, end_date, frequency, progress = row
+        last_day = min(as_date(end_date), as_of or date.today())
+        periods = period_offset(start_date, last_day, frequency) + 1
+        if periods <= 0:
+            return 0.0
+        bits = progress_bits(progress) & ((1 << periods) - 1)
+        return completion_count(bits) / periods
 
-        return max_streak
+    @instrumented
+    @uses_connection()
+    def get_completion_rates(self, name, windows=(7, 30, 365), as_of=None):
+        """
+        get the share of the last days a habit was completed in, read from the weekly and monthly rollups
+        :param name: name of the habit
+        :param windows: window lengths in days
+        :param as_of: last day of every window, defaults to today or the end date of the habit if that is earlier
+        :return: dict of window length to completion rate, None if the habit is not tracked
+        : daily habits count completed days, weekly and monthly habits count completed periods the window touches;
+        : windows are cut to the days the habit ran
+        """
+        self.cursor.execute('SELECT id, start_date, end_date, frequency FROM habits WHERE user_id = ? AND name = ?',
+                            (self._habit_user(), name))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        habit_id, start_date, end_date, frequency = row
+        last_day = min(as_date(end_date), as_of or date.today())
+        return {days: completion_rate(self.cursor, habit_id, frequency,
+                                      max(last_day - timedelta(days=days - 1), as_date(start_date)), last_day)
+                for days in windows}
 
+    @instrumented
+    @uses_connection()
+    def get_trend(self, name, periods=12, frequency='weekly', as_of=None):
+        """
+        get the completed and checked-in days of a habit per calendar week or month
+        :param name: name of the habit
+        :param periods: number of periods
+        :param frequency: weekly or monthly
+        :param as_of: day in the most recent period, defaults to today
+        :return: list of PeriodCounts(start, completed, checked), oldest first, None if the habit is not tracked
+        """
+        if frequency not in ('weekly', 'monthly'):
+            raise ValueError("frequency must be weekly or monthly")
+        self.cursor.execute('SELECT id FROM habits WHERE user_id = ? AND name = ?', (self._habit_user(), name))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return period_counts(self.cursor, row[0], frequency, as_of or date.today(), periods)
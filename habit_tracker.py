@@ -1,7 +1,180 @@
-from datetime import date, timedelta
+from bisect import insort
+from datetime import date
+from itertools import islice
+from periods import FREQUENCIES, as_date, first_day, period_ordinal, start_period
+
+
+def period_offset(start_date, event_date, frequency):
+    """
+    number of calendar periods between the start of a habit and an event
+    :param start_date: date the habit was started
+    :param event_date: date of the event
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: period index of the event, negative for events before the start
+    """
+    return period_ordinal(event_date, frequency) - start_period(as_date(start_date), frequency)
+
+
+def period_start(start_date, offset, frequency):
+    """
+    first day of the period with the given index
+    :param start_date: date the habit was started
+    :param offset: period index
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: date the period begins on
+    """
+    return first_day(start_period(as_date(start_date), frequency) + offset, frequency)
+
+
+def progress_bits(progress):
+    """
+    read a stored progress bitmap
+    :param progress: bitmap BLOB, bit n set when period n after the start was completed
+    :return: bitmap as an int
+    """
+    return int.from_bytes(progress or b'', 'little')
+
+
+def encode_progress(offsets):
+    """
+    pack completed periods into a progress bitmap
+    :param offsets: iterable of completed period indexes, or an int bitmap
+    :return: bitmap BLOB
+    """
+    if isinstance(offsets, int):
+        bits = offsets
+    else:
+        bits = 0
+        for offset in offsets:
+            if offset >= 0:
+                bits |= 1 << offset
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def decode_progress(progress):
+    """
+    unpack a progress bitmap
+    :param progress: bitmap BLOB
+    :return: sorted list of completed period indexes
+    """
+    bits = progress_bits(progress)
+    offsets = []
+    while bits:
+        low = bits & -bits
+        offsets.append(low.bit_length() - 1)
+        bits ^= low
+    return offsets
+
+
+def completion_count(bits):
+    """
+    :param bits: progress bitmap as an int
+    :return: number of completed periods
+    """
+    return bin(bits).count('1')
+
+
+def longest_run(bits):
+    """
+    longest run of consecutive completed periods
+    :param bits: progress bitmap as an int
+    :return: length of the longest run
+    : each shift-and drops the last period of every run, so the loop runs once per period of the longest run
+    """
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def current_run(bits, offset):
+    """
+    run of consecutive completed periods ending at a given period
+    :param bits: progress bitmap as an int
+    :param offset: index of the last period of the run
+    :return: length of the run, 0 if that period was not completed
+    """
+    if offset < 0:
+        return 0
+    # the highest missed period at or before offset is where the run starts
+    gaps = ~bits & ((1 << (offset + 1)) - 1)
+    return offset - gaps.bit_length() + 1
+
+
+def progress_summary(bits):
+    """
+    streak figures of a progress bitmap
+    :param bits: progress bitmap as an int
+    :return: (current_streak, longest_streak, last_period, total_completions)
+    : current_streak is the run ending at last_period, which is None when nothing was completed
+    """
+    if not bits:
+        return 0, 0, None, 0
+    last_period = bits.bit_length() - 1
+    return current_run(bits, last_period), longest_run(bits), last_period, completion_count(bits)
+
+
+def progress_dates(start_date, frequency, progress):
+    """
+    :param start_date: date the habit was started
+    :param frequency: frequency of the habit
+    :param progress: progress bitmap BLOB
+    :return: first day of every completed period, empty if the start date cannot be read
+    """
+    if not progress:
+        return []
+    try:
+        # the first period may begin before the habit did
+        first = as_date(start_date)
+        return [max(period_start(first, offset, frequency), first) for offset in decode_progress(progress)]
+    except ValueError:
+        return []
+
+
+# value of a lazy attribute that has not been read from the store yet
+_UNLOADED = object()
+
+
+class HabitBatch:
+    """
+    lazy habits of one result set, whose description and progress are read from the store together
+    """
+    __slots__ = ('fetch', 'size', 'pending')
+
+    def __init__(self, fetch, size=500):
+        """
+        :param fetch: function taking a list of habit ids and returning (id, description, progress BLOB) rows
+        :param size: maximum number of habits loaded by one fetch
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.fetch = fetch
+        self.size = size
+        self.pending = {}
+
+    def add(self, habit_id, habit):
+        """
+        :param habit_id: id of the habit in the store
+        :param habit: ‘Habit’ object waiting for its description and progress
+        """
+        self.pending[habit_id] = habit
+
+    def load(self, habit_id):
+        """
+        load a habit together with the next habits of the result set that are still waiting
+        :param habit_id: id of the habit that was accessed
+        : habits deleted in the meantime get no description and an empty progress
+        """
+        ids = [habit_id] + [other for other in islice(self.pending, self.size) if other != habit_id][:self.size - 1]
+        details = {row[0]: row[1:] for row in self.fetch(ids)}
+        for other in ids:
+            self.pending.pop(other)._hydrate(*details.get(other, (None, None)))
 
 
 class Habit:
+    __slots__ = ('name', '_description', 'start_date', 'end_date', 'frequency', '_progress', '_completed', '_batch')
+
     def __init__(self, name: str, description: str = None, start_date: date = None, end_date: date = None,
                  frequency: str = None, progress: list = None):
         """
@@ -14,12 +187,84 @@ class Habit:
         :param frequency: frequency of the habit (daily, weekly, monthly)
         :param progress: list of dates the habit was completed
         """
+        self._batch = None
         self.name = name
         self.description = description
         self.start_date = start_date
         self.end_date = end_date
         self.frequency = frequency
-        self.progress = []
+        self.progress = progress or []
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        build a habit from a row of the habits table
+        :param row: (name, description, start_date, end_date, frequency, progress) with progress as a bitmap BLOB
+        :return: ‘Habit’ object, progress holds the first day of every completed period
+        """
+        name, description, start_date, end_date, frequency, progress = row
+        return cls(name, description, start_date, end_date, frequency, progress_dates(start_date, frequency, progress))
+
+    @classmethod
+    def deferred(cls, habit_id, name, start_date, end_date, frequency, batch):
+        """
+        build a habit whose description and progress are read from the store on first access
+        :param habit_id: id of the habit in the store
+        :param name: name of the habit
+        :param start_date: date the habit was started
+        :param end_date: date the habit was ended
+        :param frequency: frequency of the habit
+        :param batch: ‘HabitBatch’ of the result set the habit belongs to
+        :return: ‘Habit’ object
+        """
+        habit = cls(name, None, start_date, end_date, frequency)
+        habit._description = habit._progress = _UNLOADED
+        habit._batch = batch, habit_id
+        batch.add(habit_id, habit)
+        return habit
+
+    def _load(self):
+        batch, habit_id = self._batch
+        batch.load(habit_id)
+
+    def _hydrate(self, description, progress):
+        """
+        fill in the lazy attributes that were not assigned in the meantime
+        :param description: description read from the store
+        :param progress: progress bitmap BLOB read from the store
+        """
+        self._batch = None
+        if self._description is _UNLOADED:
+            self._description = description
+        if self._progress is _UNLOADED:
+            self.progress = progress_dates(self.start_date, self.frequency, progress)
+
+    @property
+    def description(self):
+        """
+        description of the habit
+        """
+        if self._description is _UNLOADED:
+            self._load()
+        return self._description
+
+    @description.setter
+    def description(self, description):
+        self._description = description
+
+    @property
+    def progress(self):
+        """
+        dates the habit was completed, in chronological order
+        """
+        if self._progress is _UNLOADED:
+            self._load()
+        return self._progress
+
+    @progress.setter
+    def progress(self, dates):
+        self._progress = sorted(dates)
+        self._completed = set(self._progress)
 
     def mark_complete(self, check_date: date):
         """
@@ -27,24 +272,22 @@ class Habit:
         :param check_date: date the habit was completed
         :return: None
         """
-        if check_date not in self.progress:
-            self.progress.append(check_date)
-            self.progress.sort()  # sort the progress list in chronological order
+        progress = self.progress
+        if check_date not in self._completed:
+            self._completed.add(check_date)
+            insort(progress, check_date)  # keep the progress list in chronological order
             if self.check_streak():
                 print("Streak!")
             else:
                 print("Habit Breaker")
 
-    def check_streak(self):
+    def check_streak(self, as_of: date = None):
         """
         check if the habit is currently on a streak
-        :return: True if the habit is on a streak, False otherwise
-        """
-        today = date.today()
-        if self.frequency == 'daily' and today == self.progress[-1] + timedelta(days=1):
-            return True
-        elif self.frequency == 'weekly' and today == self.progress[-1] + timedelta(weeks=1):
-            return True
-        elif self.frequency == 'monthly' and today == self.progress[-1] + timedelta(months=1):
-            return True
-        return False
+        :param as_of: day to judge the streak at, defaults to today
+        :return: True if the habit was last completed in the period before as_of, False otherwise
+        """
+        if not self.progress or self.frequency not in FREQUENCIES:
+            return False
+        current = period_ordinal(as_of or date.today(), self.frequency)
+        return current == period_ordinal(self.progress[-1], self.frequency) + 1
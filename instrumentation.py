@@ -0,0 +1,323 @@
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from functools import wraps
+
+# statements that end a transaction, and statements that commit by themselves outside of one
+_COMMIT_WORDS = ('COMMIT', 'END')
+_WRITE_WORDS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Histogram:
+    """
+    latency histogram with power-of-two microsecond buckets
+    """
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        :param seconds: one latency sample
+        """
+        index = int(seconds * 1e6).bit_length()
+        if index >= len(self.buckets):
+            self.buckets.extend([0] * (index + 1 - len(self.buckets)))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """
+        :param fraction: between 0 and 1, e.g. 0.95
+        :return: upper bound in seconds of the bucket holding that fraction of the samples
+        """
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << index) / 1e6, self.max)
+        return 0.0
+
+    def summary(self):
+        """
+        :return: dict with count, total, mean, max and p50/p95/p99 in seconds
+        """
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class _Timing:
+    """
+    latency and row counters of one method or SQL statement
+    """
+    __slots__ = ('histogram', 'rows_returned', 'rows_changed', 'vm_steps')
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.rows_returned = 0
+        self.rows_changed = 0
+        self.vm_steps = 0
+
+    def summary(self):
+        summary = self.histogram.summary()
+        summary.update(rows_returned=self.rows_returned, rows_changed=self.rows_changed, vm_steps=self.vm_steps)
+        return summary
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    cursor that reports statement latency and fetched rows to the Instrumentation of its connection
+    """
+
+    def execute(self, sql, parameters=()):
+        changes = self.connection.total_changes
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self.connection.instrumentation.statement(self, sql, parameters, time.perf_counter() - started, changes)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        changes = self.connection.total_changes
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self.connection.instrumentation.statement(self, sql, None, time.perf_counter() - started, changes)
+        return self
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.connection.instrumentation.returned(self, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.connection.instrumentation.returned(self, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.connection.instrumentation.returned(self, len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self.connection.instrumentation.returned(self, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    connection whose cursors, including those of Connection.execute, are InstrumentedCursor objects
+    """
+    instrumentation = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+class Instrumentation:
+    def __init__(self, slow_query=0.1, sink=None, explain=True, progress_steps=1000, max_slow_queries=100):
+        """
+        initialize a collector of latency and row statistics
+        :param slow_query: seconds after which a statement is recorded as a slow query
+        :param sink: path or writable text file receiving one JSON object per method call and slow query
+        :param explain: capture EXPLAIN QUERY PLAN output for slow queries
+        :param progress_steps: SQLite VM instructions between progress callbacks, 0 to not count them
+        :param max_slow_queries: number of most recent slow queries kept in memory
+        : pass the same object to HabitTracker, HabitAnalyser and ConnectionManager to collect everything in one place
+        """
+        self.slow_query = slow_query
+        self.explain = explain
+        self.progress_steps = progress_steps
+        self.methods = {}
+        self.statements = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self.commits = 0
+        self.traced = 0
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owns_sink = isinstance(sink, str)
+        self._sink = open(sink, 'a') if self._owns_sink else sink
+
+    def connect(self, *args, **kwargs):
+        """
+        sqlite3.connect with statement tracing, VM step counting and instrumented cursors
+        :return: InstrumentedConnection
+        """
+        conn = sqlite3.connect(*args, factory=InstrumentedConnection, **kwargs)
+        conn.instrumentation = self
+        ref = weakref.ref(conn)
+        conn.set_trace_callback(lambda statement: self._trace(ref(), statement))
+        if self.progress_steps:
+            conn.set_progress_handler(self._progress, self.progress_steps)
+        return conn
+
+    def _counters(self):
+        """
+        :return: per-thread [rows returned, rows changed, progress callbacks] since the thread started
+        """
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = [0, 0, 0]
+        return counters
+
+    def _timing(self, table, key):
+        timing = table.get(key)
+        if timing is None:
+            timing = table[key] = _Timing()
+        return timing
+
+    def _trace(self, conn, statement):
+        """
+        sqlite3 trace callback, runs as every statement starts
+        """
+        word = statement.lstrip()[:7].upper()
+        commit = word.startswith(_COMMIT_WORDS) or (
+            word.startswith(_WRITE_WORDS) and conn is not None and not conn.in_transaction)
+        with self._lock:
+            self.traced += 1
+            if commit:
+                self.commits += 1
+
+    def _progress(self):
+        """
+        sqlite3 progress handler, runs every progress_steps VM instructions
+        """
+        self._counters()[2] += 1
+        return 0
+
+    def call(self, name, method, owner, args, kwargs):
+        """
+        run and time one call of an instrumented method
+        :param name: qualified name of the method
+        """
+        counters = self._counters()
+        before = list(counters)
+        started = time.perf_counter()
+        try:
+            return method(owner, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            returned, changed, steps = (now - then for now, then in zip(counters, before))
+            with self._lock:
+                timing = self._timing(self.methods, name)
+                timing.histogram.record(elapsed)
+                timing.rows_returned += returned
+                timing.rows_changed += changed
+                timing.vm_steps += steps * self.progress_steps
+            if self._sink is not None:
+                self._emit({'event': 'method', 'name': name, 'seconds': elapsed, 'rows_returned': returned,
+                            'rows_changed': changed, 'vm_steps': steps * self.progress_steps})
+
+    def statement(self, cursor, sql, parameters, elapsed, changes_before):
+        """
+        record one execute or executemany of an InstrumentedCursor
+        :param parameters: parameters of execute, None for executemany
+        :param changes_before: total_changes of the connection before the statement ran
+        """
+        key = self._keys.get(sql)
+        if key is None:
+            key = self._keys[sql] = ' '.join(sql.split())
+        changes = cursor.connection.total_changes - changes_before
+        self._counters()[1] += changes
+        with self._lock:
+            timing = self._timing(self.statements, key)
+            timing.histogram.record(elapsed)
+            timing.rows_changed += changes
+        cursor.timing = timing
+        if elapsed >= self.slow_query:
+            self._slow(cursor.connection, key, sql, parameters, elapsed)
+
+    def returned(self, cursor, rows):
+        """
+        record rows fetched from an InstrumentedCursor
+        """
+        self._counters()[0] += rows
+        timing = getattr(cursor, 'timing', None)
+        if timing is not None:
+            with self._lock:
+                timing.rows_returned += rows
+
+    def _slow(self, conn, key, sql, parameters, elapsed):
+        plan = None
+        if self.explain and parameters is not None:
+            try:
+                # a plain cursor, so the EXPLAIN itself is not recorded
+                plan = [row[-1] for row in sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+            except sqlite3.Error:
+                pass
+        event = {'event': 'slow_query', 'sql': key, 'seconds': elapsed, 'plan': plan}
+        with self._lock:
+            self.slow_queries.append(event)
+        if self._sink is not None:
+            self._emit(event)
+
+    def _emit(self, event):
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock:
+            self._sink.write(line)
+
+    def stats(self):
+        """
+        :return: dict with per-method and per-statement summaries, commit and statement counts and slow queries
+        """
+        with self._lock:
+            return {
+                'methods': {name: timing.summary() for name, timing in self.methods.items()},
+                'statements': {sql: timing.summary() for sql, timing in self.statements.items()},
+                'commits': self.commits,
+                'statements_traced': self.traced,
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def reset(self):
+        """
+        forget everything recorded so far
+        """
+        with self._lock:
+            self.methods.clear()
+            self.statements.clear()
+            self.slow_queries.clear()
+            self.commits = self.traced = 0
+
+    def close(self):
+        """
+        close the sink if it was opened from a path
+        """
+        if self._owns_sink:
+            self._sink.close()
+
+
+def instrumented(method):
+    """
+    time a method of an object with an ``instrumentation`` attribute
+    : when the attribute is None the only cost is one attribute lookup per call
+    """
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return method(self, *args, **kwargs)
+        return instrumentation.call(name, method, self, args, kwargs)
+    return wrapper
@@ -1,12 +1,50 @@
+import argparse
+import json
+import sqlite3
+import sys
 from datetime import date
+from connection import ConnectionManager
 from db import HabitTracker
 from habit_analyse import HabitAnalyser
-import questionary
+from migrations import transaction
+from periods import FREQUENCIES, as_date
 
 
-def cli():
-    tracker = HabitTracker()
-    analyser = HabitAnalyser()
+def show_progress(tracker, name, page_size=20):
+    """
+    print the check-in history of a habit one page at a time
+    :param tracker: HabitTracker object
+    :param name: name of the habit
+    :param page_size: number of check-ins per page
+    """
+    import questionary
+
+    after = None
+    while True:
+        rows = tracker.history_page(name, after=after, limit=page_size)
+        if after is None and not rows:
+            print(f"No habit '{name}' currently tracked.")
+            return
+        if after is None:
+            print(f"Progress for habit '{name}':")
+        for event_date, completed in rows:
+            print(f"{event_date}: {'completed' if completed else 'missed'}")
+        if len(rows) < page_size or not questionary.confirm("Show more?").ask():
+            return
+        after = rows[-1][0]
+
+
+def cli(database='main.db'):
+    """
+    run the interactive menu
+    :param database: name of the database file
+    """
+    # questionary is only needed for the interactive menu, so scripted commands do not pay for importing it
+    import questionary
+
+    manager = ConnectionManager(database)
+    tracker = HabitTracker(manager=manager)
+    analyser = HabitAnalyser(manager=manager)
 
     stop = False
     while not stop:
@@ -34,7 +72,7 @@ def cli():
 
         elif choice == "Delete a habit":
             name = questionary.text("Enter habit name: ").ask()
-            habit = tracker.get_habit(name)
+            habit = tracker.get_habit(name, lazy=True)
             if habit is None:
                 print(f"No habit found with name '{name}'.")
             tracker.delete_habit(name)
@@ -43,7 +81,7 @@ def cli():
         elif choice == "Update a habit":
             while True:
                 name = questionary.text("Enter habit name: ").ask()
-                habit = tracker.get_habit(name)
+                habit = tracker.get_habit(name, lazy=True)
                 if habit is None:
                     print(f"Habit '{name}' not found.")
                 else:
@@ -102,11 +140,7 @@ def cli():
 
         elif choice == "View progress for a habit":
             name = questionary.text("Enter habit name: ").ask()
-            progress = tracker.get_tracker(name)
-            if progress is None:
-                print(f"No habit '{name}' currently tracked.")
-            else:
-                print(f"Progress for habit '{name}': {progress}")
+            show_progress(tracker, name)
 
         elif choice == "Choose from predefined habits":
             habit_names = tracker.predefined_habits()
@@ -121,7 +155,7 @@ def cli():
 
             if sub_choice_2 == "Update":
                 while True:
-                    habit = tracker.get_habit(selected_habit)
+                    habit = tracker.get_habit(selected_habit, lazy=True)
                     if habit is None:
                         print(f"Habit '{selected_habit}' not found.")
                     else:
@@ -135,14 +169,14 @@ def cli():
 
             elif sub_choice_2 == "Delete":
                 # Delete habit code
-                habit = tracker.get_habit(selected_habit)
+                habit = tracker.get_habit(selected_habit, lazy=True)
                 if habit is None:
                     print(f"No habit found with name '{selected_habit}'.")
                 tracker.delete_habit(selected_habit)
                 print(f"Habit '{selected_habit}' deleted.")
 
             elif sub_choice_2 == "Check":
-                habit = tracker.get_habit(selected_habit)
+                habit = tracker.get_habit(selected_habit, lazy=True)
                 event_date = date.today()
                 completed = questionary.confirm(
                     "Did you complete the habit today?").ask()  # define completed variable
@@ -150,16 +184,177 @@ def cli():
                 print(f"Habit '{selected_habit}' checked.")
 
             elif sub_choice_2 == "View Progress":
-                progress = tracker.get_tracker(selected_habit)
-                if progress is None:
-                    print(f"No habit '{selected_habit}' currently tracked.")
-                else:
-                    print(f"Progress for habit '{selected_habit}': {progress}")
+                show_progress(tracker, selected_habit)
 
         elif choice == "Exit":
             print("Goodbye!")
             stop = True
 
+    manager.close()
+
+
+def _add(tracker, analyser, name, start_date, end_date, frequency, description=''):
+    tracker.create_habit(name, description, as_date(start_date), as_date(end_date), frequency)
+    return []
+
+
+def _update(tracker, analyser, name, start_date, end_date, frequency, description=''):
+    tracker.update_habit(name, description, as_date(start_date), as_date(end_date), frequency)
+    return []
+
+
+def _delete(tracker, analyser, name):
+    tracker.delete_habit(name)
+    return []
+
+
+def _check(tracker, analyser, name, event_date=None, completed=True):
+    tracker.check_habit(name, as_date(event_date) or date.today(), bool(completed))
+    return []
+
+
+def _streak(tracker, analyser, name=None):
+    if name is None:
+        return [{'longest': analyser.get_longest_streak()}]
+    stats = tracker.get_stats(name)
+    if stats is None:
+        raise ValueError(f"no habit '{name}' currently tracked")
+    return [{'name': name, 'longest': stats.longest_streak, 'current': stats.current_streak}]
+
+
+def _list(tracker, analyser, frequency=None):
+    return [row._asdict() for row in analyser.query_habits(('name', 'frequency'), frequency=frequency)]
+
+
+def _import(tracker, analyser, directory):
+    habits, check_ins = tracker.import_data(directory)
+    return [{'habits': habits, 'check_ins': check_ins}]
+
+
+def _export(tracker, analyser, directory, file_format=None):
+    habits, check_ins = tracker.export_data(directory, file_format)
+    return [{'habits': habits, 'check_ins': check_ins}]
+
+
+# every command takes the tracker, the analyser and its arguments, and returns a list of JSON objects to print
+COMMANDS = {
+    'add': _add,
+    'update': _update,
+    'delete': _delete,
+    'check': _check,
+    'streak': _streak,
+    'list': _list,
+    'import': _import,
+    'export': _export,
+}
+
+
+def run_commands(database, commands, out=None):
+    """
+    run commands over one connection and in one transaction, nothing is written if one of them fails
+    :param database: name of the database file
+    :param commands: iterable of dicts with a 'command' key and the arguments of that command
+    :param out: text file the results are written to as JSON lines, sys.stdout if None
+    :return: number of commands run
+    """
+    out = out or sys.stdout
+    count = 0
+    with ConnectionManager(database, readers=1) as manager:
+        tracker = HabitTracker(manager=manager)
+        analyser = HabitAnalyser(manager=manager)
+        # reads made while the writer is held use the writer, so later commands see earlier ones
+        with manager.writer() as conn, transaction(conn):
+            for request in commands:
+                request = dict(request)
+                command = COMMANDS.get(request.pop('command', None))
+                if command is None:
+                    raise ValueError(f"command must be one of {', '.join(COMMANDS)}")
+                for result in command(tracker, analyser, **request):
+                    out.write(json.dumps(result) + '\n')
+                count += 1
+    return count
+
+
+def read_commands(lines):
+    """
+    parse JSON-lines commands, one object per line, blank lines are skipped
+    :param lines: iterable of str, e.g. sys.stdin
+    :return: generator of dicts
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}") from None
+        if not isinstance(request, dict):
+            raise ValueError(f"line {number}: expected a JSON object")
+        yield request
+
+
+def parser():
+    """
+    :return: argparse parser of the non-interactive commands
+    """
+    parser = argparse.ArgumentParser(description="Track habits. Without a command the interactive menu starts.")
+    parser.add_argument('--database', default='main.db', help='database file, main.db by default')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    for name, help_text in (('add', 'add a habit'), ('update', 'update a habit')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('name')
+        command.add_argument('--description', default='')
+        command.add_argument('--start', dest='start_date', required=True, help='YYYY-MM-DD')
+        command.add_argument('--end', dest='end_date', required=True, help='YYYY-MM-DD')
+        command.add_argument('--frequency', choices=FREQUENCIES, required=True)
+
+    command = commands.add_parser('delete', help='delete a habit')
+    command.add_argument('name')
+
+    command = commands.add_parser('check', help='check a habit in')
+    command.add_argument('name')
+    command.add_argument('--date', dest='event_date', help='YYYY-MM-DD, today by default')
+    command.add_argument('--missed', dest='completed', action='store_false', help='record the habit as missed')
+
+    command = commands.add_parser('streak', help='longest streak of a habit, or of all habits')
+    command.add_argument('name', nargs='?')
+
+    command = commands.add_parser('list', help='list habits')
+    command.add_argument('--frequency', choices=FREQUENCIES)
+
+    command = commands.add_parser('import', help='load habits and check-ins exported by export')
+    command.add_argument('directory')
+
+    command = commands.add_parser('export', help='write habits and check-ins as columnar files')
+    command.add_argument('directory')
+    command.add_argument('--format', dest='file_format', choices=('parquet', 'npz', 'csv'))
+
+    commands.add_parser('batch', help='run JSON-lines commands from stdin in one transaction, '
+                                      'e.g. {"command": "check", "name": "Read", "event_date": "2024-01-01"}')
+    return parser
+
+
+def main(argv=None):
+    """
+    run one command, a batch of JSON-lines commands from stdin, or the interactive menu
+    :param argv: command line arguments, sys.argv[1:] if None
+    :return: exit status
+    """
+    args = vars(parser().parse_args(argv))
+    database = args.pop('database')
+    command = args.get('command')
+    if command is None:
+        cli(database)
+        return 0
+    commands = read_commands(sys.stdin) if command == 'batch' else [args]
+    try:
+        run_commands(database, commands)
+    except (ValueError, TypeError, FileNotFoundError, sqlite3.Error) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
 
 if __name__ == "__main__":
-    cli()
+    sys.exit(main())
@@ -0,0 +1,389 @@
+import ast
+import re
+from contextlib import contextmanager
+from datetime import date
+from habit_tracker import decode_progress, encode_progress, period_start, progress_bits, progress_summary
+from periods import as_date, period_offsets
+from rollups import ORDINAL_SQL, rebuild_rollups
+
+BATCH_SIZE = 10000
+
+
+@contextmanager
+def transaction(conn):
+    """
+    run a block of statements inside one explicit transaction
+    :param conn: sqlite3 connection
+    : commits on success and rolls back on any error;
+    : inside a transaction that is already open, the enclosing block decides whether to commit
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def columns(conn, table):
+    """
+    get the column names of a table
+    :param conn: sqlite3 connection
+    :param table: name of the table
+    :return: list of column names
+    """
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def id_windows(conn, table, batch_size):
+    """
+    walk a table in ascending id order
+    :param conn: sqlite3 connection
+    :param table: name of a table with an INTEGER PRIMARY KEY called id
+    :param batch_size: number of rows per window
+    :return: generator of (low, high] id bounds, each covering at most batch_size rows
+    """
+    last = 0
+    while True:
+        high = conn.execute(
+            f'SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)',
+            (last, batch_size)).fetchone()[0]
+        if high is None:
+            return
+        yield last, high
+        last = high
+
+
+def _create_tables(conn, batch_size):
+    """
+    version 1: the original layout, keyed by habit name
+    """
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS habits (
+                name TEXT NOT NULL PRIMARY KEY,
+                description TEXT,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                frequency TEXT NOT NULL,
+                progress TEXT)''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracker (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                habit_name TEXT NOT NULL,
+                event_date DATE NOT NULL,
+                completed BOOLEAN NOT NULL,
+                FOREIGN KEY (habit_name) REFERENCES habits(name)
+            )''')
+
+
+def _normalize_tracker(conn, batch_size):
+    """
+    version 2: integer habit ids, tracker rows joined by habit_id and at most one check-in per habit and day
+    : ids are never reused, so a new habit cannot pick up rows left behind by a deleted one
+    : the habits table is small and rebuilt in one transaction, the tracker table is
+    : backfilled and de-duplicated in id windows so other connections can write between batches
+    """
+    if 'id' not in columns(conn, 'habits'):
+        with transaction(conn):
+            conn.execute('''
+                CREATE TABLE habits_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    description TEXT,
+                    start_date DATE NOT NULL,
+                    end_date DATE NOT NULL,
+                    frequency TEXT NOT NULL,
+                    progress TEXT)''')
+            conn.execute('''
+                INSERT INTO habits_new(name, description, start_date, end_date, frequency, progress)
+                SELECT name, description, start_date, end_date, frequency, progress FROM habits''')
+            conn.execute('DROP TABLE habits')
+            conn.execute('ALTER TABLE habits_new RENAME TO habits')
+
+    if 'habit_id' not in columns(conn, 'tracker'):
+        with transaction(conn):
+            conn.execute('ALTER TABLE tracker ADD COLUMN habit_id INTEGER REFERENCES habits(id)')
+
+    for low, high in id_windows(conn, 'tracker', batch_size):
+        with transaction(conn):
+            conn.execute('''
+                UPDATE tracker SET habit_id = (SELECT id FROM habits WHERE habits.name = tracker.habit_name)
+                WHERE id > ? AND id <= ? AND habit_id IS NULL''', (low, high))
+
+    # the covering index doubles as the lookup path for de-duplication below
+    with transaction(conn):
+        conn.execute('CREATE INDEX IF NOT EXISTS tracker_history ON tracker(habit_id, event_date, completed)')
+
+    # keep the latest check-in of each habit and day
+    for low, high in id_windows(conn, 'tracker', batch_size):
+        with transaction(conn):
+            conn.execute('''
+                DELETE FROM tracker
+                WHERE id > ? AND id <= ? AND habit_id IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM tracker AS newer
+                    WHERE newer.habit_id = tracker.habit_id
+                      AND newer.event_date = tracker.event_date
+                      AND newer.id > tracker.id)''', (low, high))
+
+    with transaction(conn):
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS tracker_habit_day ON tracker(habit_id, event_date)')
+
+
+def _legacy_offsets(text, start_date, frequency):
+    """
+    read a progress value stored as str(list) without evaluating it
+    :param text: either a list of 0/1 marks or a list of completion dates
+    :param start_date: start date of the habit, None if it cannot be parsed
+    :param frequency: frequency of the habit
+    :return: list of completed period indexes
+    """
+    dates = re.findall(r'date\((\d+),\s*(\d+),\s*(\d+)\)', text or '')
+    if dates:
+        marks = [date(*map(int, found)) for found in dates]
+    else:
+        try:
+            marks = ast.literal_eval(text or '[]')
+        except (ValueError, SyntaxError):
+            return []
+        if not isinstance(marks, (list, tuple)):
+            return []
+    offsets = []
+    for index, mark in enumerate(marks):
+        if isinstance(mark, (str, date)):
+            if start_date is not None:
+                offsets += _block_offsets(start_date, [mark], frequency)
+        elif mark:
+            offsets.append(index)
+    return offsets
+
+
+def _block_offsets(start_date, days, frequency):
+    """
+    period indexes as version 3 to 5 computed them, weeks being 7 day blocks from the start date
+    """
+    if frequency == 'weekly':
+        return [(as_date(day) - start_date).days // 7 for day in days]
+    return period_offsets(start_date, days, frequency)
+
+
+def _pack_progress(conn, batch_size):
+    """
+    version 3: habits.progress holds a completion bitmap instead of the text of a Python list
+    : completed check-ins already in the tracker table are folded into the bitmap
+    """
+    for low, high in id_windows(conn, 'habits', batch_size):
+        with transaction(conn):
+            rows = conn.execute("""
+                SELECT id, start_date, frequency, progress FROM habits
+                WHERE id > ? AND id <= ? AND typeof(progress) != 'blob'""", (low, high)).fetchall()
+            for habit_id, start_date, frequency, progress in rows:
+                try:
+                    start_date = as_date(start_date)
+                except ValueError:
+                    start_date = None
+                offsets = _legacy_offsets(progress, start_date, frequency)
+                if start_date is not None:
+                    offsets += _block_offsets(start_date, _completed_dates(conn, habit_id), frequency)
+                conn.execute('UPDATE habits SET progress = ? WHERE id = ?', (encode_progress(offsets), habit_id))
+
+
+def _completed_dates(conn, habit_id):
+    """
+    :return: list of the event dates of the completed check-ins of a habit
+    """
+    return [row[0] for row in conn.execute(
+        'SELECT event_date FROM tracker WHERE habit_id = ? AND completed ORDER BY event_date', (habit_id,))]
+
+
+def _index_frequency(conn, batch_size):
+    """
+    version 4: covering index for listing habits of one periodicity in name order
+    """
+    with transaction(conn):
+        conn.execute('CREATE INDEX IF NOT EXISTS habits_frequency ON habits(frequency, name)')
+
+
+def _create_stats(conn, batch_size):
+    """
+    version 5: per habit streak figures kept up to date by every check-in
+    """
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS habit_stats (
+                habit_id INTEGER PRIMARY KEY REFERENCES habits(id),
+                current_streak INTEGER NOT NULL,
+                longest_streak INTEGER NOT NULL,
+                last_period INTEGER,
+                total_completions INTEGER NOT NULL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS habit_stats_longest ON habit_stats(longest_streak)')
+    for low, high in id_windows(conn, 'habits', batch_size):
+        with transaction(conn):
+            rows = conn.execute('SELECT id, progress FROM habits WHERE id > ? AND id <= ?', (low, high)).fetchall()
+            conn.executemany('''
+                INSERT OR REPLACE INTO habit_stats(habit_id, current_streak, longest_streak, last_period,
+                                                   total_completions)
+                VALUES (?, ?, ?, ?, ?)''', [(habit_id, *progress_summary(progress_bits(progress)))
+                                             for habit_id, progress in rows])
+
+
+def _calendar_weeks(conn, batch_size):
+    """
+    version 6: weekly progress bitmaps count ISO calendar weeks instead of 7 day blocks from the start date
+    : block n begins in calendar week n, so only bits set by check-ins in the tracker move;
+    : bits kept from the old text format have no dates left and stay where they are
+    """
+    for low, high in id_windows(conn, 'habits', batch_size):
+        with transaction(conn):
+            rows = conn.execute("""
+                SELECT id, start_date, progress FROM habits
+                WHERE id > ? AND id <= ? AND frequency = 'weekly'""", (low, high)).fetchall()
+            for habit_id, start_date, progress in rows:
+                try:
+                    start_date = as_date(start_date)
+                except ValueError:
+                    continue
+                event_dates = _completed_dates(conn, habit_id)
+                if start_date.weekday() == 0 or not event_dates:
+                    continue
+                blocks = progress_bits(encode_progress(_block_offsets(start_date, event_dates, 'weekly')))
+                weeks = progress_bits(encode_progress(period_offsets(start_date, event_dates, 'weekly')))
+                bits = progress_bits(progress) & ~blocks | weeks
+                conn.execute('UPDATE habits SET progress = ? WHERE id = ?', (encode_progress(bits), habit_id))
+                conn.execute('''
+                    INSERT OR REPLACE INTO habit_stats(habit_id, current_streak, longest_streak, last_period,
+                                                       total_completions)
+                    VALUES (?, ?, ?, ?, ?)''', (habit_id, *progress_summary(bits)))
+
+
+def _create_rollups(conn, batch_size):
+    """
+    version 7: completed and checked-in days per habit and calendar week or month
+    """
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS habit_rollups (
+                habit_id INTEGER NOT NULL REFERENCES habits(id),
+                frequency TEXT NOT NULL,
+                period INTEGER NOT NULL,
+                completed INTEGER NOT NULL,
+                checked INTEGER NOT NULL,
+                PRIMARY KEY (habit_id, frequency, period)) WITHOUT ROWID''')
+    for low, high in id_windows(conn, 'habits', batch_size):
+        with transaction(conn):
+            rebuild_rollups(conn, low, high)
+
+
+def _user_scope(conn, batch_size):
+    """
+    version 8: habits belong to a user and names are unique per user, '' is the user of single-user databases
+    : a UNIQUE column constraint cannot be dropped, so the small habits table is rebuilt in one transaction
+    : with its ids kept, rows in the other tables stay attached
+    """
+    if 'user_id' in columns(conn, 'habits'):
+        return
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE habits_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL DEFAULT '',
+                name TEXT NOT NULL,
+                description TEXT,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                frequency TEXT NOT NULL,
+                progress BLOB,
+                UNIQUE (user_id, name))''')
+        conn.execute('''
+            INSERT INTO habits_new(id, name, description, start_date, end_date, frequency, progress)
+            SELECT id, name, description, start_date, end_date, frequency, progress FROM habits''')
+        conn.execute('DROP TABLE habits')
+        conn.execute('ALTER TABLE habits_new RENAME TO habits')
+        conn.execute('CREATE INDEX habits_frequency ON habits(user_id, frequency, name)')
+
+
+def _date_ordinals(conn, batch_size):
+    """
+    version 9: DATE columns hold day ordinals instead of ISO text, periods.convert_date reads them back as dates
+    : text that is not a date is left alone, a repeated day of the same habit keeps the row converted last
+    """
+    for table, fields in (('habits', ('start_date', 'end_date')), ('tracker', ('event_date',))):
+        for low, high in id_windows(conn, table, batch_size):
+            with transaction(conn):
+                for field in fields:
+                    conn.execute(f'''
+                        UPDATE OR REPLACE {table} SET {field} = {ORDINAL_SQL.format(field)}
+                        WHERE id > ? AND id <= ? AND typeof({field}) = 'text' AND julianday({field}) IS NOT NULL''',
+                                 (low, high))
+
+
+def _legacy_check_ins(conn, batch_size):
+    """
+    version 10: completed periods kept from the old text progress get a completed check-in on their first day
+    : the bitmap was their only record, so rebuilding it from the tracker table dropped them;
+    : a day that already has a check-in keeps it
+    """
+    for low, high in id_windows(conn, 'habits', batch_size):
+        with transaction(conn):
+            rows = conn.execute('''
+                SELECT id, name, start_date, frequency, progress FROM habits
+                WHERE id > ? AND id <= ?''', (low, high)).fetchall()
+            events = []
+            for habit_id, name, start_date, frequency, progress in rows:
+                try:
+                    start_date = as_date(start_date)
+                    tracked = set(period_offsets(start_date, _completed_dates(conn, habit_id), frequency))
+                except ValueError:
+                    continue
+                events += [(habit_id, name, max(period_start(start_date, offset, frequency), start_date))
+                           for offset in decode_progress(progress) if offset not in tracked]
+            conn.executemany('''
+                INSERT OR IGNORE INTO tracker(habit_id, habit_name, event_date, completed)
+                VALUES (?, ?, ?, 1)''', events)
+            if events:
+                rebuild_rollups(conn, low, high)
+
+
+MIGRATIONS = [
+    _create_tables,
+    _normalize_tracker,
+    _pack_progress,
+    _index_frequency,
+    _create_stats,
+    _calendar_weeks,
+    _create_rollups,
+    _user_scope,
+    _date_ordinals,
+    _legacy_check_ins,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """
+    get the schema version stored in the database file
+    :param conn: sqlite3 connection
+    :return: version number, 0 for a new or pre-versioning database
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, batch_size=BATCH_SIZE):
+    """
+    bring a database up to the current schema version
+    :param conn: sqlite3 connection
+    :param batch_size: number of rows touched per transaction while migrating large tables
+    :return: version the database was at before migrating
+    : every migration is safe to re-run, so an interrupted upgrade resumes where it stopped
+    """
+    version = schema_version(conn)
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[number - 1](conn, batch_size)
+        with transaction(conn):
+            conn.execute(f'PRAGMA user_version = {number}')
+    return version
@@ -0,0 +1,35 @@
+import importlib
+import sys
+
+# value of a module attribute holding an optional dependency that is imported on first use, see resolve;
+# setting the attribute to None makes the module act as if the dependency was not installed
+LAZY = object()
+
+_modules = {}
+
+
+def optional_module(name):
+    """
+    import an optional dependency the first time it is needed
+    :param name: dotted name of the module
+    :return: the module, None when it is not installed
+    : NumPy and pyarrow take longer to import than the rest of the app, and most CLI commands never use them
+    """
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    return _modules[name]
+
+
+def resolve(module, attribute, name):
+    """
+    get the optional dependency held by a module attribute, importing it while the attribute is still LAZY
+    :param module: name of the module holding the attribute, __name__ of the caller
+    :param attribute: name of the attribute, e.g. 'np'
+    :param name: dotted name of the dependency, e.g. 'numpy'
+    :return: the dependency, None when it is not installed or the attribute was set to None
+    """
+    value = getattr(sys.modules[module], attribute)
+    return optional_module(name) if value is LAZY else value
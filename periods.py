@@ -0,0 +1,125 @@
+import sqlite3
+from datetime import date, datetime
+from functools import lru_cache
+from optional import LAZY, resolve
+
+np = LAZY
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+# date(1970, 1, 1).toordinal(), numpy counts days from the Unix epoch
+_EPOCH_ORDINAL = 719163
+
+
+def as_date(value):
+    """
+    turn a stored date value into a date object
+    :param value: date object, ISO formatted string or day ordinal
+    :return: date object, or None when value is None
+    """
+    if value is None or type(value) is date:
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, int):
+        return date.fromordinal(value)
+    return date.fromisoformat(str(value)[:10])
+
+
+def convert_date(value):
+    """
+    sqlite3 converter of DATE columns
+    :param value: bytes of a day ordinal, or of an ISO formatted string written before schema version 9
+    :return: date object, or the text itself when it is not a date, so one bad row does not break a query
+    """
+    if value.isdigit():
+        return date.fromordinal(int(value))
+    text = value.decode()
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        return text
+
+
+# DATE columns hold day ordinals, so range filters and sorting compare integers;
+# connections opened with detect_types=sqlite3.PARSE_DECLTYPES read them back as date objects
+sqlite3.register_adapter(date, date.toordinal)
+sqlite3.register_converter('DATE', convert_date)
+
+
+def period_ordinal(day, frequency):
+    """
+    number of the calendar period a day falls in
+    :param day: date object or ISO formatted string
+    :param frequency: daily, weekly (ISO weeks, starting on Monday) or monthly (calendar months)
+    :return: int that grows by one from each period to the next
+    """
+    day = as_date(day)
+    if frequency == 'weekly':
+        # date(1, 1, 1) is a Monday, so whole weeks since then are ISO weeks
+        return (day.toordinal() - 1) // 7
+    if frequency == 'monthly':
+        return day.year * 12 + day.month - 1
+    return day.toordinal()
+
+
+def period_ordinals(days, frequency):
+    """
+    period_ordinal over a sequence of days
+    :param days: sequence of date objects or ISO formatted strings
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: list of period ordinals
+    : uses NumPy datetime64 arithmetic when it is installed
+    """
+    np = resolve(__name__, 'np', 'numpy')
+    if np is not None and len(days):
+        try:
+            values = np.asarray(days, dtype='datetime64[D]')
+        except ValueError:
+            values = None
+        if values is not None:
+            if frequency == 'monthly':
+                return (values.astype('datetime64[M]').astype(np.int64) + 1970 * 12).tolist()
+            ordinals = values.astype(np.int64) + _EPOCH_ORDINAL
+            if frequency == 'weekly':
+                ordinals = (ordinals - 1) // 7
+            return ordinals.tolist()
+    return [period_ordinal(day, frequency) for day in days]
+
+
+def first_day(ordinal, frequency):
+    """
+    first day of a calendar period
+    :param ordinal: period ordinal
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: date object
+    """
+    if frequency == 'weekly':
+        return date.fromordinal(ordinal * 7 + 1)
+    if frequency == 'monthly':
+        return date(ordinal // 12, ordinal % 12 + 1, 1)
+    return date.fromordinal(ordinal)
+
+
+@lru_cache(maxsize=4096)
+def start_period(start_date, frequency):
+    """
+    period ordinal of the start date of a habit, cached because every check-in and streak needs it
+    :param start_date: date object or ISO formatted string
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: period ordinal
+    """
+    return period_ordinal(start_date, frequency)
+
+
+def period_offsets(start_date, days, frequency):
+    """
+    period indexes of many days relative to the start of a habit
+    :param start_date: start date of the habit
+    :param days: sequence of date objects or ISO formatted strings
+    :param frequency: frequency of the habit (daily, weekly, monthly)
+    :return: list of period indexes, negative for days before the start period
+    """
+    base = start_period(as_date(start_date), frequency)
+    return [ordinal - base for ordinal in period_ordinals(days, frequency)]
+
@@ -0,0 +1,154 @@
+from collections import namedtuple
+from datetime import timedelta
+from periods import as_date, first_day, period_ordinal
+
+ROLLUP_FREQUENCIES = ('weekly', 'monthly')
+
+# day ordinal of a DATE column, which holds ISO text before schema version 9;
+# julianday('0001-01-01') is 1721425.5 and date(1, 1, 1).toordinal() is 1
+ORDINAL_SQL = "(CASE typeof({0}) WHEN 'integer' THEN {0} ELSE CAST(julianday({0}) - 1721424.5 AS INTEGER) END)"
+
+# period of a DATE column computed by SQLite, the same numbers as periods.period_ordinal
+PERIOD_SQL = {
+    'weekly': f"({ORDINAL_SQL} - 1) / 7",
+    'monthly': f"CAST(strftime('%Y', {ORDINAL_SQL} + 1721424.5) AS INTEGER) * 12"
+               f" + CAST(strftime('%m', {ORDINAL_SQL} + 1721424.5) AS INTEGER) - 1",
+}
+
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO habit_rollups(habit_id, frequency, period, completed, checked) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(habit_id, frequency, period) DO UPDATE SET
+        completed = completed + excluded.completed, checked = checked + excluded.checked
+'''
+
+# completed and checked-in days of one habit in one calendar week or month
+PeriodCounts = namedtuple('PeriodCounts', ['start', 'completed', 'checked'])
+
+
+def record_check_in(cursor, habit_id, event_date, completed, previous):
+    """
+    add one check-in to the week and month rollups of a habit
+    :param cursor: sqlite3 cursor inside the transaction that wrote the check-in
+    :param habit_id: id of the habit
+    :param event_date: date of the check-in
+    :param completed: boolean value written
+    :param previous: completed value of the check-in it replaced, None if it is the first for that day
+    """
+    delta = int(bool(completed)) - int(bool(previous))
+    checked = int(previous is None)
+    if delta or checked:
+        event_date = as_date(event_date)
+        cursor.executemany(ROLLUP_UPSERT_SQL, [(habit_id, frequency, period_ordinal(event_date, frequency), delta,
+                                                checked) for frequency in ROLLUP_FREQUENCIES])
+
+
+def rebuild_rollups(cursor, low=None, high=None, first=None, last=None):
+    """
+    recompute rollups from the tracker table
+    :param cursor: sqlite3 cursor or connection
+    :param low: only habits with an id above low
+    :param high: only habits with an id up to high
+    :param first: first event date to cover, widened to the start of its week and month
+    :param last: last event date to cover, widened to the end of its week and month
+    """
+    for frequency in ROLLUP_FREQUENCIES:
+        tracker_where = ['habit_id IN (SELECT id FROM habits)']
+        rollup_where = ['frequency = ?']
+        tracker_params, rollup_params = [], [frequency]
+        if low is not None:
+            tracker_where.append('habit_id > ?')
+            rollup_where.append('habit_id > ?')
+            tracker_params.append(low)
+            rollup_params.append(low)
+        if high is not None:
+            tracker_where.append('habit_id <= ?')
+            rollup_where.append('habit_id <= ?')
+            tracker_params.append(high)
+            rollup_params.append(high)
+        if first is not None:
+            period = period_ordinal(first, frequency)
+            tracker_where.append('event_date >= ?')
+            rollup_where.append('period >= ?')
+            tracker_params.append(first_day(period, frequency))
+            rollup_params.append(period)
+        if last is not None:
+            period = period_ordinal(last, frequency)
+            tracker_where.append('event_date < ?')
+            rollup_where.append('period <= ?')
+            tracker_params.append(first_day(period + 1, frequency))
+            rollup_params.append(period)
+        cursor.execute(f'DELETE FROM habit_rollups WHERE {" AND ".join(rollup_where)}', rollup_params)
+        cursor.execute(f'''
+            INSERT INTO habit_rollups(habit_id, frequency, period, completed, checked)
+            SELECT habit_id, ?, {PERIOD_SQL[frequency].format('event_date')} AS period, SUM(completed), COUNT(*)
+            FROM tracker WHERE {" AND ".join(tracker_where)}
+            GROUP BY habit_id, period''', [frequency, *tracker_params])
+
+
+def _completed_days(cursor, habit_id, first, last):
+    """
+    :return: number of completed check-ins between first and last, both included, read from the tracker
+    """
+    if first > last:
+        return 0
+    cursor.execute('''
+        SELECT COUNT(*) FROM tracker
+        WHERE habit_id = ? AND event_date >= ? AND event_date <= ? AND completed''', (habit_id, first, last))
+    return cursor.fetchone()[0]
+
+
+def completion_rate(cursor, habit_id, frequency, first, last):
+    """
+    share of a date range a habit was completed in
+    :param cursor: sqlite3 cursor
+    :param habit_id: id of the habit
+    :param frequency: frequency of the habit
+    :param first: first day of the range
+    :param last: last day of the range
+    :return: completed days per day for daily habits, completed periods per period touching the range otherwise
+    """
+    if first > last:
+        return 0.0
+    if frequency in ROLLUP_FREQUENCIES:
+        low, high = period_ordinal(first, frequency), period_ordinal(last, frequency)
+        cursor.execute('''
+            SELECT COUNT(*) FROM habit_rollups
+            WHERE habit_id = ? AND frequency = ? AND period >= ? AND period <= ? AND completed > 0''',
+                       (habit_id, frequency, low, high))
+        return cursor.fetchone()[0] / (high - low + 1)
+
+    # whole weeks come from the rollups, the days around them from the tracker
+    low, high = period_ordinal(first, 'weekly'), period_ordinal(last, 'weekly')
+    if first_day(low, 'weekly') < first:
+        low += 1
+    if first_day(high + 1, 'weekly') - timedelta(days=1) > last:
+        high -= 1
+    if low > high:
+        completed = _completed_days(cursor, habit_id, first, last)
+    else:
+        cursor.execute('''
+            SELECT COALESCE(SUM(completed), 0) FROM habit_rollups
+            WHERE habit_id = ? AND frequency = 'weekly' AND period >= ? AND period <= ?''', (habit_id, low, high))
+        completed = cursor.fetchone()[0]
+        completed += _completed_days(cursor, habit_id, first, first_day(low, 'weekly') - timedelta(days=1))
+        completed += _completed_days(cursor, habit_id, first_day(high + 1, 'weekly'), last)
+    return completed / ((last - first).days + 1)
+
+
+def period_counts(cursor, habit_id, frequency, last, periods):
+    """
+    completed and checked-in days of a habit per calendar period
+    :param cursor: sqlite3 cursor
+    :param habit_id: id of the habit
+    :param frequency: weekly or monthly
+    :param last: day in the most recent period
+    :param periods: number of periods
+    :return: list of PeriodCounts, oldest first, periods without check-ins count zero
+    """
+    high = period_ordinal(last, frequency)
+    low = high - periods + 1
+    cursor.execute('''
+        SELECT period, completed, checked FROM habit_rollups
+        WHERE habit_id = ? AND frequency = ? AND period >= ? AND period <= ?''', (habit_id, frequency, low, high))
+    counts = {period: (completed, checked) for period, completed, checked in cursor.fetchall()}
+    return [PeriodCounts(first_day(period, frequency), *counts.get(period, (0, 0))) for period in range(low, high + 1)]
@@ -0,0 +1,201 @@
+import heapq
+import threading
+from collections import namedtuple
+from datetime import date
+from periods import FREQUENCIES, as_date, first_day, period_ordinal
+from habit_tracker import period_start
+
+# what the scheduler needs of a habit, one row per habit; last_period is the offset of the last completed period
+SCHEDULE_SQL = '''
+    SELECT habits.user_id, habits.name, habits.start_date, habits.end_date, habits.frequency,
+           habit_stats.last_period
+    FROM habits LEFT JOIN habit_stats ON habit_stats.habit_id = habits.id
+'''
+
+# a habit that has not been completed in the period starting on due
+DueHabit = namedtuple('DueHabit', ['due', 'user_id', 'name', 'frequency', 'overdue'])
+
+
+def next_due(start_date, end_date, frequency, last_period):
+    """
+    first day of the first period of a habit that is not completed yet
+    :param start_date: date the habit was started
+    :param end_date: date the habit was ended
+    :param frequency: frequency of the habit
+    :param last_period: period index of the last completed period, None if there is none
+    :return: date object, None when no period before the end date is left or the dates cannot be read
+    """
+    try:
+        start_date, end_date = as_date(start_date), as_date(end_date)
+    except (ValueError, TypeError):
+        return None
+    if frequency not in FREQUENCIES or start_date is None:
+        return None
+    due = max(period_start(start_date, 0 if last_period is None else last_period + 1, frequency), start_date)
+    if end_date is not None and due > end_date:
+        return None
+    return due
+
+
+class Scheduler:
+    """
+    habits ordered by the day they are next due, kept in one heap
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: function called by emit with a list of DueHabit tuples
+        : a habit that is checked, updated or deleted gets a new heap entry and its old one is marked stale;
+        : the heap is rebuilt once stale entries outnumber live ones
+        """
+        self.callback = callback
+        self._heap = []
+        # (user_id, name) -> heap entry [due, user_id, name, frequency, notified, live]
+        self._entries = {}
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, rows):
+        """
+        schedule many habits at once
+        :param rows: iterable of (user_id, name, start_date, end_date, frequency, last_period), see SCHEDULE_SQL
+        """
+        with self._lock:
+            for row in rows:
+                self._set(*row)
+            self._compact(force=True)
+
+    def update(self, user_id, name, start_date, end_date, frequency, last_period):
+        """
+        schedule a habit again after it was created, checked or changed
+        :param user_id: user of the habit
+        :param name: name of the habit
+        :param start_date: date the habit was started
+        :param end_date: date the habit was ended
+        :param frequency: frequency of the habit
+        :param last_period: period index of the last completed period, None if there is none
+        """
+        with self._lock:
+            self._set(user_id, name, start_date, end_date, frequency, last_period, push=True)
+            self._compact()
+
+    def remove(self, user_id, name):
+        """
+        stop scheduling a habit
+        :param user_id: user of the habit
+        :param name: name of the habit
+        """
+        with self._lock:
+            self._drop((user_id, name))
+            self._compact()
+
+    def _set(self, user_id, name, start_date, end_date, frequency, last_period, push=False):
+        key = (user_id, name)
+        due = next_due(start_date, end_date, frequency, last_period)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == due and entry[3] == frequency:
+            return
+        self._drop(key)
+        if due is None:
+            return
+        entry = [due, user_id, name, frequency, False, True]
+        self._entries[key] = entry
+        if push:
+            heapq.heappush(self._heap, entry)
+        else:
+            self._heap.append(entry)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[5] = False
+            self._stale += 1
+
+    def _compact(self, force=False):
+        """
+        drop stale entries, restoring the heap order after load appended entries unordered
+        """
+        if force or self._stale > len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[5]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _walk(self, as_of):
+        """
+        live entries due on or before as_of, earliest first
+        : only nodes due by as_of and their children are visited, O(k log k) for k of them instead of O(n)
+        """
+        heap = self._heap
+        frontier = [(heap[0][:3], 0)] if heap and heap[0][0] <= as_of else []
+        while frontier:
+            _, index = heapq.heappop(frontier)
+            entry = heap[index]
+            if entry[5]:
+                yield entry
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap) and heap[child][0] <= as_of:
+                    heapq.heappush(frontier, (heap[child][:3], child))
+
+    @staticmethod
+    def _due_habit(entry, as_of):
+        due, user_id, name, frequency = entry[:4]
+        return DueHabit(due, user_id, name, frequency, due < first_day(period_ordinal(as_of, frequency), frequency))
+
+    def due(self, as_of=None, limit=None, overdue=False):
+        """
+        habits not completed in a period that has begun by as_of
+        :param as_of: day to judge at, defaults to today
+        :param limit: maximum number of habits, all if None
+        :param overdue: only habits with a whole period passed without completion
+        :return: list of DueHabit, earliest due first
+        """
+        as_of = as_of or date.today()
+        found = []
+        with self._lock:
+            for entry in self._walk(as_of):
+                habit = self._due_habit(entry, as_of)
+                if habit.overdue or not overdue:
+                    found.append(habit)
+                    if limit is not None and len(found) >= limit:
+                        break
+        return found
+
+    def overdue(self, as_of=None, limit=None):
+        """
+        :return: due habits with a whole period passed without completion, see due
+        """
+        return self.due(as_of, limit, overdue=True)
+
+    def next_due(self):
+        """
+        :return: DueHabit of the habit due first, judged on its due day, None if nothing is scheduled
+        """
+        with self._lock:
+            while self._heap and not self._heap[0][5]:
+                heapq.heappop(self._heap)
+                self._stale -= 1
+            return self._due_habit(self._heap[0], self._heap[0][0]) if self._heap else None
+
+    def emit(self, as_of=None, batch_size=1000):
+        """
+        hand the habits that became due since they were last emitted to the callback
+        :param as_of: day to judge at, defaults to today
+        :param batch_size: maximum number of DueHabit tuples per callback call
+        :return: number of habits emitted
+        : a habit is emitted once per due day, checking or updating it schedules it again
+        """
+        if self.callback is None:
+            raise ValueError("the scheduler has no callback")
+        as_of = as_of or date.today()
+        with self._lock:
+            batch = []
+            for entry in self._walk(as_of):
+                if not entry[4]:
+                    entry[4] = True
+                    batch.append(self._due_habit(entry, as_of))
+        for start in range(0, len(batch), batch_size):
+            self.callback(batch[start:start + batch_size])
+        return len(batch)
@@ -0,0 +1,166 @@
+import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from connection import ConnectionManager
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+from migrations import transaction
+
+
+def shard_index(user_id, shards):
+    """
+    :param user_id: id of a user
+    :param shards: number of shards
+    :return: index of the shard that stores the habits of the user
+    : blake2b is used instead of hash(), which is salted per process and would move users between runs
+    """
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+class ShardRouter:
+    def __init__(self, paths, readers=4, **manager_options):
+        """
+        initialize a router spreading the habits of many users over several database files
+        :param paths: names of the database files, one per shard, in a fixed order
+        :param readers: maximum number of reader connections per shard
+        :param manager_options: further keyword arguments for each ConnectionManager
+        : every user lives in exactly one shard, so (user_id, name) stays unique across all of them
+        : changing the number or order of paths moves users to other shards, their data is not moved along
+        """
+        paths = list(paths)
+        if not paths:
+            raise ValueError("at least one shard is needed")
+        self.paths = paths
+        self.managers = [ConnectionManager(path, readers=readers, **manager_options) for path in paths]
+
+    def shard(self, user_id):
+        """
+        :param user_id: id of a user
+        :return: index of the shard of the user
+        """
+        return shard_index(user_id, len(self.managers))
+
+    def manager(self, user_id):
+        """
+        :param user_id: id of a user
+        :return: ConnectionManager of the shard of the user
+        """
+        return self.managers[self.shard(user_id)]
+
+    def tracker(self, user_id, **options):
+        """
+        :param user_id: id of a user
+        :param options: further keyword arguments for HabitTracker, such as cache_size
+        :return: HabitTracker of the user sharing the connections of their shard
+        """
+        return HabitTracker(manager=self.manager(user_id), user_id=user_id, **options)
+
+    def analyser(self, user_id):
+        """
+        :param user_id: id of a user
+        :return: HabitAnalyser of the user sharing the connections of their shard
+        """
+        return HabitAnalyser(manager=self.manager(user_id), user_id=user_id)
+
+    def check_habits_bulk(self, events, chunk_size=1000):
+        """
+        check habits of many users, writing to the shards in parallel
+        :param events: iterable of (user_id, habit_name, event_date, completed) tuples
+        :param chunk_size: number of rows handed to each executemany call
+        :return: dict of shard index to the number of rows written there
+        : every shard commits its check-ins in one transaction of its own, a failing shard does not undo the others
+        """
+        grouped = {}
+        for user_id, name, event_date, completed in events:
+            users = grouped.setdefault(self.shard(user_id), {})
+            users.setdefault(user_id, []).append((name, event_date, completed))
+        if not grouped:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(grouped)) as pool:
+            futures = {shard: pool.submit(self._check_shard, shard, users, chunk_size)
+                       for shard, users in grouped.items()}
+            return {shard: future.result() for shard, future in futures.items()}
+
+    def _check_shard(self, shard, users, chunk_size):
+        """
+        write the check-ins of the users of one shard in one transaction
+        :param users: dict of user_id to (habit_name, event_date, completed) tuples
+        :return: number of rows written
+        """
+        manager = self.managers[shard]
+        written = 0
+        with manager.writer() as conn, transaction(conn):
+            for user_id, events in users.items():
+                tracker = HabitTracker(manager=manager, user_id=user_id)
+                written += sum(tracker.check_habits_bulk(events, chunk_size=chunk_size))
+        return written
+
+    def close(self):
+        """
+        close the connections of all shards
+        """
+        for manager in self.managers:
+            manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ShardedAnalyser:
+    def __init__(self, router):
+        """
+        initialize an analyser over the habits of all users in all shards
+        :param router: ShardRouter whose shards are queried
+        : every query runs on all shards at the same time and the partial results are merged
+        """
+        self.router = router
+        self.analysers = [HabitAnalyser(manager=manager, user_id=None) for manager in router.managers]
+
+    def _fan_out(self, method, *args, **kwargs):
+        """
+        :return: list with the result of the method on every shard, in shard order
+        """
+        with ThreadPoolExecutor(max_workers=len(self.analysers)) as pool:
+            return list(pool.map(lambda analyser: getattr(analyser, method)(*args, **kwargs), self.analysers))
+
+    def get_longest_streak(self):
+        """
+        get the longest streak of all habits of all users
+        :return: max_streak
+        """
+        return max(self._fan_out('get_longest_streak'))
+
+    def query_habits(self, columns=('name',), frequency=None):
+        """
+        get selected columns of the habits of all users
+        :param columns: names of the habit columns to return
+        :param frequency: only return habits with this periodicity
+        :return: list of (user_id, *columns) namedtuples ordered by user and name
+        """
+        columns = ('user_id', *(column for column in columns if column != 'user_id'))
+        if 'name' not in columns:
+            columns += ('name',)
+        shards = self._fan_out('query_habits', columns, frequency=frequency)
+        return list(heapq.merge(*shards, key=lambda row: (row.user_id, row.name)))
+
+    def get_all_habits(self):
+        """
+        get the habits of all users
+        :return: list of (user_id, name) tuples ordered by user and name
+        """
+        return [(row.user_id, row.name) for row in self.query_habits()]
+
+    def get_leaderboard(self, limit=10):
+        """
+        get the habits with the longest streaks among all users
+        :param limit: maximum number of habits
+        :return: list of LeaderboardEntry(user_id, name, longest), longest first, ties ordered by user and name
+        : each shard returns its own top entries, the overall top is among them
+        """
+        shards = self._fan_out('get_leaderboard', limit)
+        merged = heapq.merge(*shards, key=lambda entry: (-entry.longest, entry.user_id, entry.name))
+        return list(merged)[:limit]
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import date, timedelta
+from async_api import AsyncHabitTracker, AsyncHabitAnalyser
+from db import HabitTracker
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncHabitTracker:
+    def test_group_commit(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'async.db')
+        batches = []
+        bulk = HabitTracker.check_habits_bulk
+
+        def spy(self, events, chunk_size=1000):
+            batches.append(len(events))
+            return bulk(self, events, chunk_size)
+
+        monkeypatch.setattr(HabitTracker, 'check_habits_bulk', spy)
+
+        async def scenario():
+            tracker = AsyncHabitTracker(path, commit_window=0.05)
+            analyser = AsyncHabitAnalyser(path)
+            await tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            await asyncio.gather(*(tracker.check_habit("Read", date(2020, 1, 1) + timedelta(days=day), True)
+                                   for day in range(30)))
+            habit = await tracker.get_habit("Read")
+            longest = await analyser.get_longest_streak_for_habit("Read")
+            await tracker.close()
+            await analyser.close()
+            return habit, longest
+
+        habit, longest = run(scenario())
+        assert batches == [30]
+        assert len(habit.progress) == 30
+        assert longest == 30
+
+    def test_writes_in_call_order(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'async.db')
+        calls = []
+        bulk, update = HabitTracker.check_habits_bulk, HabitTracker.update_habit
+
+        def spy_bulk(self, events, chunk_size=1000):
+            calls.append('bulk')
+            return bulk(self, events, chunk_size)
+
+        def spy_update(self, *args):
+            calls.append('update')
+            return update(self, *args)
+
+        monkeypatch.setattr(HabitTracker, 'check_habits_bulk', spy_bulk)
+        monkeypatch.setattr(HabitTracker, 'update_habit', spy_update)
+
+        async def scenario():
+            tracker = AsyncHabitTracker(path, commit_window=60)
+            await tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            pending = asyncio.ensure_future(tracker.check_habit("Read", date(2020, 1, 1), True))
+            await asyncio.sleep(0)
+            await tracker.update_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 1, 31), "daily")
+            await pending
+            await tracker.close()
+
+        run(scenario())
+        assert calls == ['bulk', 'update']
+
+    def test_failed_check_in_is_isolated(self, tmp_path):
+        path = str(tmp_path / 'async.db')
+
+        async def scenario():
+            tracker = AsyncHabitTracker(path)
+            await tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            results = await asyncio.gather(tracker.check_habit("Read", date(2020, 1, 1), True),
+                                           tracker.check_habit("Read", object(), True),
+                                           return_exceptions=True)
+            tracker_row = await tracker.get_tracker("Read")
+            await tracker.close()
+            return results, tracker_row
+
+        results, tracker_row = run(scenario())
+        assert results[0] is None
+        assert isinstance(results[1], Exception)
+        assert tracker_row == ("Read", date(2020, 1, 1), 1)
+
+    def test_cancelled_check_in_in_failed_batch(self, tmp_path):
+        path = str(tmp_path / 'async.db')
+
+        async def scenario():
+            tracker = AsyncHabitTracker(path, commit_window=60)
+            await tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            cancelled = asyncio.ensure_future(tracker.check_habit("Read", date(2020, 1, 1), True))
+            failing = asyncio.ensure_future(tracker.check_habit("Read", object(), True))
+            kept = asyncio.ensure_future(tracker.check_habit("Read", date(2020, 1, 2), True))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await tracker.close()
+            results = await asyncio.wait_for(asyncio.gather(cancelled, failing, kept, return_exceptions=True), 5)
+            return results
+
+        cancelled, failing, kept = run(scenario())
+        assert isinstance(cancelled, asyncio.CancelledError)
+        assert isinstance(failing, Exception)
+        assert kept is None
+        assert HabitTracker(path).get_stats("Read").total_completions == 2
+
+    def test_close_commits_pending(self, tmp_path):
+        path = str(tmp_path / 'async.db')
+
+        async def scenario():
+            tracker = AsyncHabitTracker(path, commit_window=60)
+            await tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            pending = asyncio.ensure_future(tracker.check_habit("Read", date(2020, 1, 1), True))
+            await asyncio.sleep(0)
+            await tracker.close()
+            await pending
+
+        run(scenario())
+        assert HabitTracker(path).get_tracker("Read") == ("Read", date(2020, 1, 1), 1)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from synthetic import habit_specs, check_in_events, generate  # noqa: E402
+from suite import SCENARIOS, run_suite, compare  # noqa: E402
+from startup import import_summary, import_times, time_to_first_query  # noqa: E402
+
+# seconds a fresh process may take to answer its first query, generous enough for a loaded CI machine
+STARTUP_BUDGET = 2.0
+
+
+class TestBenchmarks:
+    def test_synthetic_history(self):
+        specs = list(habit_specs(users=2, habits=7, years=1))
+        assert len(specs) == 14
+        assert {spec[4] for spec in specs} == {'daily', 'weekly', 'monthly'}
+        events = list(check_in_events(specs[:1], completion=1.0))
+        assert len(events) == 365
+        assert events == list(check_in_events(specs[:1], completion=1.0))
+
+    def test_suite(self, tmp_path):
+        path = str(tmp_path / 'bench.db')
+        habits, events = generate(path, users=1, habits=6, years=1)
+        assert habits == 6 and events > 0
+        results = run_suite(path, repeat=1, sample=3)
+        assert set(results) == set(SCENARIOS)
+        assert compare(results, {'results': results}, threshold=1.25) == []
+
+    def test_cold_start(self, tmp_path):
+        summary = import_summary(import_times('main'))
+        assert summary['eager'] == []
+        assert summary['slowest'][0]['self'] >= summary['slowest'][-1]['self']
+        timings = time_to_first_query(str(tmp_path / 'startup.db'), repeat=2)
+        assert timings['wall']['runs'] == 2
+        assert timings['wall']['median'] < STARTUP_BUDGET
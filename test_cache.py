@@ -0,0 +1,102 @@
+import pytest
+from datetime import date
+from cache import LRUCache
+from db import HabitTracker, HabitStats
+
+
+class TestLRUCache:
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.store('a', 1)
+        cache.store('b', 2)
+        assert cache.lookup('a') == (True, 1)
+        cache.store('c', 3)
+        assert cache.lookup('b') == (False, None)
+        assert cache.lookup('c') == (True, 3)
+        assert cache.stats() == {'hits': 2, 'misses': 1, 'evictions': 1, 'size': 2}
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = LRUCache(maxsize=4, ttl=10, clock=lambda: now[0])
+        cache.store('a', None)
+        assert cache.lookup('a') == (True, None)
+        now[0] = 10.0
+        assert cache.lookup('a') == (False, None)
+        assert cache.stats()['size'] == 0
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.store('a', 1)
+        cache.store('b', 2)
+        cache.invalidate('a')
+        assert cache.lookup('a')[0] is False
+        cache.invalidate()
+        assert cache.lookup('b')[0] is False
+
+    def test_store_after_invalidate(self):
+        cache = LRUCache()
+        generation = cache.generation('a')
+        cache.invalidate('a')
+        cache.store('a', 1, generation)
+        assert cache.lookup('a') == (False, None)
+        generation = cache.generation('a')
+        cache.invalidate()
+        cache.store('a', 1, generation)
+        assert cache.lookup('a') == (False, None)
+        cache.store('a', 2, cache.generation('a'))
+        assert cache.lookup('a') == (True, 2)
+
+    def test_maxsize(self):
+        with pytest.raises(ValueError):
+            LRUCache(maxsize=0)
+
+
+class TestTrackerCache:
+    def test_write_through(self, tmp_path):
+        tracker = HabitTracker(name=str(tmp_path / 'cache.db'), cache_size=16)
+        assert tracker.get_habit("Read") is None
+        tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        assert tracker.get_habit("Read").description == "Read daily"
+        habit = tracker.get_habit("Read")
+        habit.progress = [date(2020, 1, 5)]
+        # callers get their own habit, changing it does not change the cached one
+        assert tracker.get_habit("Read") is not habit
+        assert tracker.get_habit("Read").progress == []
+
+        tracker.check_habit("Read", date(2020, 1, 1), True)
+        assert tracker.get_habit("Read").progress == [date(2020, 1, 1)]
+        assert tracker.get_stats("Read") == HabitStats(1, 1, 0, 1)
+        tracker.check_habits_bulk([("Read", date(2020, 1, 2), True)])
+        assert tracker.get_stats("Read") == HabitStats(2, 2, 1, 2)
+
+        tracker.update_habit("Read", "Read weekly", date(2020, 1, 1), date(2020, 12, 31), "weekly")
+        assert tracker.get_habit("Read").frequency == "weekly"
+        tracker.delete_habit("Read")
+        assert tracker.get_habit("Read") is None
+        assert tracker.get_stats("Read") is None
+        assert tracker.cache_info()['hits'] == 3
+        tracker.close()
+
+    def test_write_during_load(self, tmp_path, monkeypatch):
+        tracker = HabitTracker(name=str(tmp_path / 'cache.db'), cache_size=16)
+        tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        load = tracker._load_habit
+
+        def racing_load(habit_name):
+            row = load(habit_name)
+            # another thread commits a change after the row was read
+            tracker.update_habit("Read", "Read weekly", date(2020, 1, 1), date(2020, 12, 31), "weekly")
+            return row
+
+        monkeypatch.setattr(tracker, '_load_habit', racing_load)
+        assert tracker.get_habit("Read").frequency == "daily"
+        monkeypatch.setattr(tracker, '_load_habit', load)
+        assert tracker.get_habit("Read").frequency == "weekly"
+        tracker.close()
+
+    def test_disabled(self, tmp_path):
+        tracker = HabitTracker(name=str(tmp_path / 'cache.db'))
+        tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        assert tracker.get_habit("Read") is not tracker.get_habit("Read")
+        assert tracker.cache_info() is None
+        tracker.close()
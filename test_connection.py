@@ -0,0 +1,62 @@
+import pytest
+import sqlite3
+import threading
+from datetime import date, timedelta
+from connection import ConnectionManager
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+
+
+@pytest.fixture
+def manager(tmp_path):
+    with ConnectionManager(str(tmp_path / 'pool.db'), readers=2) as manager:
+        yield manager
+
+
+class TestConnectionManager:
+    def test_pragmas(self, manager):
+        with manager.writer() as conn:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+        with manager.reader() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM habits")
+
+    def test_shared_by_tracker_and_analyser(self, manager):
+        tracker = HabitTracker(manager=manager)
+        analyser = HabitAnalyser(manager=manager)
+        tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        tracker.check_habit("Read", date(2020, 1, 1), True)
+        assert analyser.get_all_habits() == ["Read"]
+        assert analyser.get_longest_streak() == 1
+        assert tracker.conn is None
+
+    def test_worker_threads(self, manager):
+        tracker = HabitTracker(manager=manager)
+        analyser = HabitAnalyser(manager=manager)
+        names = [f"Habit {i}" for i in range(4)]
+        for name in names:
+            tracker.create_habit(name, "", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        errors = []
+
+        def work(name):
+            try:
+                for day in range(20):
+                    tracker.check_habit(name, date(2020, 1, 1) + timedelta(days=day), True)
+                    analyser.get_longest_streak_for_habit(name)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert analyser.streak_stats().longest == [20] * 4
+
+    def test_closed(self, tmp_path):
+        manager = ConnectionManager(str(tmp_path / 'closed.db'))
+        manager.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            HabitAnalyser(manager=manager).get_all_habits()
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+from db import HabitTracker
+from event_buffer import BufferedHabitTracker
+
+START = date(2024, 1, 1)
+
+
+def create(path):
+    tracker = HabitTracker(path)
+    tracker.create_habit("Read", "", START, START + timedelta(days=100), "daily")
+    return tracker
+
+
+def check_ins(tracker):
+    return tracker.conn.execute('SELECT event_date, completed FROM tracker ORDER BY event_date').fetchall()
+
+
+class TestBufferedHabitTracker:
+    def test_batches_check_ins(self, tmp_path):
+        path = str(tmp_path / 'buffer.db')
+        tracker = create(path)
+        buffer = BufferedHabitTracker(path, flush_interval=0.5, max_batch=20)
+        for day in range(30):
+            buffer.check_habit("Read", START + timedelta(days=day), True)
+        assert buffer.flush(timeout=10)
+        stats = buffer.stats()
+        assert (stats['queue_depth'], stats['flushed'], stats['errors']) == (0, 30, 0)
+        assert stats['batches'] == stats['flush_latency']['count'] <= 3
+        assert tracker.get_stats("Read").longest_streak == 30
+        buffer.close()
+        with open(path + '.journal', 'rb') as journal:
+            assert journal.read() == b''
+        tracker.close()
+
+    def test_replays_journal(self, tmp_path):
+        path = str(tmp_path / 'buffer.db')
+        tracker = create(path)
+        # a crash left two acknowledged check-ins and half of a third
+        with open(path + '.journal', 'wb') as journal:
+            journal.write(b'["Read", "2024-01-01", true]\n["Read", "2024-01-02", true]\n["Read", "2024-')
+        with BufferedHabitTracker(path, flush_interval=0.01) as buffer:
+            buffer.check_habit("Read", "2024-01-03", False)
+            assert buffer.flush(timeout=10)
+        assert check_ins(tracker) == [(date(2024, 1, 1), 1), (date(2024, 1, 2), 1), (date(2024, 1, 3), 0)]
+        tracker.close()
+
+    def test_compacts_committed_start(self, tmp_path):
+        path = str(tmp_path / 'buffer.db')
+        tracker = create(path)
+        # one check-in per transaction, the journal is rewritten whenever later ones are still queued
+        with BufferedHabitTracker(path, flush_interval=0.001, max_batch=1, compact_bytes=1) as buffer:
+            for day in range(50):
+                buffer.check_habit("Read", START + timedelta(days=day), day % 2 == 0)
+        assert buffer.stats()['batches'] == 50
+        assert len(check_ins(tracker)) == 50
+        assert tracker.get_stats("Read").total_completions == 25
+        with open(path + '.journal', 'rb') as journal:
+            assert journal.read() == b''
+        tracker.close()
@@ -1,8 +1,9 @@
 import pytest
 import sqlite3
-from habit_tracker import Habit
+from habit_tracker import Habit, HabitBatch, encode_progress, decode_progress, progress_bits, longest_run, current_run
 from datetime import date
 from db import HabitTracker
+import habit_analyse
 from habit_analyse import HabitAnalyser
 
 
@@ -33,6 +34,48 @@ class TestHabit:
         create_habit.mark_complete(date(2023, 5, 8))
         assert create_habit.check_streak() == True
 
+    def test_mark_complete_out_of_order(self, create_habit):
+        for day in (5, 2, 5, 3):
+            create_habit.mark_complete(date(2020, 1, day))
+        assert create_habit.progress == [date(2020, 1, 2), date(2020, 1, 3), date(2020, 1, 5)]
+        assert not hasattr(create_habit, '__dict__')
+
+    def test_from_row(self):
+        habit = Habit.from_row(("Read", "Read daily", "2020-01-01", "2020-01-31", "weekly", encode_progress([0, 2])))
+        assert habit.name == "Read"
+        assert habit.frequency == "weekly"
+        assert habit.progress == [date(2020, 1, 1), date(2020, 1, 13)]
+
+    def test_deferred(self):
+        fetched = []
+
+        def fetch(ids):
+            fetched.append(ids)
+            return [(habit_id, f"Habit {habit_id}", encode_progress([habit_id])) for habit_id in ids if habit_id != 3]
+
+        batch = HabitBatch(fetch, size=2)
+        habits = [Habit.deferred(habit_id, f"Habit {habit_id}", date(2020, 1, 1), None, "daily", batch)
+                  for habit_id in (1, 2, 3)]
+        habits[1].description = "changed"
+        assert habits[0].progress == [date(2020, 1, 2)] and fetched == [[1, 2]]
+        assert (habits[1].description, habits[1].progress) == ("changed", [date(2020, 1, 3)])
+        # a habit deleted before its details were read
+        assert (habits[2].description, habits[2].progress) == (None, [])
+        assert fetched == [[1, 2], [3]]
+
+    def test_progress_bitmap(self):
+        blob = encode_progress([0, 1, 2, 4, 9])
+        assert isinstance(blob, bytes) and len(blob) == 2
+        assert decode_progress(blob) == [0, 1, 2, 4, 9]
+        assert decode_progress(encode_progress([])) == []
+
+    def test_runs(self):
+        bits = progress_bits(encode_progress([0, 1, 2, 4, 5, 9]))
+        assert longest_run(bits) == 3
+        assert current_run(bits, 5) == 2
+        assert current_run(bits, 6) == 0
+        assert longest_run(0) == 0
+
 
 @pytest.fixture
 def reset_db():
@@ -40,6 +83,8 @@ def reset_db():
     print("Resetting database!")
     conn = sqlite3.connect('Test.db')
     conn.execute("DROP TABLE IF EXISTS habits")
+    conn.execute("DROP TABLE IF EXISTS tracker")
+    conn.execute("PRAGMA user_version = 0")
     conn.execute("""
         CREATE TABLE habits (
             name text PRIMARY KEY, 
@@ -75,6 +120,10 @@ class TestHabitTracker:
         tracker.create_habit("Test 41", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
         habit = tracker.get_habit("Test 41")
         assert habit.name == "Test 41"
+        tracker.check_habit("Test 41", date(2020, 1, 2), True)
+        lazy = tracker.get_habit("Test 41", lazy=True)
+        assert (lazy.description, lazy.progress) == ("Test habit", [date(2020, 1, 2)])
+        assert tracker.get_habit("Missing", lazy=True) is None
 
     def test_get_tracker(self, tracker, reset_db):
         tracker.create_habit("Test 42", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
@@ -85,18 +134,95 @@ class TestHabitTracker:
             assert row[2] == date(2020, 1, 5)
             assert row[3] == True
 
+    def test_iter_history(self, tracker, reset_db):
+        tracker.create_habit("Test 51", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        tracker.check_habits_bulk([("Test 51", date(2020, 1, day), day % 3 != 0) for day in range(1, 11)])
+        history = list(tracker.iter_history("Test 51", batch_size=3))
+        assert len(history) == 10
+        assert history[0] == (date(2020, 1, 1), 1)
+        assert history[2] == (date(2020, 1, 3), 0)
+        window = list(tracker.iter_history("Test 51", start=date(2020, 1, 4), end=date(2020, 1, 7), batch_size=2))
+        assert [event_date for event_date, _ in window] == [date(2020, 1, day) for day in range(4, 8)]
+        assert tracker.history_page("Test 51", after="2020-01-09") == [(date(2020, 1, 10), 1)]
+
     def test_check_habit(self, tracker, reset_db):
         tracker.create_habit("Test 43", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
         habit = tracker.check_habit("Test 43", date(2020, 1, 5), True)
         if habit is not None:
             assert habit.progress == [date(2020, 1, 5)]
 
+    def test_check_habit_progress(self, tracker, reset_db):
+        tracker.create_habit("Test 47", "Test habit", date(2020, 1, 1), date(2020, 3, 31), "weekly")
+        tracker.check_habit("Test 47", date(2020, 1, 2), True)
+        tracker.check_habit("Test 47", date(2020, 1, 3), False)
+        tracker.check_habit("Test 47", date(2020, 1, 16), True)
+        row = reset_db.execute("SELECT progress FROM habits WHERE name='Test 47'").fetchone()
+        assert decode_progress(row[0]) == [0, 2]
+        tracker.check_habit("Test 47", date(2020, 1, 16), False)
+        row = reset_db.execute("SELECT progress FROM habits WHERE name='Test 47'").fetchone()
+        assert decode_progress(row[0]) == [0]
+
+    def test_habit_stats(self, tracker, reset_db):
+        tracker.create_habit("Test 48", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        for day in (1, 2, 3, 5, 6):
+            tracker.check_habit("Test 48", date(2020, 1, day), True)
+        stats = "SELECT current_streak, longest_streak, last_period, total_completions FROM habit_stats"
+        assert reset_db.execute(stats).fetchone() == (2, 3, 5, 5)
+        # a back-dated check-in joins the two runs
+        tracker.check_habit("Test 48", date(2020, 1, 4), True)
+        assert reset_db.execute(stats).fetchone() == (6, 6, 5, 6)
+        tracker.check_habit("Test 48", date(2020, 1, 6), False)
+        assert reset_db.execute(stats).fetchone() == (5, 5, 4, 5)
+
+    def test_rebuild_stats(self, tracker, reset_db):
+        tracker.create_habit("Test 49", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        tracker.create_habit("Test 50", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "weekly")
+        tracker.check_habits_bulk([("Test 49", date(2020, 1, day), True) for day in range(1, 4)])
+        tracker.check_habit("Test 50", date(2020, 1, 9), True)
+        assert tracker.rebuild_stats() == []
+        reset_db.execute("UPDATE habit_stats SET longest_streak = 10")
+        reset_db.commit()
+        assert tracker.rebuild_stats() == ["Test 49", "Test 50"]
+        assert reset_db.execute("SELECT MAX(longest_streak) FROM habit_stats").fetchone()[0] == 3
+
+    def test_rebuild_keeps_legacy_progress(self, reset_db):
+        reset_db.execute("INSERT INTO habits VALUES ('read', '', '2020-01-01', '2020-01-31', 'daily', "
+                         "'[1, 1, 1, 1, 1]')")
+        reset_db.commit()
+        tracker = HabitTracker(name='Test.db', isolation_level=None)
+        assert tracker.get_stats("read").longest_streak == 5
+        assert tracker.rebuild_stats() == []
+        assert tracker.get_stats("read").longest_streak == 5
+        tracker.close()
+
+    def test_check_habits_bulk(self, tracker, reset_db):
+        tracker.create_habit("Test 46", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        events = [("Test 46", date(2020, 1, day), day % 2 == 0) for day in range(1, 11)]
+        counts = tracker.check_habits_bulk(events, chunk_size=4)
+        assert counts == [4, 4, 2]
+        assert not tracker.conn.in_transaction
+        row = reset_db.execute("SELECT COUNT(*) FROM tracker WHERE habit_name='Test 46'")
+        assert row.fetchone()[0] == 10
+
     def test_delete_habit(self, tracker, reset_db):
         tracker.create_habit("Test 44", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
         tracker.delete_habit("Test 44")
         new_row = reset_db.execute("SELECT * FROM habits WHERE name='Test'")
         assert new_row.fetchone() is None
 
+    def test_delete_habit_drops_history(self, tmp_path):
+        tracker = HabitTracker(name=str(tmp_path / 'delete.db'))
+        tracker.create_habit("Old", "", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        tracker.check_habits_bulk([("Old", date(2020, 1, 1), True), ("Old", date(2020, 1, 2), True)])
+        tracker.delete_habit("Old")
+        tracker.create_habit("New", "", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        assert list(tracker.iter_history("New")) == []
+        assert tracker.get_tracker("New") is None
+        assert tracker.get_stats("New") is None
+        assert tracker.conn.execute('SELECT COUNT(*) FROM habit_rollups').fetchone()[0] == 0
+        assert tracker.conn.execute("SELECT COUNT(*) FROM tracker WHERE habit_name = 'Old'").fetchone()[0] == 0
+        tracker.close()
+
     def test_update_habit(self, tracker, reset_db):
         tracker.create_habit("Test 45", "Test habit", date(2020, 1, 1), date(2020, 1, 31), "daily")
         reset_db.commit()
@@ -113,8 +239,8 @@ class TestHabitTracker:
 
 @pytest.fixture
 def habit_analyser(reset_db):
-    analyser = HabitAnalyser(name='Test.db', isolation_level=None)
     setup_test_data(reset_db)
+    analyser = HabitAnalyser(name='Test.db', isolation_level=None)
     return analyser
 
 
@@ -144,4 +270,36 @@ class TestHabitAnalyser:
     def test_get_longest_streak_for_habit(self, habit_analyser):
         assert habit_analyser.get_longest_streak_for_habit('gym') > 0
 
+    def test_retrieve_habit_lazy(self, habit_analyser):
+        eager = habit_analyser.retrieve_habit()
+        lazy = habit_analyser.retrieve_habit(lazy=True, batch_size=1)
+        assert [(habit.name, habit.frequency, habit.description, habit.progress) for habit in lazy] == \
+            [(habit.name, habit.frequency, habit.description, habit.progress) for habit in eager]
+
+    def test_query_habits_paging(self, habit_analyser):
+        assert habit_analyser.get_all_habits() == ['gym', 'read']
+        assert habit_analyser.get_all_habits(limit=1, offset=1) == ['read']
+        rows = habit_analyser.get_habits_with_periodicity('weekly')
+        assert rows == [('gym', 'weekly')]
+        assert rows[0].name == 'gym'
+        with pytest.raises(ValueError):
+            habit_analyser.query_habits(('name; DROP TABLE habits',))
+
+    def test_streak_stats(self, habit_analyser):
+        stats = habit_analyser.streak_stats(as_of=date(2020, 1, 5))
+        assert stats.name == ['gym', 'read']
+        assert stats.longest == [5, 5]
+        assert stats.current == [0, 5]
+        assert stats.average == [5.0, 5.0]
+
+    def test_streak_stats_without_numpy(self, habit_analyser, monkeypatch):
+        expected = habit_analyser.streak_stats(as_of=date(2020, 1, 20))
+        monkeypatch.setattr(habit_analyse, 'np', None)
+        assert habit_analyser.streak_stats(as_of=date(2020, 1, 20)) == expected
+
+    def test_get_completion_rate(self, habit_analyser):
+        assert habit_analyser.get_completion_rate('read') == 1.0
+        assert habit_analyser.get_completion_rate('gym', as_of=date(2020, 2, 23)) == 5 / 6
+        assert habit_analyser.get_completion_rate('missing') is None
+
         
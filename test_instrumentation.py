@@ -0,0 +1,66 @@
+import io
+import json
+from datetime import date
+from connection import ConnectionManager
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+from instrumentation import Histogram, Instrumentation
+
+
+class TestHistogram:
+    def test_percentiles(self):
+        histogram = Histogram()
+        for micros in (1, 2, 3, 100, 1000):
+            histogram.record(micros / 1e6)
+        summary = histogram.summary()
+        assert summary['count'] == 5
+        assert summary['max'] == 0.001
+        assert summary['p50'] == 4 / 1e6
+        assert summary['p99'] == 0.001
+        assert Histogram().percentile(0.5) == 0.0
+
+
+class TestInstrumentation:
+    def test_private_connection(self, tmp_path):
+        sink = io.StringIO()
+        instrumentation = Instrumentation(slow_query=0, sink=sink, progress_steps=1)
+        tracker = HabitTracker(name=str(tmp_path / 'profile.db'), instrumentation=instrumentation)
+        analyser = HabitAnalyser(name=str(tmp_path / 'profile.db'), instrumentation=instrumentation)
+        instrumentation.reset()
+        tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+        tracker.check_habits_bulk([("Read", date(2020, 1, day), True) for day in range(1, 4)])
+        assert analyser.get_all_habits() == ["Read"]
+        stats = instrumentation.stats()
+
+        assert stats['methods']['HabitTracker.create_habit']['count'] == 1
+        assert stats['methods']['HabitTracker.check_habits_bulk']['rows_changed'] >= 3
+        assert stats['methods']['HabitAnalyser.get_all_habits']['rows_returned'] == 1
+        assert stats['methods']['HabitAnalyser.get_all_habits']['vm_steps'] > 0
+        # create_habit and check_habits_bulk each commit one transaction
+        assert stats['commits'] == 2
+        assert stats['statements_traced'] > 0
+        select = 'SELECT name FROM habits WHERE user_id = ? ORDER BY user_id, name LIMIT ? OFFSET ?'
+        assert stats['statements'][select]['rows_returned'] == 1
+        slow = [query for query in stats['slow_queries'] if query['sql'] == select]
+        assert any('habits' in step for step in slow[0]['plan'])
+
+        events = [json.loads(line) for line in sink.getvalue().splitlines()]
+        assert {'method', 'slow_query'} == {event['event'] for event in events}
+        tracker.close()
+        analyser.close()
+
+    def test_manager(self, tmp_path):
+        instrumentation = Instrumentation()
+        with ConnectionManager(str(tmp_path / 'pool.db'), readers=1, instrumentation=instrumentation) as manager:
+            tracker = HabitTracker(manager=manager, instrumentation=instrumentation)
+            tracker.create_habit("Read", "Read daily", date(2020, 1, 1), date(2020, 12, 31), "daily")
+            assert tracker.get_habit("Read").name == "Read"
+        stats = instrumentation.stats()
+        assert stats['methods']['HabitTracker.get_habit']['rows_returned'] == 1
+        assert stats['slow_queries'] == []
+
+    def test_disabled(self, tmp_path):
+        tracker = HabitTracker(name=str(tmp_path / 'plain.db'))
+        assert tracker.instrumentation is None
+        assert type(tracker.conn).__name__ == 'Connection'
+        tracker.close()
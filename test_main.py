@@ -0,0 +1,77 @@
+import io
+import json
+import sys
+import pytest
+from types import SimpleNamespace
+import main
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'cli.db')
+
+
+def run(database, *argv, stdin=''):
+    sys.stdin = io.StringIO(stdin)
+    try:
+        return main.main(['--database', database, *argv])
+    finally:
+        sys.stdin = sys.__stdin__
+
+
+class TestCommands:
+    def test_commands(self, database, capsys):
+        assert run(database, 'add', 'Read', '--start', '2024-01-01', '--end', '2024-12-31',
+                   '--frequency', 'daily') == 0
+        assert run(database, 'check', 'Read', '--date', '2024-01-01') == 0
+        assert run(database, 'check', 'Read', '--date', '2024-01-02', '--missed') == 0
+        assert run(database, 'streak', 'Read') == 0
+        assert run(database, 'list', '--frequency', 'weekly') == 0
+        assert run(database, 'list') == 0
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert lines == [{'name': 'Read', 'longest': 1, 'current': 1}, {'name': 'Read', 'frequency': 'daily'}]
+
+    def test_batch(self, database, capsys):
+        commands = [
+            {'command': 'add', 'name': 'Read', 'start_date': '2024-01-01', 'end_date': '2024-12-31',
+             'frequency': 'daily'},
+            *({'command': 'check', 'name': 'Read', 'event_date': f'2024-01-0{day}'} for day in range(1, 4)),
+            {'command': 'streak', 'name': 'Read'},
+            {'command': 'streak'},
+        ]
+        assert run(database, 'batch', stdin='\n'.join(json.dumps(command) for command in commands) + '\n\n') == 0
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert lines == [{'name': 'Read', 'longest': 3, 'current': 3}, {'longest': 3}]
+
+    def test_batch_rolls_back(self, database, capsys):
+        stdin = ('{"command": "add", "name": "Read", "start_date": "2024-01-01", "end_date": "2024-12-31", '
+                 '"frequency": "daily"}\n{"command": "check", "name": "Read", "when": "today"}\n')
+        assert run(database, 'batch', stdin=stdin) == 1
+        assert 'error' in capsys.readouterr().err
+        assert run(database, 'batch', stdin='not json\n') == 1
+        assert 'line 1' in capsys.readouterr().err
+        assert run(database, 'list') == 0
+        assert capsys.readouterr().out == ''
+
+    def test_export_import(self, database, tmp_path, capsys):
+        run(database, 'add', 'Read', '--start', '2024-01-01', '--end', '2024-12-31', '--frequency', 'daily')
+        run(database, 'check', 'Read', '--date', '2024-01-01')
+        directory = str(tmp_path / 'export')
+        assert run(database, 'export', directory, '--format', 'csv') == 0
+        assert run(str(tmp_path / 'copy.db'), 'import', directory) == 0
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert lines == [{'habits': 1, 'check_ins': 1}] * 2
+
+    def test_menu_uses_database(self, database, tmp_path, monkeypatch):
+        # a menu that is left right away, prompts cannot be answered in a test
+        prompt = SimpleNamespace(ask=lambda: "Exit")
+        questionary = SimpleNamespace(print=print, select=lambda *args, **kwargs: prompt)
+        monkeypatch.setitem(sys.modules, 'questionary', questionary)
+        monkeypatch.chdir(tmp_path)
+        assert main.main(['--database', database]) == 0
+        assert (tmp_path / 'cli.db').exists()
+        assert not (tmp_path / 'main.db').exists()
+
+    def test_questionary_not_imported(self, database):
+        run(database, 'list')
+        assert 'questionary' not in sys.modules
@@ -0,0 +1,110 @@
+import pytest
+import sqlite3
+from datetime import date
+from db import HabitTracker
+from habit_tracker import decode_progress
+from migrations import migrate, schema_version, columns, SCHEMA_VERSION
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database in the layout used before schema versioning"""
+    conn = sqlite3.connect(tmp_path / 'legacy.db', isolation_level=None)
+    conn.execute("""
+        CREATE TABLE habits (
+            name TEXT NOT NULL PRIMARY KEY,
+            description TEXT,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            frequency TEXT NOT NULL,
+            progress TEXT)""")
+    conn.execute("""
+        CREATE TABLE tracker (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_name TEXT NOT NULL,
+            event_date DATE NOT NULL,
+            completed BOOLEAN NOT NULL,
+            FOREIGN KEY (habit_name) REFERENCES habits(name))""")
+    conn.execute("INSERT INTO habits VALUES ('read', 'read 30 mins', '2020-01-01', '2020-01-31', 'daily', '[1, 0, 1]')")
+    conn.execute("INSERT INTO habits VALUES ('gym', 'go to gym', '2020-01-01', '2020-03-31', 'weekly', "
+                 "'[datetime.date(2020, 1, 15)]')")
+    conn.executemany("INSERT INTO tracker(habit_name, event_date, completed) VALUES (?, ?, ?)", [
+        ('read', '2020-01-01', 0),
+        ('read', '2020-01-01', 1),
+        ('read', '2020-01-02', 1),
+        ('gym', '2020-01-06', 1),
+        ('missing', '2020-01-06', 1),
+        ('missing', '2020-01-06', 1),
+    ])
+    yield conn
+    conn.close()
+
+
+class TestMigrations:
+    def test_new_database(self, tmp_path):
+        conn = sqlite3.connect(tmp_path / 'new.db', isolation_level=None)
+        assert migrate(conn) == 0
+        assert schema_version(conn) == SCHEMA_VERSION
+        assert 'habit_id' in columns(conn, 'tracker')
+
+    def test_migrate_legacy_in_batches(self, legacy_db):
+        migrate(legacy_db, batch_size=2)
+        assert schema_version(legacy_db) == SCHEMA_VERSION
+        rows = legacy_db.execute("""
+            SELECT habits.name, tracker.event_date, tracker.completed
+            FROM tracker JOIN habits ON habits.id = tracker.habit_id
+            ORDER BY habits.name, tracker.event_date""").fetchall()
+        # dates are stored as day ordinals since version 9, legacy marks are check-ins since version 10
+        assert rows == [('gym', date(2020, 1, 6).toordinal(), 1), ('gym', date(2020, 1, 13).toordinal(), 1),
+                        ('read', date(2020, 1, 1).toordinal(), 1), ('read', date(2020, 1, 2).toordinal(), 1),
+                        ('read', date(2020, 1, 3).toordinal(), 1)]
+        # rows of unknown habits are kept but cannot be joined
+        orphans = legacy_db.execute("SELECT COUNT(*) FROM tracker WHERE habit_id IS NULL").fetchone()[0]
+        assert orphans == 2
+
+    def test_unique_check_in_per_day(self, legacy_db):
+        migrate(legacy_db)
+        with pytest.raises(sqlite3.IntegrityError):
+            legacy_db.execute("""
+                INSERT INTO tracker(habit_id, habit_name, event_date, completed)
+                SELECT id, name, ?, 0 FROM habits WHERE name = 'read'""", (date(2020, 1, 2),))
+
+    def test_migrate_is_idempotent(self, legacy_db):
+        migrate(legacy_db)
+        assert migrate(legacy_db) == SCHEMA_VERSION
+
+    def test_current_database_skips_ddl(self, legacy_db):
+        migrate(legacy_db)
+        statements = []
+        legacy_db.set_trace_callback(statements.append)
+        migrate(legacy_db)
+        assert statements == ['PRAGMA user_version']
+
+    def test_progress_text_to_bitmap(self, legacy_db):
+        migrate(legacy_db)
+        progress = dict(legacy_db.execute("SELECT name, progress FROM habits"))
+        # legacy marks and dates are combined with the completed check-ins from the tracker
+        assert decode_progress(progress['read']) == [0, 1, 2]
+        assert decode_progress(progress['gym']) == [1, 2]
+
+    def test_legacy_marks_survive_update(self, legacy_db, tmp_path):
+        migrate(legacy_db)
+        tracker = HabitTracker(str(tmp_path / 'legacy.db'))
+        # the bitmap is rebuilt from the tracker table, which now holds the legacy marks too
+        tracker.update_habit("read", "read 30 mins", date(2020, 1, 1), date(2020, 1, 31), "daily")
+        tracker.update_habit("gym", "go to gym", date(2020, 1, 1), date(2020, 3, 31), "weekly")
+        assert tracker.get_habit("read").progress == [date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3)]
+        assert tracker.get_habit("gym").progress == [date(2020, 1, 6), date(2020, 1, 13)]
+        assert tracker.get_stats("read").longest_streak == 3
+        tracker.close()
+
+    def test_dates_to_ordinals(self, legacy_db, tmp_path):
+        legacy_db.execute("INSERT INTO habits VALUES ('broken', '', 'soon', 'later', 'daily', '[]')")
+        migrate(legacy_db, batch_size=1)
+        types = legacy_db.execute("SELECT DISTINCT typeof(start_date) FROM habits WHERE name != 'broken'")
+        assert types.fetchall() == [('integer',)]
+        conn = sqlite3.connect(tmp_path / 'legacy.db', detect_types=sqlite3.PARSE_DECLTYPES)
+        rows = conn.execute('SELECT name, start_date FROM habits ORDER BY name').fetchall()
+        # text that is not a date is left as it was instead of failing the query
+        assert rows == [('broken', 'soon'), ('gym', date(2020, 1, 1)), ('read', date(2020, 1, 1))]
+        conn.close()
@@ -0,0 +1,40 @@
+import pytest
+from datetime import date, timedelta
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'parallel.db')
+    tracker = HabitTracker(name=path)
+    start = date(2020, 1, 1)
+    frequencies = ('daily', 'weekly', 'monthly')
+    for index in range(30):
+        tracker.create_habit(f"Habit {index:02}", "", start, start + timedelta(days=365), frequencies[index % 3])
+    tracker.check_habits_bulk((f"Habit {index:02}", start + timedelta(days=day), (day * index) % 5 != 0)
+                              for index in range(30) for day in range(0, 200, 1 + index % 3))
+    tracker.delete_habit("Habit 07")
+    tracker.close()
+    return path
+
+
+class TestParallelStreakStats:
+    def test_same_as_serial(self, database):
+        analyser = HabitAnalyser(name=database)
+        as_of = date(2020, 5, 1)
+        serial = analyser.streak_stats(as_of=as_of)
+        assert len(serial.name) == 29
+        assert analyser.parallel_streak_stats(workers=3, as_of=as_of) == serial
+        assert analyser.parallel_streak_stats(workers=1, as_of=as_of) == serial
+        analyser.close()
+
+    def test_empty(self, tmp_path):
+        analyser = HabitAnalyser(name=str(tmp_path / 'empty.db'))
+        assert analyser.parallel_streak_stats(workers=2) == ([], [], [], [])
+        analyser.close()
+
+    def test_memory_database(self):
+        analyser = HabitAnalyser(name=':memory:')
+        with pytest.raises(ValueError):
+            analyser.parallel_streak_stats(workers=2)
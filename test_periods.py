@@ -0,0 +1,37 @@
+import pytest
+from datetime import date, timedelta
+import periods
+from periods import period_ordinal, period_ordinals, first_day, period_offsets
+from habit_tracker import Habit
+
+
+class TestPeriods:
+    def test_iso_weeks(self):
+        # 2019-12-30 is the Monday of ISO week 1 of 2020
+        assert period_ordinal(date(2019, 12, 29), 'weekly') + 1 == period_ordinal(date(2019, 12, 30), 'weekly')
+        assert period_ordinal(date(2019, 12, 30), 'weekly') == period_ordinal(date(2020, 1, 5), 'weekly')
+        assert first_day(period_ordinal(date(2020, 1, 1), 'weekly'), 'weekly') == date(2019, 12, 30)
+
+    def test_calendar_months(self):
+        assert period_ordinal(date(2020, 1, 31), 'monthly') + 1 == period_ordinal(date(2020, 2, 1), 'monthly')
+        assert period_ordinal(date(2020, 12, 31), 'monthly') + 1 == period_ordinal("2021-01-01", 'monthly')
+        assert first_day(period_ordinal(date(2020, 2, 29), 'monthly'), 'monthly') == date(2020, 2, 1)
+
+    @pytest.mark.parametrize('frequency', ['daily', 'weekly', 'monthly'])
+    def test_vectorized(self, frequency, monkeypatch):
+        days = [date(2019, 12, 25) + timedelta(days=n) for n in range(0, 400, 3)]
+        expected = [period_ordinal(day, frequency) for day in days]
+        assert period_ordinals(days, frequency) == expected
+        assert period_ordinals([day.isoformat() for day in days], frequency) == expected
+        monkeypatch.setattr(periods, 'np', None)
+        assert period_ordinals(days, frequency) == expected
+
+    def test_period_offsets(self):
+        assert period_offsets("2020-01-01", [date(2020, 1, 5), date(2020, 1, 6), date(2019, 12, 29)], 'weekly') == \
+            [0, 1, -1]
+
+    def test_check_streak_as_of(self):
+        habit = Habit("Budget", start_date=date(2020, 1, 1), frequency="monthly")
+        habit.progress = [date(2020, 1, 20)]
+        assert habit.check_streak(as_of=date(2020, 2, 3))
+        assert not habit.check_streak(as_of=date(2020, 3, 1))
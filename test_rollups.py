@@ -0,0 +1,86 @@
+import pytest
+import sqlite3
+from datetime import date, timedelta
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+from migrations import migrate
+from rollups import PeriodCounts
+
+START = date(2024, 1, 3)
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = HabitTracker(name=str(tmp_path / 'rollups.db'))
+    tracker.create_habit("Read", "", START, START + timedelta(days=400), "daily")
+    tracker.create_habit("Gym", "", START, START + timedelta(days=400), "weekly")
+    tracker.create_habit("Budget", "", START, START + timedelta(days=400), "monthly")
+    yield tracker
+    tracker.close()
+
+
+def rollups(conn):
+    return conn.execute('SELECT * FROM habit_rollups ORDER BY habit_id, frequency, period').fetchall()
+
+
+class TestRollups:
+    def test_incremental_matches_rebuild(self, tracker):
+        for day in range(0, 60, 2):
+            tracker.check_habit("Read", START + timedelta(days=day), day % 3 != 0)
+        tracker.check_habit("Read", START + timedelta(days=4), False)
+        tracker.check_habit("Read", START + timedelta(days=6), True)
+        tracker.check_habits_bulk([("Gym", START + timedelta(days=day), True) for day in range(0, 90, 5)]
+                                  + [("Read", START + timedelta(days=day), True) for day in range(50, 70)])
+        incremental = rollups(tracker.conn)
+        tracker.rebuild_rollups()
+        assert rollups(tracker.conn) == incremental
+        weeks = tracker.conn.execute("SELECT SUM(checked) FROM habit_rollups WHERE frequency = 'weekly'")
+        assert weeks.fetchone()[0] == tracker.conn.execute('SELECT COUNT(*) FROM tracker').fetchone()[0]
+
+    def test_completion_rates(self, tracker, tmp_path):
+        days = [day for day in range(120) if day % 7 in (0, 1, 3) or day % 11 == 0]
+        tracker.check_habits_bulk([("Read", START + timedelta(days=day), True) for day in days])
+        tracker.check_habits_bulk([("Gym", START + timedelta(days=day), True) for day in range(0, 120, 10)])
+        tracker.check_habits_bulk([("Budget", START + timedelta(days=40), True)])
+        analyser = HabitAnalyser(name=str(tmp_path / 'rollups.db'))
+        as_of = START + timedelta(days=100)
+
+        rates = analyser.get_completion_rates("Read", windows=(7, 30, 365), as_of=as_of)
+        for window, rate in rates.items():
+            first = max(as_of - timedelta(days=window - 1), START)
+            expected = sum(1 for day in days if first <= START + timedelta(days=day) <= as_of)
+            assert rate == expected / ((as_of - first).days + 1)
+
+        # the last 30 days touch 5 weeks, days 70, 80, 90 and 100 complete 4 of them
+        assert analyser.get_completion_rates("Gym", windows=(30,), as_of=as_of) == {30: 4 / 5}
+        assert analyser.get_completion_rates("Budget", windows=(7, 365), as_of=as_of) == {7: 0.0, 365: 1 / 4}
+        assert analyser.get_completion_rates("Unknown") is None
+        analyser.close()
+
+    def test_trend(self, tracker):
+        tracker.check_habit("Read", date(2024, 1, 8), True)
+        tracker.check_habit("Read", date(2024, 1, 9), False)
+        tracker.check_habit("Read", date(2024, 1, 10), True)
+        tracker.check_habit("Read", date(2024, 1, 22), True)
+        analyser = HabitAnalyser(name=tracker.name)
+        assert analyser.get_trend("Read", periods=3, as_of=date(2024, 1, 24)) == [
+            PeriodCounts(date(2024, 1, 8), 2, 3), PeriodCounts(date(2024, 1, 15), 0, 0),
+            PeriodCounts(date(2024, 1, 22), 1, 1)]
+        assert analyser.get_trend("Read", periods=1, frequency='monthly', as_of=date(2024, 1, 31)) == [
+            PeriodCounts(date(2024, 1, 1), 3, 4)]
+        with pytest.raises(ValueError):
+            analyser.get_trend("Read", frequency='daily')
+        analyser.close()
+
+    def test_delete_and_migrate(self, tracker):
+        tracker.check_habit("Read", START, True)
+        tracker.check_habit("Gym", START, True)
+        tracker.delete_habit("Gym")
+        assert {row[0] for row in rollups(tracker.conn)} == {1}
+        expected = rollups(tracker.conn)
+        conn = sqlite3.connect(tracker.name, isolation_level=None)
+        conn.execute('DROP TABLE habit_rollups')
+        conn.execute('PRAGMA user_version = 6')
+        assert migrate(conn, batch_size=1) == 6
+        assert rollups(conn) == expected
+        conn.close()
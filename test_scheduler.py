@@ -0,0 +1,81 @@
+import random
+import pytest
+from datetime import date, timedelta
+from db import HabitTracker
+from scheduler import DueHabit, Scheduler, next_due
+
+START = date(2024, 1, 3)  # a Wednesday
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = HabitTracker(str(tmp_path / 'schedule.db'), scheduler=Scheduler())
+    tracker.create_habit("Read", "", START, START + timedelta(days=60), "daily")
+    tracker.create_habit("Gym", "", START, START + timedelta(days=60), "weekly")
+    tracker.create_habit("Budget", "", START, START + timedelta(days=60), "monthly")
+    yield tracker
+    tracker.close()
+
+
+class TestScheduler:
+    def test_next_due(self):
+        assert next_due(START, START + timedelta(days=30), "daily", None) == START
+        assert next_due(START, START + timedelta(days=30), "daily", 4) == START + timedelta(days=5)
+        # the first week began on Monday, before the habit did
+        assert next_due(START, START + timedelta(days=30), "weekly", None) == START
+        assert next_due(START, START + timedelta(days=30), "weekly", 0) == date(2024, 1, 8)
+        assert next_due(START, START + timedelta(days=30), "monthly", 0) == date(2024, 2, 1)
+        assert next_due(START, START + timedelta(days=3), "daily", 3) is None
+        assert next_due("soon", START, "daily", None) is None
+
+    def test_kept_in_sync(self, tracker):
+        scheduler = tracker.scheduler
+        as_of = date(2024, 1, 9)
+        assert scheduler.due(as_of) == [DueHabit(START, '', "Budget", "monthly", False),
+                                        DueHabit(START, '', "Gym", "weekly", True),
+                                        DueHabit(START, '', "Read", "daily", True)]
+        tracker.check_habits_bulk([("Read", START + timedelta(days=day), True) for day in range(6)])
+        tracker.check_habit("Gym", date(2024, 1, 5), True)
+        assert scheduler.overdue(as_of) == []
+        assert [(habit.name, habit.due) for habit in scheduler.due(as_of)] == [
+            ("Budget", START), ("Gym", date(2024, 1, 8)), ("Read", date(2024, 1, 9))]
+        tracker.delete_habit("Budget")
+        tracker.create_habit("Walk", "", date(2024, 1, 10), date(2024, 2, 1), "daily")
+        assert [habit.name for habit in scheduler.due(as_of)] == ["Gym", "Read"]
+        assert scheduler.next_due().name == "Gym"
+        assert len(scheduler) == 3
+
+        # a second tracker sharing the scheduler loads the habits of its own user
+        HabitTracker(tracker.name, user_id="bob", scheduler=scheduler).create_habit(
+            "Read", "", START, START + timedelta(days=60), "daily")
+        first = scheduler.due(as_of, limit=2)
+        assert [(habit.user_id, habit.name) for habit in first] == [("bob", "Read"), ('', "Gym")]
+
+    def test_emit(self, tracker):
+        batches = []
+        tracker.scheduler.callback = batches.append
+        assert tracker.scheduler.emit(START, batch_size=2) == 3
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert tracker.scheduler.emit(START + timedelta(days=1)) == 0
+        tracker.check_habit("Read", START, True)
+        assert tracker.scheduler.emit(START + timedelta(days=1)) == 1
+        assert batches[-1][0].name == "Read"
+
+    def test_matches_scan(self):
+        rng = random.Random(7)
+        scheduler = Scheduler()
+        habits = {}
+        for step in range(2000):
+            name = f"Habit {rng.randrange(300)}"
+            if rng.random() < 0.2:
+                scheduler.remove('', name)
+                habits.pop(name, None)
+                continue
+            row = ('', name, START, START + timedelta(days=rng.randrange(400)), rng.choice(["daily", "weekly"]),
+                   rng.choice([None, rng.randrange(60)]))
+            scheduler.update(*row)
+            habits[name] = row
+        as_of = START + timedelta(days=30)
+        expected = sorted((due, name) for name, due in ((name, next_due(*row[2:])) for name, row in habits.items())
+                          if due is not None and due <= as_of)
+        assert [(habit.due, habit.name) for habit in scheduler.due(as_of)] == expected
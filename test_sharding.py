@@ -0,0 +1,86 @@
+import sqlite3
+import pytest
+from datetime import date, timedelta
+from db import HabitTracker
+from habit_analyse import HabitAnalyser, LeaderboardEntry
+from migrations import migrate
+from sharding import ShardRouter, ShardedAnalyser, shard_index
+
+START = date(2024, 1, 1)
+USERS = [f"user{index}" for index in range(8)]
+
+
+@pytest.fixture
+def router(tmp_path):
+    router = ShardRouter([str(tmp_path / f'shard{index}.db') for index in range(3)], readers=2)
+    for user_id in USERS:
+        router.tracker(user_id).create_habit("Read", user_id, START, START + timedelta(days=100), "daily")
+    yield router
+    router.close()
+
+
+class TestUserScope:
+    def test_same_name_per_user(self, tmp_path):
+        path = str(tmp_path / 'users.db')
+        alice, bob = HabitTracker(path, user_id="alice"), HabitTracker(path, user_id="bob")
+        alice.create_habit("Read", "alice", START, START + timedelta(days=10), "daily")
+        bob.create_habit("Read", "bob", START, START + timedelta(days=10), "daily")
+        alice.check_habits_bulk([("Read", START + timedelta(days=day), True) for day in range(3)])
+        bob.check_habit("Read", START, True)
+        assert alice.get_habit("Read").description == "alice"
+        assert (alice.get_stats("Read").longest_streak, bob.get_stats("Read").longest_streak) == (3, 1)
+        bob.delete_habit("Read")
+        assert alice.get_habit("Read") is not None and bob.get_habit("Read") is None
+
+        assert HabitAnalyser(path, user_id="bob").get_all_habits() == []
+        everyone = HabitAnalyser(path, user_id=None)
+        assert [row.user_id for row in everyone.query_habits(('user_id', 'name'))] == ["alice"]
+        with pytest.raises(ValueError):
+            everyone.get_longest_streak_for_habit("Read")
+        alice.close()
+        bob.close()
+
+    def test_migration_keeps_habits(self, tmp_path):
+        path = str(tmp_path / 'legacy.db')
+        tracker = HabitTracker(path)
+        tracker.create_habit("Read", "", START, START + timedelta(days=10), "daily")
+        tracker.check_habit("Read", START, True)
+        tracker.close()
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.executescript('''
+            CREATE TABLE legacy (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, description TEXT,
+                                 start_date DATE NOT NULL, end_date DATE NOT NULL, frequency TEXT NOT NULL,
+                                 progress BLOB);
+            INSERT INTO legacy SELECT id, name, description, start_date, end_date, frequency, progress FROM habits;
+            DROP TABLE habits;
+            ALTER TABLE legacy RENAME TO habits;
+            PRAGMA user_version = 7;''')
+        assert migrate(conn) == 7
+        assert conn.execute('SELECT user_id, name FROM habits').fetchall() == [('', 'Read')]
+        conn.close()
+        assert HabitAnalyser(path).get_longest_streak_for_habit("Read") == 1
+
+
+class TestSharding:
+    def test_routing_is_stable(self, router):
+        assert [router.shard(user_id) for user_id in USERS] == [shard_index(user_id, 3) for user_id in USERS]
+        assert len({router.shard(user_id) for user_id in USERS}) > 1
+        for user_id in USERS:
+            conn = sqlite3.connect(router.paths[router.shard(user_id)])
+            assert conn.execute('SELECT COUNT(*) FROM habits WHERE user_id = ?', (user_id,)).fetchone() == (1,)
+            conn.close()
+
+    def test_parallel_writes_and_fan_out(self, router):
+        events = [(user_id, "Read", START + timedelta(days=day), True)
+                  for index, user_id in enumerate(USERS) for day in range(index + 1)]
+        written = router.check_habits_bulk(events + [("user0", "Unknown", START, True)])
+        # check-ins of unknown habits are kept unattached, as HabitTracker.check_habits_bulk does
+        assert sum(written.values()) == len(events) + 1
+        assert router.analyser("user5").get_longest_streak() == 6
+
+        analyser = ShardedAnalyser(router)
+        assert analyser.get_longest_streak() == 8
+        assert analyser.get_all_habits() == [(user_id, "Read") for user_id in USERS]
+        assert analyser.get_leaderboard(limit=3) == [LeaderboardEntry("user7", "Read", 8),
+                                                     LeaderboardEntry("user6", "Read", 7),
+                                                     LeaderboardEntry("user5", "Read", 6)]
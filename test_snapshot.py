@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import pytest
+from datetime import date, timedelta
+from connection import SnapshotManager
+from db import HabitTracker
+from habit_analyse import HabitAnalyser
+
+START = date(2024, 1, 1)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    tracker = HabitTracker(str(tmp_path / 'live.db'))
+    tracker.create_habit("Read", "", START, START + timedelta(days=30), "daily")
+    tracker.check_habits_bulk([("Read", START + timedelta(days=day), True) for day in range(3)])
+    yield tracker
+    tracker.close()
+
+
+class TestSnapshot:
+    @pytest.mark.parametrize('in_memory', [True, False])
+    def test_reads_copy_until_refreshed(self, tracker, tmp_path, in_memory):
+        path = ':memory:' if in_memory else str(tmp_path / 'snapshot.db')
+        analyser = HabitAnalyser(tracker.name, snapshot=path)
+        assert analyser.get_longest_streak_for_habit("Read") == 3
+        tracker.check_habit("Read", START + timedelta(days=3), True)
+        tracker.create_habit("Gym", "", START, START + timedelta(days=30), "weekly")
+        assert analyser.get_all_habits() == ["Read"]
+        assert analyser.get_longest_streak_for_habit("Read") == 3
+        analyser.refresh()
+        assert analyser.get_all_habits() == ["Gym", "Read"]
+        assert analyser.get_longest_streak_for_habit("Read") == 4
+        analyser.close()
+
+    def test_refresh_interval(self, tracker):
+        clock = Clock()
+        manager = SnapshotManager(tracker.name, refresh_interval=60, clock=clock)
+        analyser = HabitAnalyser(manager=manager)
+        tracker.create_habit("Gym", "", START, START + timedelta(days=30), "weekly")
+        clock.now = 59
+        assert analyser.get_all_habits() == ["Read"]
+        clock.now = 60
+        assert analyser.get_all_habits() == ["Gym", "Read"]
+        assert manager.refreshes == 2
+        assert manager.refresh(max_age=60) is False
+        assert manager.refresh() is True
+        manager.close()
+
+    def test_concurrent_refreshes(self, tracker, tmp_path):
+        path = tmp_path / 'snapshot.db'
+        analyser = HabitAnalyser(tracker.name, snapshot=str(path), refresh_interval=0)
+        errors = []
+
+        def read():
+            for _ in range(20):
+                try:
+                    assert analyser.get_all_habits() == ["Read"]
+                except Exception as error:
+                    errors.append(error)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert [file.name for file in tmp_path.iterdir() if file.name.endswith('.tmp')] == []
+        analyser.close()
+
+    def test_read_only(self, tracker, tmp_path):
+        with SnapshotManager(tracker.name, str(tmp_path / 'snapshot.db')) as manager:
+            with manager.reader() as conn:
+                with pytest.raises(sqlite3.OperationalError):
+                    conn.execute('DELETE FROM habits')
+            with pytest.raises(sqlite3.OperationalError):
+                manager.writer()
+        with pytest.raises(ValueError):
+            SnapshotManager(':memory:')
+
+    def test_parallel_streak_stats(self, tracker, tmp_path):
+        analyser = HabitAnalyser(tracker.name, snapshot=str(tmp_path / 'snapshot.db'))
+        assert analyser.parallel_streak_stats(workers=2, as_of=START) == analyser.streak_stats(as_of=START)
+        analyser.close()
+        with pytest.raises(ValueError):
+            HabitAnalyser(tracker.name, snapshot=':memory:').parallel_streak_stats(workers=2)
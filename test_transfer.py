@@ -0,0 +1,70 @@
+import pytest
+import sqlite3
+from datetime import date, timedelta
+from db import HabitTracker
+from optional import optional_module
+from transfer import export_tables, import_tables, detect_format
+
+FORMATS = ['csv',
+           pytest.param('npz', marks=pytest.mark.skipif(optional_module('numpy') is None, reason="needs numpy")),
+           pytest.param('parquet', marks=pytest.mark.skipif(optional_module('pyarrow.parquet') is None,
+                                                             reason="needs pyarrow"))]
+
+
+@pytest.fixture
+def source(tmp_path):
+    tracker = HabitTracker(name=str(tmp_path / 'source.db'))
+    start = date(2020, 1, 1)
+    for index, frequency in enumerate(('daily', 'weekly', 'monthly')):
+        tracker.create_habit(f"Habit {index}", f"Habit number {index}", start, start + timedelta(days=99), frequency)
+    tracker.check_habits_bulk((f"Habit {index}", start + timedelta(days=day), day % 4 != 0)
+                              for index in range(3) for day in range(0, 100, index + 1))
+    tracker.create_habit("Deleted", "", start, start, "daily")
+    tracker.check_habit("Deleted", start, True)
+    tracker.delete_habit("Deleted")
+    yield tracker
+    tracker.close()
+
+
+def dump(conn):
+    return (conn.execute('SELECT name, description, start_date, end_date, frequency, progress FROM habits '
+                         'ORDER BY name').fetchall(),
+            conn.execute('SELECT habit_name, event_date, completed FROM tracker WHERE habit_name != ? '
+                         'ORDER BY habit_name, event_date', ("Deleted",)).fetchall(),
+            conn.execute('SELECT current_streak, longest_streak, last_period, total_completions FROM habit_stats '
+                         'ORDER BY habit_id').fetchall())
+
+
+class TestTransfer:
+    @pytest.mark.parametrize('file_format', FORMATS)
+    def test_round_trip(self, source, tmp_path, file_format):
+        directory = str(tmp_path / 'export')
+        assert source.export_data(directory, file_format, chunk_size=40) == (3, 184)
+        assert detect_format(directory) == file_format
+
+        target = HabitTracker(name=str(tmp_path / 'target.db'))
+        assert target.import_data(directory, chunk_size=50) == (3, 184)
+        assert dump(target.conn) == dump(source.conn)
+        text_dates = target.conn.execute("SELECT COUNT(*) FROM tracker WHERE typeof(event_date) != 'integer'")
+        assert text_dates.fetchone() == (0,)
+        indexes = {row[0] for row in target.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'tracker_habit_day', 'tracker_history', 'habits_frequency'} <= indexes
+        target.close()
+
+    def test_import_twice(self, source, tmp_path):
+        directory = str(tmp_path / 'export')
+        export_tables(source.conn, directory, 'csv')
+        conn = sqlite3.connect(str(tmp_path / 'target.db'), isolation_level=None)
+        HabitTracker(name=str(tmp_path / 'target.db')).close()
+        import_tables(conn, directory)
+        import_tables(conn, directory, defer_indexes=False)
+        import_tables(conn, directory)
+        assert conn.execute('SELECT COUNT(*) FROM tracker').fetchone()[0] == 184
+        assert conn.execute('SELECT COUNT(*) FROM habits').fetchone()[0] == 3
+        conn.close()
+
+    def test_unknown_format(self, source, tmp_path):
+        with pytest.raises(ValueError):
+            source.export_data(str(tmp_path / 'export'), 'xlsx')
+        with pytest.raises(FileNotFoundError):
+            source.import_data(str(tmp_path))
@@ -0,0 +1,286 @@
+import csv
+import glob
+import os
+from itertools import islice
+from habit_tracker import progress_bits, progress_summary
+from periods import as_date
+from migrations import transaction
+from optional import LAZY, resolve
+from rollups import rebuild_rollups
+
+# optional dependencies of the npz and parquet formats
+np = pa = pq = LAZY
+
+CHUNK_SIZE = 50000
+FORMATS = ('parquet', 'npz', 'csv')
+
+HABIT_FIELDS = ('user_id', 'name', 'description', 'start_date', 'end_date', 'frequency', 'progress')
+TRACKER_FIELDS = ('user_id', 'habit_name', 'event_date', 'completed')
+FIELDS = {'habits': HABIT_FIELDS, 'tracker': TRACKER_FIELDS}
+DATE_FIELDS = ('start_date', 'end_date', 'event_date')
+
+# keyset queries, the first column is the id the next chunk resumes after
+EXPORT_SQL = {
+    'habits': '''
+        SELECT id, user_id, name, description, start_date, end_date, frequency, progress FROM habits
+        WHERE id > ? ORDER BY id LIMIT ?''',
+    # rows of deleted habits have nothing to be attached to on import, so the join leaves them out
+    'tracker': '''
+        SELECT tracker.id, habits.user_id, habits.name, tracker.event_date, tracker.completed
+        FROM tracker JOIN habits ON habits.id = tracker.habit_id
+        WHERE tracker.id > ? ORDER BY tracker.id LIMIT ?''',
+}
+
+HABIT_UPSERT_SQL = '''
+    INSERT INTO habits(user_id, name, description, start_date, end_date, frequency, progress)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, name) DO UPDATE SET
+        description = excluded.description, start_date = excluded.start_date, end_date = excluded.end_date,
+        frequency = excluded.frequency, progress = excluded.progress
+'''
+
+IMPORT_STATS_SQL = '''
+    INSERT OR REPLACE INTO habit_stats(habit_id, current_streak, longest_streak, last_period, total_completions)
+    VALUES ((SELECT id FROM habits WHERE user_id = ? AND name = ?), ?, ?, ?, ?)
+'''
+
+TRACKER_INSERT_SQL = 'INSERT INTO tracker(habit_id, habit_name, event_date, completed) VALUES (?, ?, ?, ?)'
+TRACKER_UPSERT_SQL = TRACKER_INSERT_SQL + \
+    ' ON CONFLICT(habit_id, event_date) DO UPDATE SET completed = excluded.completed'
+
+
+def default_format():
+    """
+    :return: parquet when pyarrow is installed, npz when NumPy is, csv otherwise
+    """
+    if resolve(__name__, 'pq', 'pyarrow.parquet') is not None:
+        return 'parquet'
+    if resolve(__name__, 'np', 'numpy') is not None:
+        return 'npz'
+    return 'csv'
+
+
+def detect_format(directory):
+    """
+    :param directory: directory written by export_tables
+    :return: format of the exported files
+    """
+    for file_format in FORMATS:
+        if glob.glob(os.path.join(directory, f'habits*.{file_format}')):
+            return file_format
+    raise FileNotFoundError(f"no exported habits found in {directory}")
+
+
+def _chunks(conn, table, chunk_size):
+    """
+    read a table in id order
+    :return: generator of lists of row tuples without the id
+    """
+    last = 0
+    while True:
+        rows = conn.execute(EXPORT_SQL[table], (last, chunk_size)).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+
+def _counted(chunks, sizes):
+    """
+    pass chunks through, appending the size of each to sizes
+    """
+    for rows in chunks:
+        sizes.append(len(rows))
+        yield rows
+
+
+def _text(field, value):
+    """
+    store a value in the text based formats, where a missing description becomes an empty string
+    """
+    if field == 'progress':
+        return bytes(value or b'').hex()
+    if field == 'completed':
+        return int(bool(value))
+    return '' if value is None else str(value)
+
+
+def _value(field, text):
+    """
+    inverse of _text
+    """
+    if field == 'progress':
+        return bytes.fromhex(text)
+    if field == 'completed':
+        return int(text)
+    return text
+
+
+def _parse_dates(table, rows):
+    """
+    turn the ISO text the files hold back into date objects, which the database stores as day ordinals
+    """
+    dates = [index for index, field in enumerate(FIELDS[table]) if field in DATE_FIELDS]
+    rows = [list(row) for row in rows]
+    for row in rows:
+        for index in dates:
+            row[index] = as_date(row[index])
+    return rows
+
+
+def _parquet_value(field, value):
+    """
+    store a value in a parquet column, dates stay in their stored text form
+    """
+    if field == 'progress':
+        return bytes(value or b'')
+    if field == 'completed':
+        return bool(value)
+    return None if value is None else str(value)
+
+
+def _write_parquet(directory, table, chunks):
+    pa, pq = resolve(__name__, 'pa', 'pyarrow'), resolve(__name__, 'pq', 'pyarrow.parquet')
+    types = {'progress': pa.binary(), 'completed': pa.bool_()}
+    schema = pa.schema([(field, types.get(field, pa.string())) for field in FIELDS[table]])
+    writer = pq.ParquetWriter(os.path.join(directory, f'{table}.parquet'), schema)
+    try:
+        for rows in chunks:
+            columns = zip(*[[_parquet_value(field, value) for field, value in zip(FIELDS[table], row)] for row in rows])
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+    finally:
+        writer.close()
+
+
+def _read_parquet(directory, table, chunk_size):
+    pq = resolve(__name__, 'pq', 'pyarrow.parquet')
+    for batch in pq.ParquetFile(os.path.join(directory, f'{table}.parquet')).iter_batches(batch_size=chunk_size):
+        yield list(zip(*(batch.column(index).to_pylist() for index in range(batch.num_columns))))
+
+
+def _write_npz(directory, table, chunks):
+    np = resolve(__name__, 'np', 'numpy')
+    # npz archives cannot be appended to, so every chunk is a file of its own
+    for path in glob.glob(os.path.join(directory, f'{table}-*.npz')):
+        os.remove(path)
+    for index, rows in enumerate(chunks):
+        columns = zip(*[[_text(field, value) for field, value in zip(FIELDS[table], row)] for row in rows])
+        np.savez(os.path.join(directory, f'{table}-{index:06}.npz'),
+                 **{field: np.array(column) for field, column in zip(FIELDS[table], columns)})
+
+
+def _read_npz(directory, table, chunk_size):
+    np = resolve(__name__, 'np', 'numpy')
+    for path in sorted(glob.glob(os.path.join(directory, f'{table}-*.npz'))):
+        with np.load(path) as arrays:
+            columns = [[_value(field, value) for value in arrays[field].tolist()] for field in FIELDS[table]]
+        yield list(zip(*columns))
+
+
+def _write_csv(directory, table, chunks):
+    with open(os.path.join(directory, f'{table}.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS[table])
+        for rows in chunks:
+            writer.writerows([_text(field, value) for field, value in zip(FIELDS[table], row)] for row in rows)
+
+
+def _read_csv(directory, table, chunk_size):
+    with open(os.path.join(directory, f'{table}.csv'), newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        while True:
+            rows = [tuple(_value(field, text) for field, text in zip(FIELDS[table], row))
+                    for row in islice(reader, chunk_size)]
+            if not rows:
+                return
+            yield rows
+
+
+WRITERS = {'parquet': _write_parquet, 'npz': _write_npz, 'csv': _write_csv}
+READERS = {'parquet': _read_parquet, 'npz': _read_npz, 'csv': _read_csv}
+
+
+def export_tables(conn, directory, file_format=None, chunk_size=CHUNK_SIZE):
+    """
+    write the habits and their check-ins as columnar files, one chunk in memory at a time
+    :param conn: sqlite3 connection
+    :param directory: directory for the files, created if missing
+    :param file_format: parquet, npz or csv, see default_format
+    :param chunk_size: number of rows read and written at a time
+    :return: (number of habits, number of check-ins)
+    : both tables are read inside one transaction, so they come from the same snapshot
+    """
+    file_format = file_format or default_format()
+    if file_format not in WRITERS:
+        raise ValueError(f"unknown format {file_format}, choose one of {', '.join(FORMATS)}")
+    if (file_format == 'parquet' and resolve(__name__, 'pq', 'pyarrow.parquet') is None
+            or file_format == 'npz' and resolve(__name__, 'np', 'numpy') is None):
+        raise ValueError(f"{file_format} export needs {'pyarrow' if file_format == 'parquet' else 'numpy'}")
+    os.makedirs(directory, exist_ok=True)
+    counts = []
+    with transaction(conn):
+        for table in ('habits', 'tracker'):
+            sizes = []
+            WRITERS[file_format](directory, table, _counted(_chunks(conn, table, chunk_size), sizes))
+            counts.append(sum(sizes))
+    return tuple(counts)
+
+
+def _index_definitions(conn):
+    """
+    :return: (name, sql) of the explicitly created indexes, non-unique ones first
+    """
+    rows = conn.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ('habits', 'tracker', 'habit_stats')''').fetchall()
+    return sorted(rows, key=lambda row: 'UNIQUE' in row[1].upper())
+
+
+def import_tables(conn, directory, chunk_size=CHUNK_SIZE, defer_indexes=True):
+    """
+    load files written by export_tables in one transaction
+    :param conn: sqlite3 connection
+    :param directory: directory written by export_tables
+    :param chunk_size: number of rows read and inserted at a time
+    :param defer_indexes: drop the indexes while loading and build them once at the end
+    :return: (number of habits, number of check-ins)
+    : habits that already exist are overwritten, a later check-in for the same habit and day replaces an earlier one
+    """
+    read = READERS[detect_format(directory)]
+    habits = check_ins = 0
+    with transaction(conn):
+        indexes = _index_definitions(conn) if defer_indexes else []
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX {name}')
+
+        for rows in read(directory, 'habits', chunk_size):
+            rows = _parse_dates('habits', rows)
+            conn.executemany(HABIT_UPSERT_SQL, rows)
+            conn.executemany(IMPORT_STATS_SQL, [(*row[:2], *progress_summary(progress_bits(row[6])))
+                                                 for row in rows])
+            habits += len(rows)
+
+        ids = {(user_id, name): habit_id
+               for habit_id, user_id, name in conn.execute('SELECT id, user_id, name FROM habits')}
+        insert = TRACKER_INSERT_SQL if indexes else TRACKER_UPSERT_SQL
+        for rows in read(directory, 'tracker', chunk_size):
+            rows = _parse_dates('tracker', rows)
+            rows = [(ids[user_id, name], name, event_date, completed)
+                    for user_id, name, event_date, completed in rows if (user_id, name) in ids]
+            conn.executemany(insert, rows)
+            check_ins += len(rows)
+
+        for name, sql in indexes:
+            if name == 'tracker_habit_day':
+                # without the unique index repeated days were appended, keep the latest one as check_habit would
+                conn.execute('''
+                    DELETE FROM tracker WHERE habit_id IS NOT NULL AND EXISTS (
+                        SELECT 1 FROM tracker AS newer
+                        WHERE newer.habit_id = tracker.habit_id
+                          AND newer.event_date = tracker.event_date
+                          AND newer.id > tracker.id)''')
+            conn.execute(sql)
+        rebuild_rollups(conn)
+    return habits, check_ins